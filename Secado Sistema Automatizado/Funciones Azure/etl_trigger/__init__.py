@@ -1,9 +1,11 @@
 import logging
 import json
 from datetime import datetime, timezone
+import multiprocessing
 import re
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import azure.functions as func
 import pandas as pd
@@ -20,7 +22,12 @@ from shared_code.lab_crosser import (  # noqa: E402
     get_lab_file_for_sensor,
     load_lab_control_file,
 )
-from shared_code.consolidar_sensores import to_wide  # noqa: E402
+from shared_code.consolidar_sensores import (  # noqa: E402
+    DOWNLOAD_WORKERS,
+    PARSE_WORKERS,
+    iter_prefetched,
+    to_wide,
+)
 from shared_code.calibracion import (  # noqa: E402
     aplicar_curvas_calibracion,
     find_calibration_files,
@@ -242,198 +249,226 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             total_records_processed = 0
             total_records_matched_lab = 0
             
-            for file_info in new_files:
-                file_id_to_process = file_info.get("id")
-                file_name_to_process = file_info.get("name")
-                file_modified_time = file_info.get("modifiedTime")
+            # Descargar los archivos en paralelo (I/O-bound); con PARSE_WORKERS > 1 el
+            # parseo se encadena en procesos separados ("spawn": sin fork con hilos activos).
+            # Los resultados se consumen en el orden de new_files
+            parse_pool = None
+            if PARSE_WORKERS > 1 and len(new_files) > 1:
+                parse_pool = ProcessPoolExecutor(
+                    max_workers=min(PARSE_WORKERS, len(new_files)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+            def _fetch(file_info):
+                name = file_info.get("name")
+                content = client.download_file(name or "", file_id=file_info.get("id"))
+                if parse_pool is None:
+                    return content
+                return parse_pool.submit(consolidate_sensor_data, content, name, planta)
+
+            # Ventana acotada de descargas en vuelo (en la primera ejecución new_files es todo el
+            # histórico): cada archivo se libera apenas se procesa
+            fetches = iter_prefetched(new_files, _fetch, workers=min(DOWNLOAD_WORKERS, len(new_files)))
+            try:
+                for file_info, fetch in fetches:
+                    file_id_to_process = file_info.get("id")
+                    file_name_to_process = file_info.get("name")
+                    file_modified_time = file_info.get("modifiedTime")
                 
-                logger.info("[ETL] Procesando archivo: %s (ID: %s, Modificado: %s)", 
-                           file_name_to_process, file_id_to_process, file_modified_time)
+                    logger.info("[ETL] Procesando archivo: %s (ID: %s, Modificado: %s)", 
+                               file_name_to_process, file_id_to_process, file_modified_time)
                 
-                try:
-                    # Descargar archivo
-                    content = client.download_file(file_name_to_process or "", file_id=file_id_to_process)
-                    
-                    # Procesar datos del sensor
-                    sensor_df = consolidate_sensor_data(content, file_name_to_process, planta)
-                    records_processed = int(len(sensor_df))
-
-                    # Intentar cruzar con laboratorio (formato largo)
-                    records_matched_lab = 0
-                    sensor_with_lab = sensor_df.copy()
                     try:
-                        lab_bytes = get_lab_file_for_sensor(client, planta=planta, year=year)
-                        lab_df = load_lab_control_file(lab_bytes, year=year, planta=planta)
-                        sensor_with_lab = cross_with_lab(sensor_df, lab_df, require_sensor_match=True)
-                        if "Variedad" in sensor_with_lab.columns:
-                            records_matched_lab = int(sensor_with_lab["Variedad"].notna().sum())
-                    except Exception as exc:
-                        logger.warning("[ETL] Archivo de control de laboratorio no encontrado o cruce falló: %s", exc)
+                        # Descargar archivo y procesar datos del sensor
+                        fetched = fetch.result()
+                        del fetch  # el Future retiene los bytes descargados: soltarlo al consumirlo
+                        if parse_pool is None:
+                            sensor_df = consolidate_sensor_data(fetched, file_name_to_process, planta)
+                        else:
+                            sensor_df = fetched.result()
+                        del fetched
+                        records_processed = int(len(sensor_df))
 
-                    # Convertir a formato ancho (pivot)
-                    logger.info("[ETL] Convirtiendo a formato ancho (pivot)...")
-                    final_df = sensor_with_lab
-                    try:
-                        if "año" not in sensor_with_lab.columns:
-                            sensor_with_lab["año"] = year
-                        if "planta" not in sensor_with_lab.columns:
-                            sensor_with_lab["planta"] = planta
-                        if "sensor_id" not in sensor_with_lab.columns or sensor_with_lab["sensor_id"].isna().all():
-                            sensor_id = extract_sensor_id_from_name(file_name_to_process or "")
-                            sensor_with_lab["sensor_id"] = sensor_id
-
-                        wide_df = to_wide(sensor_with_lab)
-                        logger.info(
-                            "[ETL] Formato ancho: %d filas, %d columnas",
-                            len(wide_df),
-                            len(wide_df.columns),
-                        )
+                        # Intentar cruzar con laboratorio (formato largo)
+                        records_matched_lab = 0
+                        sensor_with_lab = sensor_df.copy()
+                        try:
+                            lab_bytes = get_lab_file_for_sensor(client, planta=planta, year=year)
+                            lab_df = load_lab_control_file(lab_bytes, year=year, planta=planta)
+                            sensor_with_lab = cross_with_lab(sensor_df, lab_df, require_sensor_match=True)
+                            if "Variedad" in sensor_with_lab.columns:
+                                records_matched_lab = int(sensor_with_lab["Variedad"].notna().sum())
+                        except Exception as exc:
+                            logger.warning("[ETL] Archivo de control de laboratorio no encontrado o cruce falló: %s", exc)
 
-                        if "VOLT_HUM" not in wide_df.columns or "VOLT_TEM" not in wide_df.columns:
-                            logger.error("[ETL] Pivot no generó VOLT_HUM/VOLT_TEM, usando formato largo")
-                            final_df = sensor_with_lab
-                        else:
-                            final_df = wide_df
-                    except Exception as exc:
-                        logger.error("[ETL] Error en pivot, usando formato largo: %s", exc)
+                        # Convertir a formato ancho (pivot)
+                        logger.info("[ETL] Convirtiendo a formato ancho (pivot)...")
                         final_df = sensor_with_lab
-
-                    # Aplicar calibración si corresponde
-                    if "VOLT_HUM" in final_df.columns and "VOLT_TEM" in final_df.columns:
-                        logger.info("[ETL] Aplicando curvas de calibración...")
                         try:
-                            calibracion_files = find_calibration_files(
-                                client, planta, f"Secado_Arroz/{planta}/raw"
-                            )
-                            seleccion = (
-                                select_calibration_file(calibracion_files, year, planta)
-                                if calibracion_files
-                                else None
+                            if "año" not in sensor_with_lab.columns:
+                                sensor_with_lab["año"] = year
+                            if "planta" not in sensor_with_lab.columns:
+                                sensor_with_lab["planta"] = planta
+                            if "sensor_id" not in sensor_with_lab.columns or sensor_with_lab["sensor_id"].isna().all():
+                                sensor_id = extract_sensor_id_from_name(file_name_to_process or "")
+                                sensor_with_lab["sensor_id"] = sensor_id
+
+                            wide_df = to_wide(sensor_with_lab)
+                            logger.info(
+                                "[ETL] Formato ancho: %d filas, %d columnas",
+                                len(wide_df),
+                                len(wide_df.columns),
                             )
 
-                            if seleccion:
-                                año_calibracion, calibracion_path = seleccion
-                                logger.info(
-                                    "[ETL] Calibrando con curvas del año %s",
-                                    año_calibracion,
-                                )
-                                final_df = aplicar_curvas_calibracion(
-                                    final_df,
-                                    client,
-                                    planta,
-                                    calibracion_path,
-                                )
+                            if "VOLT_HUM" not in wide_df.columns or "VOLT_TEM" not in wide_df.columns:
+                                logger.error("[ETL] Pivot no generó VOLT_HUM/VOLT_TEM, usando formato largo")
+                                final_df = sensor_with_lab
                             else:
-                                logger.warning(
-                                    "[ETL] No se encontró archivo de calibración para %s (año %s)",
-                                    planta,
-                                    year,
-                                )
+                                final_df = wide_df
                         except Exception as exc:
-                            logger.error("[ETL] Error en calibración: %s", exc)
-                    else:
-                        logger.warning("[ETL] Sin VOLT_HUM/VOLT_TEM, omitiendo calibración")
+                            logger.error("[ETL] Error en pivot, usando formato largo: %s", exc)
+                            final_df = sensor_with_lab
+
+                        # Aplicar calibración si corresponde
+                        if "VOLT_HUM" in final_df.columns and "VOLT_TEM" in final_df.columns:
+                            logger.info("[ETL] Aplicando curvas de calibración...")
+                            try:
+                                calibracion_files = find_calibration_files(
+                                    client, planta, f"Secado_Arroz/{planta}/raw"
+                                )
+                                seleccion = (
+                                    select_calibration_file(calibracion_files, year, planta)
+                                    if calibracion_files
+                                    else None
+                                )
+
+                                if seleccion:
+                                    año_calibracion, calibracion_path = seleccion
+                                    logger.info(
+                                        "[ETL] Calibrando con curvas del año %s",
+                                        año_calibracion,
+                                    )
+                                    final_df = aplicar_curvas_calibracion(
+                                        final_df,
+                                        client,
+                                        planta,
+                                        calibracion_path,
+                                    )
+                                else:
+                                    logger.warning(
+                                        "[ETL] No se encontró archivo de calibración para %s (año %s)",
+                                        planta,
+                                        year,
+                                    )
+                            except Exception as exc:
+                                logger.error("[ETL] Error en calibración: %s", exc)
+                        else:
+                            logger.warning("[ETL] Sin VOLT_HUM/VOLT_TEM, omitiendo calibración")
 
-                    records_unmatched = int(records_processed - records_matched_lab)
+                        records_unmatched = int(records_processed - records_matched_lab)
                     
-                    # Generar nombre de salida y subir archivo procesado
-                    file_ts = datetime.now(timezone.utc)
-                    ts_str = file_ts.strftime("%Y%m%dT%H%M%SZ")
-                    base_name = os.path.splitext(os.path.basename(file_name_to_process))[0]
-                    processed_file = f"{base_name}_processed_{ts_str}.csv"
-                    processed_path = f"Secado_Arroz/{planta}/processed/{processed_file}"
+                        # Generar nombre de salida y subir archivo procesado
+                        file_ts = datetime.now(timezone.utc)
+                        ts_str = file_ts.strftime("%Y%m%dT%H%M%SZ")
+                        base_name = os.path.splitext(os.path.basename(file_name_to_process))[0]
+                        processed_file = f"{base_name}_processed_{ts_str}.csv"
+                        processed_path = f"Secado_Arroz/{planta}/processed/{processed_file}"
                     
-                    # Obtener folder_id de la carpeta de salida según la planta
-                    try:
-                        processed_folder_id = get_processed_folder_id(planta)
-                        logger.info(
-                            f"[ETL] Subiendo archivo procesado a carpeta de {planta} (folder: {processed_folder_id})"
-                        )
+                        # Obtener folder_id de la carpeta de salida según la planta
+                        try:
+                            processed_folder_id = get_processed_folder_id(planta)
+                            logger.info(
+                                f"[ETL] Subiendo archivo procesado a carpeta de {planta} (folder: {processed_folder_id})"
+                            )
                         
-                        # Subir archivo procesado (formato ancho si está disponible)
-                        if "VOLT_HUM" in final_df.columns:
-                            cols = [
-                                c
-                                for c in [
-                                    "planta",
-                                    "año",
-                                    "sensor_id",
-                                    "timestamp",
-                                    "VOLT_HUM",
-                                    "VOLT_TEM",
-                                    "TEMPERATURA",
-                                    "HUMEDAD",
-                                    "Variedad",
-                                    "ID_tachada",
-                                    "HumedadInicial",
-                                    "HumedadFinal",
-                                    "source_file",
-                                    "source_path",
-                                    "tirada_num",
-                                    "tirada_fecha",
-                                    "Date_raw",
-                                    "LOC_time_raw",
-                                    "TimeString",
+                            # Subir archivo procesado (formato ancho si está disponible)
+                            if "VOLT_HUM" in final_df.columns:
+                                cols = [
+                                    c
+                                    for c in [
+                                        "planta",
+                                        "año",
+                                        "sensor_id",
+                                        "timestamp",
+                                        "VOLT_HUM",
+                                        "VOLT_TEM",
+                                        "TEMPERATURA",
+                                        "HUMEDAD",
+                                        "Variedad",
+                                        "ID_tachada",
+                                        "HumedadInicial",
+                                        "HumedadFinal",
+                                        "source_file",
+                                        "source_path",
+                                        "tirada_num",
+                                        "tirada_fecha",
+                                        "Date_raw",
+                                        "LOC_time_raw",
+                                        "TimeString",
+                                    ]
+                                    if c in final_df.columns
                                 ]
-                                if c in final_df.columns
-                            ]
-                        else:
-                            cols = [
-                                c
-                                for c in [
-                                    "timestamp",
-                                    "variable",
-                                    "valor",
-                                    "planta",
-                                    "sensor_id",
-                                    "source_file",
-                                    "Variedad",
-                                    "ID_tachada",
-                                    "HumedadInicial",
-                                    "HumedadFinal",
+                            else:
+                                cols = [
+                                    c
+                                    for c in [
+                                        "timestamp",
+                                        "variable",
+                                        "valor",
+                                        "planta",
+                                        "sensor_id",
+                                        "source_file",
+                                        "Variedad",
+                                        "ID_tachada",
+                                        "HumedadInicial",
+                                        "HumedadFinal",
+                                    ]
+                                    if c in final_df.columns
                                 ]
-                                if c in final_df.columns
-                            ]
 
-                        out_df = final_df[cols].copy()
-                        csv_bytes = out_df.to_csv(index=False).encode("utf-8")
+                            out_df = final_df[cols].copy()
+                            csv_bytes = out_df.to_csv(index=False).encode("utf-8")
                         
-                        client.upload_file_to_folder(
-                            processed_folder_id, processed_file, csv_bytes, mime_type="text/csv"
-                        )
-                        logger.info(f"[ETL] ✓ Archivo procesado subido: {processed_file}")
-                    except ValueError as e:
-                        logger.error(f"[ETL] No se pudo subir archivo: {str(e)}")
-                        raise
+                            client.upload_file_to_folder(
+                                processed_folder_id, processed_file, csv_bytes, mime_type="text/csv"
+                            )
+                            logger.info(f"[ETL] ✓ Archivo procesado subido: {processed_file}")
+                        except ValueError as e:
+                            logger.error(f"[ETL] No se pudo subir archivo: {str(e)}")
+                            raise
                     
-                    logger.info("[ETL] Archivo procesado exitosamente: %s (%d registros)", 
-                               file_name_to_process, records_processed)
+                        logger.info("[ETL] Archivo procesado exitosamente: %s (%d registros)", 
+                                   file_name_to_process, records_processed)
                     
-                    processed_files.append({
-                        "fileId": file_id_to_process,
-                        "fileName": file_name_to_process,
-                        "processedAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-                        "status": "success",
-                        "records_processed": records_processed,
-                        "records_matched_lab": records_matched_lab,
-                        "records_unmatched": records_unmatched,
-                        "processed_file": processed_file,
-                        "processed_path": processed_path,
-                    })
+                        processed_files.append({
+                            "fileId": file_id_to_process,
+                            "fileName": file_name_to_process,
+                            "processedAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                            "status": "success",
+                            "records_processed": records_processed,
+                            "records_matched_lab": records_matched_lab,
+                            "records_unmatched": records_unmatched,
+                            "processed_file": processed_file,
+                            "processed_path": processed_path,
+                        })
                     
-                    total_records_processed += records_processed
-                    total_records_matched_lab += records_matched_lab
+                        total_records_processed += records_processed
+                        total_records_matched_lab += records_matched_lab
                     
-                except Exception as exc:
-                    logger.exception("[ETL] Error procesando archivo %s: %s", file_name_to_process, exc)
-                    processed_files.append({
-                        "fileId": file_id_to_process,
-                        "fileName": file_name_to_process,
-                        "processedAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-                        "status": "error",
-                        "error": str(exc)
-                    })
-                    # Continuar con el siguiente archivo
+                    except Exception as exc:
+                        logger.exception("[ETL] Error procesando archivo %s: %s", file_name_to_process, exc)
+                        processed_files.append({
+                            "fileId": file_id_to_process,
+                            "fileName": file_name_to_process,
+                            "processedAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                            "status": "error",
+                            "error": str(exc)
+                        })
+                        # Continuar con el siguiente archivo
+            finally:
+                fetches.close()
+                if parse_pool is not None:
+                    parse_pool.shutdown(wait=True, cancel_futures=True)
             
             # 6. Actualizar timestamp después de procesar
             if processed_files:
@@ -8,9 +8,8 @@ usando curvas de calibración por planta, año y variedad.
 import io
 import logging
 import re
-import tempfile
 import unicodedata
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, Tuple, Any
 
 import numpy as np
@@ -18,6 +17,18 @@ import pandas as pd
 
 from shared_code.time_utils import normalize_timestamp
 
+try:
+    from numba import njit
+except ImportError:  # numba es opcional: sin él se usan las fórmulas numpy
+    njit = None
+
+try:
+    import python_calamine  # noqa: F401
+    # engine="calamine" existe desde pandas 2.2; en versiones anteriores sigue openpyxl
+    _EXCEL_ENGINE = "calamine" if tuple(map(int, pd.__version__.split(".")[:2])) >= (2, 2) else None
+except ImportError:  # sin calamine, pandas usa openpyxl
+    _EXCEL_ENGINE = None
+
 logger = logging.getLogger(__name__)
 
 # Equivalencias de variedades (robustez)
@@ -34,6 +45,59 @@ ALIAS_EQUIV = {
 }
 
 
+if njit is not None:
+
+    @njit(cache=True)
+    def _temperatura_kernel(vt, AT, BT, cfix, cvar, out):
+        for i in range(vt.size):
+            v = vt[i]
+            if v == 0 or np.isnan(v):
+                out[i] = np.nan
+            else:
+                out[i] = v * AT + BT + cfix[i] - cvar[i]
+
+    @njit(cache=True)
+    def _humedad_kernel(vh, AH, BH, CH, cfix, cvar, out):
+        for i in range(vh.size):
+            v = vh[i]
+            if v == 0 or np.isnan(v):
+                out[i] = np.nan
+            else:
+                out[i] = v * v * AH + v * BH + CH + cfix[i] - cvar[i]
+
+
+def _cfix_table(cfix: Dict[int, float]) -> np.ndarray:
+    """
+    Convierte {secadora: C_fix} en una tabla indexable por número de secadora.
+    
+    La posición 0 queda en NaN y se usa para secadoras desconocidas.
+    """
+    table = np.full(7, np.nan)
+    for k, v in cfix.items():
+        table[k] = v
+    return table
+
+
+def _formula_temperatura(vt, AT, BT, cfix, cvar) -> np.ndarray:
+    """TEMPERATURA = VT * AT + BT + C_fix - C_var (NaN donde VT es 0 o NaN)."""
+    if njit is not None:
+        out = np.empty_like(vt)
+        _temperatura_kernel(vt, AT, BT, cfix, cvar, out)
+        return out
+    out = vt * AT + BT + cfix - cvar
+    return np.where((vt == 0) | np.isnan(vt), np.nan, out)
+
+
+def _formula_humedad(vh, AH, BH, CH, cfix, cvar) -> np.ndarray:
+    """HUMEDAD = VH^2 * AH + VH * BH + CH + C_fix - C_var (NaN donde VH es 0 o NaN)."""
+    if njit is not None:
+        out = np.empty_like(vh)
+        _humedad_kernel(vh, AH, BH, CH, cfix, cvar, out)
+        return out
+    out = vh * vh * AH + vh * BH + CH + cfix - cvar
+    return np.where((vh == 0) | np.isnan(vh), np.nan, out)
+
+
 def find_calibration_files(gdrive, planta: str, raw_path: str) -> Dict[int, str]:
     """
     Busca archivos de calibración recursivamente desde raw_path.
@@ -221,6 +285,12 @@ def norm_str(s: str) -> str:
     return s.lower().strip().replace(" ", "")
 
 
+# Equivalencias ya normalizadas (se calculan una sola vez al importar)
+ALIAS_EQUIV_NORM = {
+    norm_str(k): frozenset(norm_str(c) for c in v) for k, v in ALIAS_EQUIV.items()
+}
+
+
 def resolve_variedad_key(key_norm: str, name_map: Dict[str, str]) -> Optional[str]:
     """
     Busca variedad en name_map usando equivalencias.
@@ -232,19 +302,68 @@ def resolve_variedad_key(key_norm: str, name_map: Dict[str, str]) -> Optional[st
     Returns:
         Nombre de hoja encontrado o None
     """
-    candidatos = ALIAS_EQUIV.get(key_norm, {key_norm})
-    for cand in candidatos:
-        cand_norm = norm_str(cand)
-        if cand_norm in name_map:
-            return cand_norm
-        # También buscar directo en keys normalizadas
-        for k, v in name_map.items():
-            if cand_norm == k:
-                return k
+    for cand in ALIAS_EQUIV_NORM.get(key_norm, (key_norm,)):
+        if cand in name_map:
+            return cand
     return None
 
 
-def parse_temperatura_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, Dict[int, float], Dict[int, pd.DataFrame]]:
+# Tabla de correcciones variables de un sensor: (fechas en ns como int64 ordenadas, cvar)
+CvarTable = Tuple[np.ndarray, np.ndarray]
+
+
+def _empty_cvar_tbl() -> Dict[int, CvarTable]:
+    """Tablas de C_var vacías para los 6 sensores."""
+    return {i: (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)) for i in range(1, 7)}
+
+
+def _build_cvar_tbl(data: pd.DataFrame) -> Dict[int, CvarTable]:
+    """
+    Construye las tablas de corrección variable por sensor.
+    
+    Pasa la tabla [fecha, s1..s6] a formato largo y hace un único forward-fill
+    agrupado por sensor (los ceros se tratan como "sin corrección nueva").
+    
+    Returns:
+        {sensor: (fechas_ns, cvar)} como arrays numpy ordenados por fecha
+    """
+    long = data.melt(id_vars="fecha", var_name="sensor", value_name="craw")
+    long["craw"] = pd.to_numeric(long["craw"], errors="coerce").replace(0, np.nan)
+    long = long.sort_values(["sensor", "fecha"], kind="stable")
+    long["cvar"] = long.groupby("sensor", sort=False)["craw"].ffill().fillna(0.0)
+    
+    fechas = long["fecha"].to_numpy("datetime64[ns]").view(np.int64)
+    cvar = long["cvar"].to_numpy(np.float64)
+    sensores = long["sensor"].to_numpy()
+    
+    cvar_tbl = _empty_cvar_tbl()
+    for i in range(1, 7):
+        sel = sensores == f"s{i}"
+        cvar_tbl[i] = (fechas[sel], cvar[sel])
+    return cvar_tbl
+
+
+def _cvar_block(df_raw: pd.DataFrame, r: int, c: int, cols) -> pd.DataFrame:
+    """
+    Extrae la tabla de C_var (desde la fila r+2) con columnas tipadas.
+    
+    Convierte cada columna por separado (fecha -> datetime64, sensores -> float64)
+    en lugar de copiar el bloque object del Excel crudo.
+    
+    Returns:
+        DataFrame [fecha, s1..s6] sin filas vacías ni fechas inválidas
+    """
+    block = df_raw.iloc[(r + 2):, [c] + cols]
+    block = block[block.notna().any(axis=1)]
+    data = pd.DataFrame(
+        {"fecha": pd.to_datetime(block.iloc[:, 0], errors="coerce", cache=True)}
+    )
+    for i in range(1, 7):
+        data[f"s{i}"] = pd.to_numeric(block.iloc[:, i], errors="coerce")
+    return data[data["fecha"].notna()]
+
+
+def parse_temperatura_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, Dict[int, float], Dict[int, CvarTable]]:
     """
     Parsea hoja TEMPERATURA del Excel de curvas.
     
@@ -258,7 +377,7 @@ def parse_temperatura_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, Dict[in
         (AT, BT, cfix, cvar_tbl)
         - AT, BT: constantes globales
         - cfix: {sensor: valor_fijo} para sensores 1-6
-        - cvar_tbl: {sensor: DataFrame[fecha, cvar]} con correcciones temporales
+        - cvar_tbl: {sensor: (fechas_ns, cvar)} con correcciones temporales
     """
     # Leer DataFrame con header=None para preservar estructura exacta
     if df_raw.empty:
@@ -308,46 +427,24 @@ def parse_temperatura_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, Dict[in
     # C_var: tabla desde fila (r+2) en adelante
     if r + 2 >= len(df_raw):
         # No hay datos de C_var, crear tablas vacías
-        cvar_tbl = {i: pd.DataFrame(columns=["fecha", "cvar"]) for i in range(1, 7)}
+        cvar_tbl = _empty_cvar_tbl()
         return AT, BT, cfix, cvar_tbl
     
-    data = df_raw.iloc[(r + 2):, [c] + cols].copy()
-    data.columns = ["fecha"] + [f"s{i}" for i in range(1, 7)]
-    
-    # Eliminar filas completamente vacías
-    data = data.dropna(how="all")
-    
-    # Convertir fecha a datetime
-    data["fecha"] = pd.to_datetime(data["fecha"], errors="coerce")
-    data = data.dropna(subset=["fecha"])
+    # Tabla tipada sin filas vacías ni fechas inválidas
+    data = _cvar_block(df_raw, r, c, cols)
     
     if data.empty:
         # No hay datos válidos, crear tablas vacías
-        cvar_tbl = {i: pd.DataFrame(columns=["fecha", "cvar"]) for i in range(1, 7)}
+        cvar_tbl = _empty_cvar_tbl()
         return AT, BT, cfix, cvar_tbl
     
     # Por sensor, crear tabla [fecha, cvar] con forward-fill
-    cvar_tbl = {}
-    for i in range(1, 7):
-        col_name = f"s{i}"
-        if col_name not in data.columns:
-            cvar_tbl[i] = pd.DataFrame(columns=["fecha", "cvar"])
-            continue
-        
-        tmp = data[["fecha", col_name]].copy().rename(columns={col_name: "craw"})
-        tmp["craw"] = pd.to_numeric(tmp["craw"], errors="coerce")
-        tmp["craw"] = tmp["craw"].replace(0, np.nan)
-        tmp = tmp.sort_values("fecha").reset_index(drop=True)
-        
-        # Forward-fill de correcciones
-        tmp["cvar"] = tmp["craw"].ffill().fillna(0.0)
-        
-        cvar_tbl[i] = tmp[["fecha", "cvar"]].copy()
+    cvar_tbl = _build_cvar_tbl(data)
     
     return AT, BT, cfix, cvar_tbl
 
 
-def parse_humedad_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, float, Dict[int, float], Dict[int, pd.DataFrame]]:
+def parse_humedad_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, float, Dict[int, float], Dict[int, CvarTable]]:
     """
     Parsea hoja de HUMEDAD (variedad específica) del Excel de curvas.
     
@@ -404,33 +501,16 @@ def parse_humedad_sheet(df_raw: pd.DataFrame) -> Tuple[float, float, float, Dict
     
     # C_var: tabla desde fila (r+2) en adelante
     if r + 2 >= len(df_raw):
-        cvar_tbl = {i: pd.DataFrame(columns=["fecha", "cvar"]) for i in range(1, 7)}
+        cvar_tbl = _empty_cvar_tbl()
         return AH, BH, CH, cfix, cvar_tbl
     
-    data = df_raw.iloc[(r + 2):, [c] + cols].copy()
-    data.columns = ["fecha"] + [f"s{i}" for i in range(1, 7)]
-    data = data.dropna(how="all")
-    data["fecha"] = pd.to_datetime(data["fecha"], errors="coerce")
-    data = data.dropna(subset=["fecha"])
+    data = _cvar_block(df_raw, r, c, cols)
     
     if data.empty:
-        cvar_tbl = {i: pd.DataFrame(columns=["fecha", "cvar"]) for i in range(1, 7)}
+        cvar_tbl = _empty_cvar_tbl()
         return AH, BH, CH, cfix, cvar_tbl
     
-    cvar_tbl = {}
-    for i in range(1, 7):
-        col_name = f"s{i}"
-        if col_name not in data.columns:
-            cvar_tbl[i] = pd.DataFrame(columns=["fecha", "cvar"])
-            continue
-        
-        tmp = data[["fecha", col_name]].copy().rename(columns={col_name: "craw"})
-        tmp["craw"] = pd.to_numeric(tmp["craw"], errors="coerce")
-        tmp["craw"] = tmp["craw"].replace(0, np.nan)
-        tmp = tmp.sort_values("fecha").reset_index(drop=True)
-        tmp["cvar"] = tmp["craw"].ffill().fillna(0.0)
-        
-        cvar_tbl[i] = tmp[["fecha", "cvar"]].copy()
+    cvar_tbl = _build_cvar_tbl(data)
     
     return AH, BH, CH, cfix, cvar_tbl
 
@@ -439,51 +519,90 @@ def merge_asof_cvar(
     df: pd.DataFrame,
     key_fecha: str,
     key_secadora: str,
-    cvar_tbl: Dict[int, pd.DataFrame],
-    out_col: str
+    cvar_tbl: Dict[int, CvarTable],
+    out_col: str,
+    inplace: bool = False,
 ) -> pd.DataFrame:
     """
-    Hace merge temporal de correcciones variables por sensor usando merge_asof.
+    Hace merge temporal "hacia atrás" de correcciones variables por sensor.
+    
+    Equivale a pd.merge_asof(direction="backward") pero con np.searchsorted
+    directamente sobre los arrays de cada tabla.
     
     Args:
         df: DataFrame con columnas key_fecha (timestamp) y key_secadora (1-6)
-        cvar_tbl: {sensor: DataFrame[fecha, cvar]}
+        cvar_tbl: {sensor: (fechas_ns, cvar)}
         out_col: nombre de columna de salida para cvar
+        inplace: si True agrega out_col sobre df sin copiarlo (para DataFrames auxiliares)
     
     Returns:
         DataFrame con columna out_col agregada
     """
-    df = df.copy()
-    df[out_col] = 0.0
+    if not inplace:
+        df = df.copy()
+    
+    out = np.zeros(len(df), dtype=np.float64)
+    # NaT se ve como el mínimo int64: queda antes de cualquier fecha y recibe 0.0
+    fechas = pd.to_datetime(df[key_fecha], errors="coerce").to_numpy("datetime64[ns]").view(np.int64)
+    secadora = df[key_secadora]
     
     for s in range(1, 7):
-        mask = df[key_secadora] == s
-        if not mask.any():
+        if s not in cvar_tbl:
             continue
-        
-        if s not in cvar_tbl or cvar_tbl[s].empty:
+        fechas_s, cvar_s = cvar_tbl[s]
+        if len(fechas_s) == 0:
             continue
         
-        base = df.loc[mask, [key_fecha]].copy().sort_values(key_fecha)
-        cv = cvar_tbl[s].sort_values("fecha")
-        
-        if cv.empty:
+        mask = (secadora == s).to_numpy()
+        if not mask.any():
             continue
         
-        merged = pd.merge_asof(
-            base,
-            cv.rename(columns={"fecha": key_fecha}),
-            on=key_fecha,
-            direction="backward"
-        )
-        merged["cvar"] = merged["cvar"].fillna(0.0)
-        
-        idx_sorted = df.loc[mask].sort_values(key_fecha).index
-        df.loc[idx_sorted, out_col] = merged["cvar"].values
+        pos = np.searchsorted(fechas_s, fechas[mask], side="right") - 1
+        out[mask] = np.where(pos >= 0, cvar_s[np.clip(pos, 0, None)], 0.0)
     
+    df[out_col] = out
     return df
 
 
+def _leer_hoja_humedad(excel_bytes: bytes, sheet_name: str):
+    """Lee y parsea una hoja de variedad con su propio lector (seguro entre hilos)."""
+    raw = pd.read_excel(io.BytesIO(excel_bytes), sheet_name=sheet_name, header=None, engine=_EXCEL_ENGINE)
+    AH, BH, CH, cfix_H, cvar_H = parse_humedad_sheet(raw)
+    return AH, BH, CH, _cfix_table(cfix_H), cvar_H
+
+
+def _leer_hojas_humedad(xl: pd.ExcelFile, excel_bytes: bytes, hojas) -> Dict[str, Any]:
+    """
+    Parsea las hojas de variedad necesarias.
+    
+    Con calamine (libera el GIL al decodificar) las hojas se leen en paralelo;
+    con openpyxl se leen en serie sobre el ExcelFile ya abierto.
+    
+    Returns:
+        Dict hoja -> (AH, BH, CH, cfix_tbl, cvar_tbl) o la excepción producida
+    """
+    resultados: Dict[str, Any] = {}
+    hojas = list(hojas)
+    if _EXCEL_ENGINE == "calamine" and len(hojas) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(hojas))) as ex:
+            futures = {ex.submit(_leer_hoja_humedad, excel_bytes, h): h for h in hojas}
+            for fut, h in futures.items():
+                try:
+                    resultados[h] = fut.result()
+                except Exception as e:
+                    resultados[h] = e
+        return resultados
+    
+    for h in hojas:
+        try:
+            raw = pd.read_excel(xl, sheet_name=h, header=None)
+            AH, BH, CH, cfix_H, cvar_H = parse_humedad_sheet(raw)
+            resultados[h] = (AH, BH, CH, _cfix_table(cfix_H), cvar_H)
+        except Exception as e:
+            resultados[h] = e
+    return resultados
+
+
 def aplicar_curvas_calibracion(
     wide: pd.DataFrame,
     gdrive,
@@ -503,18 +622,18 @@ def aplicar_curvas_calibracion(
     Returns:
         DataFrame con columnas TEMPERATURA y HUMEDAD agregadas
     """
-    # VALIDACIÓN INICIAL (CRÍTICA) - usar print para visibilidad
-    print(f"      📊 PRE-CALIBRACIÓN {planta}:")
-    print(f"         Input shape: {wide.shape}")
+    # VALIDACIÓN INICIAL (CRÍTICA)
+    logger.info("[CALIB] Pre-calibración %s: input shape %s", planta, wide.shape)
     
+    # Única copia defensiva: a partir de aquí se trabaja sobre wide sin afectar al llamador
+    wide = wide.copy()
     wide = normalize_timestamp(wide, "timestamp", assume_local=True)
     
     # Verificar columnas críticas
     required = ["VOLT_HUM", "VOLT_TEM", "Variedad", "sensor_id", "timestamp"]
     missing = [c for c in required if c not in wide.columns]
     if missing:
-        print(f"         ❌ Faltan columnas para calibración: {missing}")
-        wide = wide.copy()
+        logger.warning("[CALIB] Faltan columnas para calibración: %s", missing)
         wide["TEMPERATURA"] = np.nan
         wide["HUMEDAD"] = np.nan
         return wide
@@ -525,20 +644,23 @@ def aplicar_curvas_calibracion(
     vh_nonzero = (wide["VOLT_HUM"] != 0).sum()
     vt_nonzero = (wide["VOLT_TEM"] != 0).sum()
     
-    print(f"         VOLT_HUM: {vh_valid} válidos, {vh_nonzero} no-cero")
-    print(f"         VOLT_TEM: {vt_valid} válidos, {vt_nonzero} no-cero")
+    logger.info(
+        "[CALIB] VOLT_HUM: %d válidos, %d no-cero | VOLT_TEM: %d válidos, %d no-cero",
+        vh_valid, vh_nonzero, vt_valid, vt_nonzero,
+    )
     
-    if vh_nonzero > 0 or vt_nonzero > 0:
-        if "VOLT_HUM" in wide.columns and vh_nonzero > 0:
-            print(f"         Rango VOLT_HUM: min={wide['VOLT_HUM'].min():.4f}, max={wide['VOLT_HUM'].max():.4f}")
-        if "VOLT_TEM" in wide.columns and vt_nonzero > 0:
-            print(f"         Rango VOLT_TEM: min={wide['VOLT_TEM'].min():.4f}, max={wide['VOLT_TEM'].max():.4f}")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        if vh_nonzero > 0:
+            logger.debug("[CALIB] Rango VOLT_HUM: min=%.4f, max=%.4f", wide["VOLT_HUM"].min(), wide["VOLT_HUM"].max())
+        if vt_nonzero > 0:
+            logger.debug("[CALIB] Rango VOLT_TEM: min=%.4f, max=%.4f", wide["VOLT_TEM"].min(), wide["VOLT_TEM"].max())
     
     if vh_nonzero == 0 and vt_nonzero == 0:
-        print(f"         ❌ TODOS los voltajes son 0 o NaN - NO SE PUEDE CALIBRAR")
-        print(f"            Muestra VOLT_HUM: {wide['VOLT_HUM'].head(10).tolist()}")
-        print(f"            Muestra VOLT_TEM: {wide['VOLT_TEM'].head(10).tolist()}")
-        wide = wide.copy()
+        logger.warning("[CALIB] Todos los voltajes son 0 o NaN - no se puede calibrar")
+        if debug:
+            logger.debug("[CALIB] Muestra VOLT_HUM: %s", wide["VOLT_HUM"].head(10).tolist())
+            logger.debug("[CALIB] Muestra VOLT_TEM: %s", wide["VOLT_TEM"].head(10).tolist())
         wide["TEMPERATURA"] = np.nan
         wide["HUMEDAD"] = np.nan
         return wide
@@ -554,178 +676,165 @@ def aplicar_curvas_calibracion(
             variedad_col = variedad_col.iloc[:, 0]
         
         var_valid = variedad_col.notna().sum()
-        print(f"         Variedad: {var_valid}/{len(wide)} válidas")
-        variedades_unicas = variedad_col.dropna().unique()[:10]
-        print(f"         Variedades únicas: {list(variedades_unicas)}")
+        logger.info("[CALIB] Variedad: %d/%d válidas", var_valid, len(wide))
+        if debug:
+            logger.debug("[CALIB] Variedades únicas: %s", list(variedad_col.dropna().unique()[:10]))
     else:
         var_valid = 0
-        variedades_unicas = []
-        print(f"         Variedad: Columna 'Variedad' no encontrada en wide")
+        logger.info("[CALIB] Columna 'Variedad' no encontrada en wide")
     
     if var_valid == 0:
-        print(f"         ⚠️ NINGUNA variedad válida - solo se calculará TEMPERATURA")
+        logger.warning("[CALIB] Ninguna variedad válida - solo se calculará TEMPERATURA")
     
-    # Descargar archivo de curvas a archivo temporal
-    tmp_path = None
+    # Descargar archivo de curvas y abrirlo en memoria (sin archivo temporal)
     try:
-        # Descargar bytes desde Google Drive
         excel_bytes = gdrive.download_file(calibracion_file_path)
-        
-        # Crear archivo temporal
-        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
-            tmp.write(excel_bytes)
-            tmp_path = Path(tmp.name)
+        xl = pd.ExcelFile(io.BytesIO(excel_bytes), engine=_EXCEL_ENGINE)
     except Exception as e:
         logger.warning(f"No se pudo descargar archivo de calibración {calibracion_file_path}: {e}")
-        wide = wide.copy()
         wide["TEMPERATURA"] = np.nan
         wide["HUMEDAD"] = np.nan
         return wide
     
+    # Extraer secadora de sensor_id
+    wide["secadora"] = wide["sensor_id"].apply(guess_secadora)
+    # Índice 1-6 para las tablas de C_fix (0 = secadora desconocida)
+    sec = pd.to_numeric(wide["secadora"], errors="coerce").fillna(0).to_numpy(np.int64)
+    sec_idx = np.where((sec >= 1) & (sec <= 6), sec, 0)
+    
+    # Timestamp con hora (sin normalize: respeta hora, como en el notebook)
+    # normalize_timestamp ya dejó la columna como datetime64; solo se re-parsea si falló
+    if pd.api.types.is_datetime64_dtype(wide["timestamp"]):
+        fecha_ref = wide["timestamp"]
+    else:
+        fecha_ref = pd.to_datetime(wide["timestamp"], errors="coerce", cache=True)
+    
+    # Voltajes (arrays numpy: las fórmulas finales se evalúan sin Series intermedias)
+    vh_arr = pd.to_numeric(wide["VOLT_HUM"], errors="coerce").to_numpy(np.float64, copy=False)
+    vt_arr = pd.to_numeric(wide["VOLT_TEM"], errors="coerce").to_numpy(np.float64, copy=False)
+    
+    # --- TEMPERATURA (global) ---
     try:
-        wide = wide.copy()
+        df_temp_raw = pd.read_excel(xl, sheet_name="TEMPERATURA", header=None)
+        AT, BT, cfix_T, cvar_T = parse_temperatura_sheet(df_temp_raw)
         
-        # Extraer secadora de sensor_id
-        wide["secadora"] = wide["sensor_id"].apply(guess_secadora)
+        # Preparar DataFrame auxiliar para merge_asof
+        aux_T = pd.DataFrame({
+            "fecha_ref": fecha_ref,
+            "secadora": wide["secadora"]
+        })
+        aux_T = merge_asof_cvar(aux_T, "fecha_ref", "secadora", cvar_T, "cvar_T", inplace=True)
         
-        # Timestamp con hora (sin normalize: respeta hora, como en el notebook)
-        fecha_ref = pd.to_datetime(wide["timestamp"], errors="coerce")  # sin normalize: respeta hora
+        # Mapear C_fix por secadora
+        cfix_T_arr = _cfix_table(cfix_T)[sec_idx]
+        cvar_T_arr = aux_T["cvar_T"].to_numpy(np.float64)
         
-        # Voltajes
-        vh = pd.to_numeric(wide["VOLT_HUM"], errors="coerce")
-        vt = pd.to_numeric(wide["VOLT_TEM"], errors="coerce")
-        mask_vh_zero = (vh.fillna(0) == 0)
-        mask_vt_zero = (vt.fillna(0) == 0)
+        # Fórmula: TEMPERATURA = VT * AT + BT + C_fix_T[sensor] - C_var_T[sensor, timestamp]
+        TEMPERATURA = _formula_temperatura(vt_arr, AT, BT, cfix_T_arr, cvar_T_arr)
+    except Exception as e:
+        logger.warning(f"Error procesando curvas de TEMPERATURA: {e}")
+        TEMPERATURA = np.full(len(wide), np.nan)
+    
+    # --- HUMEDAD (por variedad) ---
+    try:
+        hojas_hum = [s for s in xl.sheet_names if norm_str(s) != "temperatura"]
+        name_map = {norm_str(s): s for s in hojas_hum}
         
-        # --- TEMPERATURA (global) ---
-        try:
-            df_temp_raw = pd.read_excel(tmp_path, sheet_name="TEMPERATURA", header=None)
-            AT, BT, cfix_T, cvar_T = parse_temperatura_sheet(df_temp_raw)
-            
-            # Preparar DataFrame auxiliar para merge_asof
-            aux_T = pd.DataFrame({
-                "fecha_ref": fecha_ref,
-                "secadora": wide["secadora"]
-            })
-            aux_T = merge_asof_cvar(aux_T, "fecha_ref", "secadora", cvar_T, "cvar_T")
-            
-            # Mapear C_fix por secadora
-            cfix_T_series = aux_T["secadora"].map(cfix_T).astype(float)
-            
-            # Fórmula: TEMPERATURA = VT * AT + BT + C_fix_T[sensor] - C_var_T[sensor, timestamp]
-            TEMPERATURA = vt * AT + BT + cfix_T_series - aux_T["cvar_T"]
-            TEMPERATURA = TEMPERATURA.mask(mask_vt_zero | vt.isna(), np.nan)
-        except Exception as e:
-            logger.warning(f"Error procesando curvas de TEMPERATURA: {e}")
-            TEMPERATURA = pd.Series(np.nan, index=wide.index, dtype=float)
+        # DEBUG: Mostrar todas las hojas disponibles (SOLUCIÓN 2)
+        if debug:
+            logger.debug(
+                "[CALIB] Hojas disponibles en archivo de curvas: %s",
+                [f"{s} -> {norm_str(s)}" for s in hojas_hum],
+            )
         
-        # --- HUMEDAD (por variedad) ---
-        try:
-            xl = pd.ExcelFile(tmp_path)
-            hojas_hum = [s for s in xl.sheet_names if norm_str(s) != "temperatura"]
-            name_map = {norm_str(s): s for s in hojas_hum}
+        HUMEDAD = np.full(len(wide), np.nan)
+        # IMPORTANTE: Asegurarse de que 'Variedad' sea una Serie, no un DataFrame
+        variedad_col = wide["Variedad"]
+        if isinstance(variedad_col, pd.DataFrame):
+            variedad_col = variedad_col.iloc[:, 0]
+        variedad_norm = variedad_col.astype(str).map(norm_str)
+        
+        faltantes = []
+        
+        # Variedad por defecto para fallback (SOLUCIÓN 3)
+        # Intentar usar variedades comunes como fallback
+        default_varieties = ["guri", "gurí", "elpaso", "el paso", "merin"]
+        default_variety = None
+        for dv in default_varieties:
+            dv_norm = norm_str(dv)
+            if dv_norm in name_map:
+                default_variety = dv_norm
+                break
+        
+        # 1) Resolver la hoja de curvas de cada variedad presente
+        lookups = {}
+        for key_norm in variedad_norm.dropna().unique():
+            key_lookup = resolve_variedad_key(key_norm, name_map)
             
-            # DEBUG: Mostrar todas las hojas disponibles (SOLUCIÓN 2)
-            print(f"         📋 Hojas disponibles en archivo de curvas:")
-            for hoja_original in xl.sheet_names:
-                hoja_norm = norm_str(hoja_original)
-                if hoja_norm != "temperatura":
-                    print(f"            - '{hoja_original}' -> normalizado: '{hoja_norm}'")
+            if key_lookup is None:
+                # FALLBACK: Usar curvas de variedad por defecto (SOLUCIÓN 3)
+                if default_variety and default_variety in name_map:
+                    logger.warning(
+                        f"[{planta}] Variedad '{key_norm}' sin curvas específicas. "
+                        f"Usando curvas de '{default_variety}' como fallback."
+                    )
+                    key_lookup = default_variety
+                else:
+                    faltantes.append(key_norm)
+                    logger.warning(
+                        f"[{planta}] Variedad '{key_norm}' sin curvas y sin fallback disponible. "
+                        f"Se omitirá el cálculo de humedad para esta variedad."
+                    )
+                    continue
+            lookups[key_norm] = key_lookup
+        
+        # 2) Parsear una sola vez cada hoja necesaria (en paralelo si se puede)
+        cache_params = _leer_hojas_humedad(
+            xl, excel_bytes, {name_map[k] for k in lookups.values()}
+        )
+        for hoja, res in cache_params.items():
+            if isinstance(res, Exception):
+                logger.warning(f"Error parseando hoja {hoja}: {res}")
+        
+        # 3) Aplicar la fórmula por variedad
+        for key_norm, key_lookup in lookups.items():
+            params = cache_params[name_map[key_lookup]]
+            if isinstance(params, Exception):
+                faltantes.append(key_norm)
+                continue
             
-            HUMEDAD = pd.Series(np.nan, index=wide.index, dtype=float)
-            # IMPORTANTE: Asegurarse de que 'Variedad' sea una Serie, no un DataFrame
-            variedad_col = wide["Variedad"]
-            if isinstance(variedad_col, pd.DataFrame):
-                variedad_col = variedad_col.iloc[:, 0]
-            variedad_norm = variedad_col.astype(str).map(norm_str)
+            AH, BH, CH, cfix_H_tbl, cvar_H = params
+            mask = (variedad_norm == key_norm)
             
-            faltantes = []
-            cache_params = {}
+            if not mask.any():
+                continue
             
-            # Variedad por defecto para fallback (SOLUCIÓN 3)
-            # Intentar usar variedades comunes como fallback
-            default_varieties = ["guri", "gurí", "elpaso", "el paso", "merin"]
-            default_variety = None
-            for dv in default_varieties:
-                dv_norm = norm_str(dv)
-                if dv_norm in name_map:
-                    default_variety = dv_norm
-                    break
+            # Preparar DataFrame auxiliar para merge_asof
+            aux_H = pd.DataFrame({
+                "fecha_ref": fecha_ref[mask],
+                "secadora": wide.loc[mask, "secadora"]
+            })
+            aux_H = merge_asof_cvar(aux_H, "fecha_ref", "secadora", cvar_H, "cvar_H", inplace=True)
             
-            for key_norm in variedad_norm.dropna().unique():
-                key_lookup = resolve_variedad_key(key_norm, name_map)
-                
-                if key_lookup is None:
-                    # FALLBACK: Usar curvas de variedad por defecto (SOLUCIÓN 3)
-                    if default_variety and default_variety in name_map:
-                        logger.warning(
-                            f"[{planta}] Variedad '{key_norm}' sin curvas específicas. "
-                            f"Usando curvas de '{default_variety}' como fallback."
-                        )
-                        key_lookup = default_variety
-                    else:
-                        faltantes.append(key_norm)
-                        logger.warning(
-                            f"[{planta}] Variedad '{key_norm}' sin curvas y sin fallback disponible. "
-                            f"Se omitirá el cálculo de humedad para esta variedad."
-                        )
-                        continue
-                
-                # Cachear parámetros por hoja
-                if key_lookup not in cache_params:
-                    try:
-                        raw = pd.read_excel(tmp_path, sheet_name=name_map[key_lookup], header=None)
-                        cache_params[key_lookup] = parse_humedad_sheet(raw)
-                    except Exception as e:
-                        logger.warning(f"Error parseando hoja {name_map[key_lookup]}: {e}")
-                        faltantes.append(key_norm)
-                        continue
-                
-                AH, BH, CH, cfix_H, cvar_H = cache_params[key_lookup]
-                mask = (variedad_norm == key_norm)
-                
-                if not mask.any():
-                    continue
-                
-                # Preparar DataFrame auxiliar para merge_asof
-                aux_H = pd.DataFrame({
-                    "fecha_ref": fecha_ref[mask],
-                    "secadora": wide.loc[mask, "secadora"]
-                })
-                aux_H = merge_asof_cvar(aux_H, "fecha_ref", "secadora", cvar_H, "cvar_H")
-                
-                # Mapear C_fix por secadora
-                cfix_H_series = aux_H["secadora"].map(cfix_H).astype(float)
-                
-                # Fórmula: HUMEDAD = (VH^2) * AH + VH * BH + CH + C_fix_H[sensor] - C_var_H[sensor, timestamp]
-                HUMEDAD.loc[mask] = (
-                    (vh[mask] ** 2) * AH + 
-                    vh[mask] * BH + 
-                    CH + 
-                    cfix_H_series - 
-                    aux_H["cvar_H"]
-                )
+            # Mapear C_fix por secadora
+            mask_arr = mask.to_numpy()
+            cfix_H_arr = cfix_H_tbl[sec_idx[mask_arr]]
+            cvar_H_arr = aux_H["cvar_H"].to_numpy(np.float64)
             
-            if faltantes:
-                logger.warning(f"[{planta}] Variedades sin curvas: {', '.join(sorted(set(faltantes)))}")
-        except Exception as e:
-            logger.warning(f"Error procesando curvas de HUMEDAD: {e}")
-            HUMEDAD = pd.Series(np.nan, index=wide.index, dtype=float)
-        
-        # Aplicar máscaras finales
-        HUMEDAD = HUMEDAD.mask(mask_vh_zero | vh.isna(), np.nan)
-        
-        # Agregar columnas
-        wide["TEMPERATURA"] = TEMPERATURA
-        wide["HUMEDAD"] = HUMEDAD
+            # Fórmula: HUMEDAD = (VH^2) * AH + VH * BH + CH + C_fix_H[sensor] - C_var_H[sensor, timestamp]
+            HUMEDAD[mask_arr] = _formula_humedad(
+                vh_arr[mask_arr], AH, BH, CH, cfix_H_arr, cvar_H_arr
+            )
         
-    finally:
-        # Limpiar archivo temporal
-        if tmp_path and tmp_path.exists():
-            try:
-                tmp_path.unlink()
-            except Exception:
-                pass
+        if faltantes:
+            logger.warning(f"[{planta}] Variedades sin curvas: {', '.join(sorted(set(faltantes)))}")
+    except Exception as e:
+        logger.warning(f"Error procesando curvas de HUMEDAD: {e}")
+        HUMEDAD = np.full(len(wide), np.nan)
+    
+    # Agregar columnas
+    wide["TEMPERATURA"] = TEMPERATURA
+    wide["HUMEDAD"] = HUMEDAD
     
     temp_non_null = wide["TEMPERATURA"].notna().sum() if "TEMPERATURA" in wide.columns else 0
     hum_non_null = wide["HUMEDAD"].notna().sum() if "HUMEDAD" in wide.columns else 0
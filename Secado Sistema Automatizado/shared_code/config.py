@@ -8,41 +8,73 @@ Cada carpeta debe estar compartida con la Service Account:
 
 import os
 import logging
+from functools import lru_cache
+from types import MappingProxyType
 
 logger = logging.getLogger(__name__)
 
 
-# Mapeo de plantas a folder IDs de carpetas de laboratorio
-LAB_FOLDERS = {
-    "JPV": os.environ.get("LAB_FOLDER_JPV"),
-    "RB": os.environ.get("LAB_FOLDER_RB"),
-}
+PLANTAS = ("JPV", "RB")
 
-# Mapeo de plantas a folder IDs de carpetas de salida (processed)
-PROCESSED_FOLDERS = {
-    "JPV": os.environ.get("PROCESSED_FOLDER_JPV"),
-    "RB": os.environ.get("PROCESSED_FOLDER_RB"),
+# Tipo de carpeta -> (posición en las tuplas de FOLDERS, prefijo de la variable de entorno, descripción)
+_FOLDER_KINDS = {
+    "lab": (0, "LAB_FOLDER", "laboratorio"),
+    "processed": (1, "PROCESSED_FOLDER", "salida"),
+    "validated": (2, "VALIDATED_FOLDER", "archivos validados"),
+    "reports": (3, "REPORTS_FOLDER", "reportes"),
 }
+_IDX = {kind: spec[0] for kind, spec in _FOLDER_KINDS.items()}
 
-# Mapeo de plantas a folder IDs de carpetas de archivos validados
+# Folder IDs por planta en una sola tupla: (lab, processed, validated, reports); "" si la variable
+# no está definida. Se leen del entorno al importar y de nuevo en clear_folder_id_caches(); las
+# funciones get_* y las vistas *_FOLDERS salen siempre de esta misma tabla.
 # NOTA: Estos folder IDs deben configurarse como variables de entorno en Azure Function App Settings.
-# Valores originales del script compilado_post_ml.py (para referencia):
+# Valores originales de VALIDATED_FOLDER_* (script compilado_post_ml.py, para referencia):
 #   JPV: "1JbzvdmUiK_qAEHvfFK7g4dyVU2j7JwB9"
 #   RB:  "11q2vW9Fk8qYz5MIcpmmxmNhc0PiWYlaY"
-VALIDATED_FOLDERS = {
-    "JPV": os.environ.get("VALIDATED_FOLDER_JPV"),
-    "RB": os.environ.get("VALIDATED_FOLDER_RB"),
-}
-
-# Mapeo de plantas a folder IDs de carpetas de reportes
-# NOTA: Estos folder IDs deben configurarse como variables de entorno en Azure Function App Settings.
-# Valores originales del script reporte.py (para referencia):
+# Valores originales de REPORTS_FOLDER_* (script reporte.py, para referencia):
 #   JPV: "1CP6KsGkIHq5l0WrN7KMx-RK4ip_AXz4k"
 #   RB:  "181dqjsFvdu6pls_LLMcRD3J5PU-5eBR1"
-REPORTS_FOLDERS = {
-    "JPV": os.environ.get("REPORTS_FOLDER_JPV"),
-    "RB": os.environ.get("REPORTS_FOLDER_RB"),
-}
+def _load_folders() -> None:
+    """(Re)construye FOLDERS y las vistas por tipo de carpeta a partir del entorno."""
+    global FOLDERS, LAB_FOLDERS, PROCESSED_FOLDERS, VALIDATED_FOLDERS, REPORTS_FOLDERS
+    FOLDERS = MappingProxyType({
+        p: tuple(os.environ.get(f"{prefix}_{p}") or "" for _, prefix, _ in _FOLDER_KINDS.values())
+        for p in PLANTAS
+    })
+    # Vistas de solo lectura por tipo de carpeta (acceso por diccionario), derivadas de FOLDERS
+    LAB_FOLDERS = MappingProxyType({p: ids[_IDX["lab"]] for p, ids in FOLDERS.items()})
+    PROCESSED_FOLDERS = MappingProxyType({p: ids[_IDX["processed"]] for p, ids in FOLDERS.items()})
+    VALIDATED_FOLDERS = MappingProxyType({p: ids[_IDX["validated"]] for p, ids in FOLDERS.items()})
+    REPORTS_FOLDERS = MappingProxyType({p: ids[_IDX["reports"]] for p, ids in FOLDERS.items()})
+
+
+_load_folders()
+
+
+@lru_cache(maxsize=32)
+def _folder_id(kind: str, planta_upper: str) -> str:
+    """Resuelve (con caché) el folder_id de un tipo de carpeta; planta ya en mayúsculas."""
+    idx, prefix, desc = _FOLDER_KINDS[kind]
+    try:
+        folder_id = FOLDERS[planta_upper][idx]
+        if not folder_id:
+            raise KeyError(planta_upper)
+    except KeyError:
+        available = [p for p, ids in FOLDERS.items() if ids[idx]]
+        logger.error(
+            f"[Config] No hay folder_id de {desc} para '{planta_upper}'. "
+            f"Variable requerida: {prefix}_{planta_upper}. "
+            f"Plantas disponibles: {available}"
+        )
+        raise ValueError(
+            f"No existe configuración de carpeta de {desc} para '{planta_upper}'. "
+            f"Por favor configura la variable de entorno '{prefix}_{planta_upper}' "
+            f"en Azure Function App Settings."
+        ) from None
+
+    logger.info("[Config] Carpeta de %s para %s: %s", desc, planta_upper, folder_id)
+    return folder_id
 
 
 def get_lab_folder_id(planta: str) -> str:
@@ -58,24 +90,7 @@ def get_lab_folder_id(planta: str) -> str:
     Raises:
         ValueError: Si no existe configuración para la planta
     """
-    planta_upper = planta.upper()
-    folder_id = LAB_FOLDERS.get(planta_upper)
-
-    if not folder_id:
-        available = [p for p, fid in LAB_FOLDERS.items() if fid]
-        logger.error(
-            f"[Config] No hay folder_id de laboratorio para '{planta}'. "
-            f"Variable requerida: LAB_FOLDER_{planta_upper}. "
-            f"Plantas disponibles: {available}"
-        )
-        raise ValueError(
-            f"No existe configuración de carpeta de laboratorio para '{planta}'. "
-            f"Por favor configura la variable de entorno 'LAB_FOLDER_{planta_upper}' "
-            f"en Azure Function App Settings."
-        )
-
-    logger.info(f"[Config] Carpeta de laboratorio para {planta}: {folder_id}")
-    return folder_id
+    return _folder_id("lab", planta.upper())
 
 
 def get_processed_folder_id(planta: str) -> str:
@@ -91,24 +106,7 @@ def get_processed_folder_id(planta: str) -> str:
     Raises:
         ValueError: Si no existe configuración para la planta
     """
-    planta_upper = planta.upper()
-    folder_id = PROCESSED_FOLDERS.get(planta_upper)
-
-    if not folder_id:
-        available = [p for p, fid in PROCESSED_FOLDERS.items() if fid]
-        logger.error(
-            f"[Config] No hay folder_id de salida para '{planta}'. "
-            f"Variable requerida: PROCESSED_FOLDER_{planta_upper}. "
-            f"Plantas disponibles: {available}"
-        )
-        raise ValueError(
-            f"No existe configuración de carpeta de salida para '{planta}'. "
-            f"Por favor configura la variable de entorno 'PROCESSED_FOLDER_{planta_upper}' "
-            f"en Azure Function App Settings."
-        )
-
-    logger.info(f"[Config] Carpeta de salida para {planta}: {folder_id}")
-    return folder_id
+    return _folder_id("processed", planta.upper())
 
 
 def get_validated_folder_id(planta: str) -> str:
@@ -124,24 +122,7 @@ def get_validated_folder_id(planta: str) -> str:
     Raises:
         ValueError: Si no existe configuración para la planta
     """
-    planta_upper = planta.upper()
-    folder_id = VALIDATED_FOLDERS.get(planta_upper)
-
-    if not folder_id:
-        available = [p for p, fid in VALIDATED_FOLDERS.items() if fid]
-        logger.error(
-            f"[Config] No hay folder_id de archivos validados para '{planta}'. "
-            f"Variable requerida: VALIDATED_FOLDER_{planta_upper}. "
-            f"Plantas disponibles: {available}"
-        )
-        raise ValueError(
-            f"No existe configuración de carpeta de archivos validados para '{planta}'. "
-            f"Por favor configura la variable de entorno 'VALIDATED_FOLDER_{planta_upper}' "
-            f"en Azure Function App Settings."
-        )
-
-    logger.info(f"[Config] Carpeta de archivos validados para {planta}: {folder_id}")
-    return folder_id
+    return _folder_id("validated", planta.upper())
 
 
 def get_reports_folder_id(planta: str) -> str:
@@ -157,25 +138,15 @@ def get_reports_folder_id(planta: str) -> str:
     Raises:
         ValueError: Si no existe configuración para la planta
     """
-    planta_upper = planta.upper()
-    folder_id = REPORTS_FOLDERS.get(planta_upper)
+    return _folder_id("reports", planta.upper())
 
-    if not folder_id:
-        available = [p for p, fid in REPORTS_FOLDERS.items() if fid]
-        logger.error(
-            f"[Config] No hay folder_id de reportes para '{planta}'. "
-            f"Variable requerida: REPORTS_FOLDER_{planta_upper}. "
-            f"Plantas disponibles: {available}"
-        )
-        raise ValueError(
-            f"No existe configuración de carpeta de reportes para '{planta}'. "
-            f"Por favor configura la variable de entorno 'REPORTS_FOLDER_{planta_upper}' "
-            f"en Azure Function App Settings."
-        )
 
-    logger.info(f"[Config] Carpeta de reportes para {planta}: {folder_id}")
-    return folder_id
+def clear_folder_id_caches() -> None:
+    """Vuelve a leer los folder IDs del entorno y limpia la caché (p. ej. tras modificar las variables)."""
+    _load_folders()
+    _folder_id.cache_clear()
 
 
-__all__ = ["get_lab_folder_id", "get_processed_folder_id", "get_validated_folder_id", "get_reports_folder_id"]
+__all__ = ["get_lab_folder_id", "get_processed_folder_id", "get_validated_folder_id", "get_reports_folder_id",
+           "clear_folder_id_caches"]
 
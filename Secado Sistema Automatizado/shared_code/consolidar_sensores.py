@@ -10,14 +10,24 @@ Basado en la lógica del notebook consolidar_sensores.ipynb, este módulo:
 
 import io
 import logging
+import multiprocessing
+import os
 import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple, List, Dict, Any
+from typing import Optional, Tuple, List, Dict, Any, Callable, Iterable, Iterator
 
 import numpy as np
 import pandas as pd
 
+try:  # opcional: columnas de texto respaldadas por Arrow (búferes UTF-8 contiguos)
+    import pyarrow  # noqa: F401
+    _LAB_STRING_DTYPE = "string[pyarrow]"
+except ImportError:  # sin pyarrow se mantienen como object
+    _LAB_STRING_DTYPE = None
+
 logger = logging.getLogger(__name__)
 
 from shared_code.etl_core import (
@@ -26,12 +36,73 @@ from shared_code.etl_core import (
     extract_sensor_id_from_name,
 )
 from shared_code.gdrive_client import GoogleDriveClient
+from shared_code.lab_crosser import load_lab_control_file, cross_with_lab
 from shared_code.time_utils import normalize_timestamp
 
 # Configuración
 RB_VOLT_SCALE = 0.01  # dividir voltajes de RB por 100 para equiparar con JPV
 DROP_WIDE_COLS = ["TimeString", "HUMEDAD", "OFFSET", "TEMPERATURA"]
 EXPORT_LONG = True  # Si True, exporta también los datos en "largo" (auditoría)
+DOWNLOAD_WORKERS = 16  # Descargas concurrentes desde Google Drive (I/O-bound)
+# Procesos para parsear archivos de sensores (CPU-bound). 1 = parseo en serie en el proceso actual,
+# recomendado en planes de Azure Functions con un solo núcleo o lotes chicos. Se configura con la
+# variable de entorno SENSOR_PARSE_WORKERS (en App Settings) en planes con varios núcleos.
+PARSE_WORKERS = max(1, int(os.getenv("SENSOR_PARSE_WORKERS", "1")))
+# Tipos MIME que nunca son archivos de sensores (planillas de laboratorio/curvas, PDFs): se
+# descartan en el servidor al listar el árbol raw. Se excluye en lugar de permitir una lista,
+# porque Drive etiqueta los .txt/.csv con tipos variados (text/x-csv, application/csv, ...);
+# la selección real es por extensión en build_inventory_from_gdrive
+NON_SENSOR_MIME_TYPES = (
+    "application/vnd.google-apps.spreadsheet",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/pdf",
+)
+
+# Regex precompiladas (se evalúan por cada archivo del inventario)
+_RE_PLANTA = re.compile(r"\b(JPV|RB)\b", re.IGNORECASE)
+_RE_YEAR_DIR = {
+    planta: re.compile(rf"(20\d{{2}})\s+Datos\s+Sensores\s+{planta}", re.IGNORECASE)
+    for planta in ("JPV", "RB")
+}
+_RE_YEAR_ANY = re.compile(r"(20\d{2})")
+_RE_SENSOR_FULL = re.compile(r"SENSOR([1-6])")
+_RE_SENSOR_IN_PATH = re.compile(r"sensor[1-6]")  # se aplica sobre el path en minúsculas
+_RE_VAR_NORM = re.compile(r"[\s_\.\-]")
+
+# Columnas del log de procesamiento (errores de lectura/cruce y duplicados)
+_LOG_COLUMNS = ["tipo", "planta", "sensor_id", "timestamp", "variable", "source_file", "source_path", "detalle"]
+
+# Hoja "diccionario": (columna, descripción JPV, descripción RB) en el orden del archivo de
+# ejemplo; None = la columna no se documenta para esa planta
+_DICC_SPEC = [
+    ("planta", "Planta origen (JPV)", "Planta origen (RB)"),
+    ("año", "Año", "Año"),
+    ("tirada_num", "N° tirada (si estaba)", "N° tirada (si estaba)"),
+    ("tirada_fecha", "Fecha tirada", "Fecha tirada"),
+    ("sensor_id", "ID sensor", "ID sensor"),
+    ("timestamp", "Timestamp unificado", "Timestamp unificado"),
+    ("TimeString", "Tiempo crudo JPV", None),
+    ("Date_raw", None, "Fecha cruda RB"),
+    ("LOC_time_raw", None, "Hora local cruda RB"),
+    # Voltajes (como en el notebook: menciona V_HUM/V_TEM pero las columnas son VOLT_HUM/VOLT_TEM)
+    ("VOLT_HUM", "Voltaje humedad", "Voltaje humedad (÷100)"),
+    ("VOLT_TEM", "Voltaje temperatura", "Voltaje temperatura (÷100)"),
+    # Valores calibrados
+    ("TEMPERATURA", "Temperatura (°C) - calculada desde curvas de calibración",
+     "Temperatura (°C) - calculada desde curvas de calibración"),
+    ("HUMEDAD", "Humedad (%) - calculada desde curvas de calibración",
+     "Humedad (%) - calculada desde curvas de calibración"),
+    # Columnas de laboratorio
+    ("Variedad", "Variedad de arroz (cruzada con laboratorio)", "Variedad de arroz (cruzada con laboratorio)"),
+    ("ID_tachada", "ID de tachada (cruzada con laboratorio)", "ID de tachada (cruzada con laboratorio)"),
+    ("DESCARTAR", "Flag de descarte (cruzada con laboratorio)", "Flag de descarte (cruzada con laboratorio)"),
+    # Metadata de archivos
+    ("source_file", "Archivo fuente", "Archivo fuente"),
+    ("source_path", "Ruta fuente", "Ruta fuente"),
+]
+
+# Extensión de archivo de sensor -> planta (la extensión es la heurística más confiable)
+_SENSOR_EXT_PLANTA = {"txt": "JPV", "csv": "RB"}
 
 
 def is_plain_sensor_folder(name: str) -> bool:
@@ -39,7 +110,7 @@ def is_plain_sensor_folder(name: str) -> bool:
     True solo si la carpeta es exactamente SENSOR<1..6> (sin 'b' ni 'c').
     Aplica solo a JPV.
     """
-    m = re.fullmatch(r"SENSOR([1-6])", name.upper())
+    m = _RE_SENSOR_FULL.fullmatch(name.upper())
     return m is not None
 
 
@@ -68,12 +139,24 @@ def parse_tirada_rb(path: str) -> Optional[datetime]:
 
 
 def _detect_planta_from_path(path: str) -> Optional[str]:
-    """Detecta automáticamente la planta desde el path"""
-    if re.search(r"\bJPV\b", path, re.IGNORECASE):
-        return "JPV"
-    if re.search(r"\bRB\b", path, re.IGNORECASE):
-        return "RB"
-    return None
+    """Detecta automáticamente la planta desde el path (primer token JPV/RB que aparezca)"""
+    m = _RE_PLANTA.search(path)
+    return m.group(1).upper() if m else None
+
+
+def _extract_year(full_path: str, item_name: str, planta: str) -> Optional[int]:
+    """
+    Busca el año del archivo en múltiples lugares (más flexible), en orden de prioridad:
+    1. Carpeta "<año> Datos Sensores <planta>" en el path completo
+    2. En el nombre del archivo (ej: "SENSOR2_2024.txt")
+    3. En cualquier parte del path (ej: "JPV/2024/raw/...")
+    """
+    m = (
+        _RE_YEAR_DIR[planta].search(full_path)
+        or _RE_YEAR_ANY.search(item_name)
+        or _RE_YEAR_ANY.search(full_path)
+    )
+    return int(m.group(1)) if m else None
 
 
 def build_inventory_from_gdrive(
@@ -95,155 +178,105 @@ def build_inventory_from_gdrive(
     rows = []
     folder_mime = "application/vnd.google-apps.folder"
     
-    def _walk_folder(folder_path: str, relative_path: str = ""):
-        """
-        Función recursiva para caminar por carpetas.
+    # Listar todo el árbol de raw de una vez (la carpeta laboratorio se saltea:
+    # los archivos de lab se buscan aparte)
+    # IMPORTANTE: cada item trae "path", el path completo desde la raíz
+    # para que parse_tirada_jpv/rb pueda encontrar todas las carpetas padre
+    try:
+        items = gdrive.list_files_recursive(
+            raw_path,
+            skip_folders=("laboratorio",),
+            mime_exclude=NON_SENSOR_MIME_TYPES,
+        )
+    except Exception:
+        # Los errores por carpeta ya los maneja list_files_recursive; acá solo llega un fallo
+        # al resolver raw_path mismo
+        logger.exception("No se pudo listar '%s' en Google Drive; inventario vacío", raw_path)
+        items = []
+    
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for item in items:
+        item_name = item.get("name", "")
+        name_lower = item_name.lower()
+        item_mime = item.get("mimeType", "")
+        # Las carpetas ya fueron recorridas por list_files_recursive
+        if item_mime == folder_mime:
+            continue
         
-        Args:
-            folder_path: Path completo desde la raíz para list_files (ej: "Secado_Arroz/JPV/raw/USB 1/15.03.24")
-            relative_path: Path relativo desde raw_path (no usado, se usa folder_path completo)
-        """
-        try:
-            items = gdrive.list_files(folder_path)
-        except Exception:
-            return
+        # IMPORTANTE: path completo desde la raíz INCLUYENDO todas las carpetas padre
+        # (ej: "Secado_Arroz/JPV/raw/USB 1/15.03.24/sensor_2/archivo.txt") para que
+        # parse_tirada_jpv pueda encontrar "USB 1" y "15.03.24"
+        full_path = item.get("path") or f"{raw_path}/{item_name}"
         
-        for item in items:
-            item_name = item.get("name", "")
-            item_mime = item.get("mimeType", "")
-            # IMPORTANTE: Construir path completo desde la raíz INCLUYENDO todas las carpetas padre
-            # folder_path ya es el path completo desde la raíz (ej: "Secado_Arroz/JPV/raw/USB 1/15.03.24/sensor_2")
-            # Necesitamos usar folder_path (no raw_path) para que parse_tirada_jpv pueda encontrar "USB 1" y "15.03.24"
-            full_path = f"{folder_path}/{item_name}" if folder_path else f"{raw_path}/{item_name}"
+        # Es un archivo
+        # Solo procesar archivos de sensores (.txt y .csv), no Excel
+        # PRIORIZAR EXTENSIÓN DEL ARCHIVO sobre el path para detectar planta
+        # La extensión es más confiable que el path
+        _, dot, ext = name_lower.rpartition(".")
+        detected_planta = _SENSOR_EXT_PLANTA.get(ext) if dot else None
+        if detected_planta is None:
+            continue  # No es un archivo de sensor conocido
+        
+        # Segundo: si el nombre del archivo tiene JPV o RB explícito, usarlo
+        detected_planta = _detect_planta_from_path(item_name) or detected_planta
+        
+        # Si aún no detectamos, intentar desde el path como fallback
+        if detected_planta is None:
+            detected_planta = _detect_planta_from_path(full_path)
             
-            if item_mime == folder_mime:
-                # Es una carpeta
-                # Si es carpeta laboratorio, saltarla (los archivos de lab se buscan aparte)
-                if item_name.lower() == "laboratorio":
-                    continue
-                
-                # Continuar buscando recursivamente en todas las carpetas
-                next_relative_path = f"{relative_path}/{item_name}" if relative_path else item_name
-                _walk_folder(f"{folder_path}/{item_name}", next_relative_path)
-            else:
-                # Es un archivo
-                # Solo procesar archivos de sensores (.txt y .csv), no Excel
-                if not (item_name.lower().endswith(".txt") or item_name.lower().endswith(".csv")):
-                    continue
-                
-                # PRIORIZAR EXTENSIÓN DEL ARCHIVO sobre el path para detectar planta
-                # La extensión es más confiable que el path
-                detected_planta = None
-                
-                # Primero: heurística por extensión (más confiable)
-                if item_name.lower().endswith(".txt"):
-                    detected_planta = "JPV"
-                elif item_name.lower().endswith(".csv"):
-                    detected_planta = "RB"
-                else:
-                    continue  # No es un archivo de sensor conocido
-                
-                # Segundo: si el nombre del archivo tiene JPV o RB explícito, usarlo
-                if re.search(r"\bJPV\b", item_name, re.IGNORECASE):
-                    detected_planta = "JPV"
-                elif re.search(r"\bRB\b", item_name, re.IGNORECASE):
-                    detected_planta = "RB"
-                
-                # Si aún no detectamos, intentar desde el path como fallback
-                if detected_planta is None:
-                    detected_planta = _detect_planta_from_path(full_path)
-                    
-                # Si definitivamente no detectamos, saltar
-                if detected_planta is None:
-                    continue
-                
-                # Para JPV, verificar que esté dentro de una carpeta SENSOR válida
-                if detected_planta == "JPV":
-                    # Verificar si hay SENSOR[1-6] en algún lugar del path
-                    has_sensor_folder = re.search(r"SENSOR[1-6]", full_path, re.IGNORECASE) is not None
-                    if not has_sensor_folder:
-                        # Saltar este archivo JPV si no está en carpeta SENSOR
-                        continue
-                
-                # Extraer metadata
-                # IMPORTANTE: full_path ahora incluye todas las carpetas padre desde la raíz
-                # Esto permite que parse_tirada_jpv y parse_tirada_rb encuentren "USB 1", "15.03.24", etc.
-                sensor_id = extract_sensor_id_from_name(item_name) or extract_sensor_id_from_name(full_path)
-                
-                if detected_planta == "JPV":
-                    # parse_tirada_jpv necesita el path completo con todas las carpetas para buscar "USB 1" y fechas
-                    tirada_num, tirada_dt = parse_tirada_jpv(full_path)
-                    año = None
-                    # Buscar año en múltiples lugares (más flexible):
-                    # 1. En el path completo (ej: "2024 Datos Sensores JPV")
-                    m = re.search(r"(20\d{2})\s+Datos\s+Sensores\s+JPV", full_path, flags=re.IGNORECASE)
-                    if m:
-                        año = int(m.group(1))
-                    else:
-                        # 2. En el nombre del archivo (ej: "SENSOR2_2024.txt")
-                        m = re.search(r"(20\d{2})", item_name)
-                        if m:
-                            año = int(m.group(1))
-                        else:
-                            # 3. En cualquier parte del path (ej: "JPV/2024/raw/...")
-                            m = re.search(r"(20\d{2})", full_path)
-                            if m:
-                                año = int(m.group(1))
-                else:  # RB
-                    tirada_num = None
-                    tirada_dt = parse_tirada_rb(full_path)
-                    año = None
-                    # Buscar año en múltiples lugares (más flexible):
-                    # 1. En el path completo (ej: "2024 Datos Sensores RB")
-                    m = re.search(r"(20\d{2})\s+Datos\s+Sensores\s+RB", full_path, flags=re.IGNORECASE)
-                    if m:
-                        año = int(m.group(1))
-                    else:
-                        # 2. En el nombre del archivo (ej: "SENSOR1_2024.csv")
-                        m = re.search(r"(20\d{2})", item_name)
-                        if m:
-                            año = int(m.group(1))
-                        else:
-                            # 3. En cualquier parte del path (ej: "RB/2024/raw/...")
-                            m = re.search(r"(20\d{2})", full_path)
-                            if m:
-                                año = int(m.group(1))
-                
-                # DEBUG: Mostrar metadatos extraídos
-                logger.debug(f"   📋 Metadatos extraídos para '{item_name}':")
-                logger.debug(f"      Path completo: {full_path}")
-                logger.debug(f"      Tirada num: {tirada_num}, Tirada fecha: {tirada_dt}")
-                logger.debug(f"      Año: {año}, Sensor ID: {sensor_id}")
-                
-                rows.append({
-                    "planta": detected_planta,
-                    "año": año,
-                    "tirada_num": tirada_num,
-                    "tirada_fecha": tirada_dt,
-                    "sensor_id": sensor_id,
-                    "ext": Path(item_name).suffix.lower(),
-                    "source_file": item_name,
-                    "source_path": full_path,
-                    "file_id": item.get("id") if "id" in item else None,
-                })
-    
-    # Iniciar walk desde la carpeta raw
-    # IMPORTANTE: folder_path debe ser el path completo desde la raíz
-    # para que parse_tirada_jpv/rb pueda encontrar todas las carpetas padre
-    _walk_folder(raw_path, relative_path="")
+        # Si definitivamente no detectamos, saltar
+        if detected_planta is None:
+            continue
+        
+        # Para JPV, verificar que esté dentro de una carpeta SENSOR válida
+        if detected_planta == "JPV":
+            # Verificar si hay SENSOR[1-6] en algún lugar del path
+            has_sensor_folder = _RE_SENSOR_IN_PATH.search(full_path.lower()) is not None
+            if not has_sensor_folder:
+                # Saltar este archivo JPV si no está en carpeta SENSOR
+                continue
+        
+        # Extraer metadata
+        # IMPORTANTE: full_path ahora incluye todas las carpetas padre desde la raíz
+        # Esto permite que parse_tirada_jpv y parse_tirada_rb encuentren "USB 1", "15.03.24", etc.
+        sensor_id = extract_sensor_id_from_name(item_name) or extract_sensor_id_from_name(full_path)
+        
+        if detected_planta == "JPV":
+            # parse_tirada_jpv necesita el path completo con todas las carpetas para buscar "USB 1" y fechas
+            tirada_num, tirada_dt = parse_tirada_jpv(full_path)
+        else:  # RB
+            tirada_num = None
+            tirada_dt = parse_tirada_rb(full_path)
+        
+        año = _extract_year(full_path, item_name, detected_planta)
+        
+        # DEBUG: Mostrar metadatos extraídos
+        if debug:
+            logger.debug(f"   📋 Metadatos extraídos para '{item_name}':")
+            logger.debug(f"      Path completo: {full_path}")
+            logger.debug(f"      Tirada num: {tirada_num}, Tirada fecha: {tirada_dt}")
+            logger.debug(f"      Año: {año}, Sensor ID: {sensor_id}")
+        
+        rows.append({
+            "planta": detected_planta,
+            "año": año,
+            "tirada_num": tirada_num,
+            "tirada_fecha": tirada_dt,
+            "sensor_id": sensor_id,
+            "ext": Path(item_name).suffix.lower(),
+            "source_file": item_name,
+            "source_path": full_path,
+            "file_id": item.get("id") if "id" in item else None,
+        })
+    
+    inv = pd.DataFrame(rows)
     
     # DEBUG: Mostrar estadísticas del inventario
-    if rows:
-        inv_temp = pd.DataFrame(rows)
-        print(f"   📊 Inventario construido: {len(inv_temp)} archivos")
-        if "tirada_num" in inv_temp.columns:
-            tiradas_con_num = inv_temp["tirada_num"].notna().sum()
-            print(f"      Tiradas con número: {tiradas_con_num}/{len(inv_temp)}")
-        if "tirada_fecha" in inv_temp.columns:
-            tiradas_con_fecha = inv_temp["tirada_fecha"].notna().sum()
-            print(f"      Tiradas con fecha: {tiradas_con_fecha}/{len(inv_temp)}")
+    if debug and rows:
+        logger.debug("   📊 Inventario construido: %d archivos", len(inv))
+        logger.debug("      Tiradas con número: %d/%d", inv["tirada_num"].notna().sum(), len(inv))
+        logger.debug("      Tiradas con fecha: %d/%d", inv["tirada_fecha"].notna().sum(), len(inv))
     
-    inv = pd.DataFrame(rows)
     if len(inv) > 0:
         # Filtrar filas sin planta detectada
         inv = inv[inv["planta"].notna()]
@@ -308,6 +341,48 @@ def find_lab_files(
     return lab_files
 
 
+def iter_prefetched(
+    items: Iterable[Any],
+    fetch: Callable[[Any], Any],
+    workers: int = DOWNLOAD_WORKERS,
+) -> Iterator[Tuple[Any, Future]]:
+    """
+    Ejecuta fetch(item) en un pool de hilos y devuelve (item, future) en el orden de items.
+
+    La ventana guarda a lo sumo 2 * workers - 1 tareas sin entregar; con el resultado que está
+    usando el consumidor son 2 * workers en total. Se envía una nueva a medida que se consume
+    cada resultado, así que en memoria quedan solo los bytes de esa ventana y no los de todo
+    el lote. El pool se cierra (cancelando lo pendiente) aunque el consumidor corte la
+    iteración o falle; conviene cerrar el generador en un finally.
+    """
+    workers = max(1, workers)
+    items = iter(items)
+    pending: deque = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in items:
+            pending.append((item, executor.submit(fetch, item)))
+            if len(pending) >= 2 * workers - 1:
+                break
+        while pending:
+            # Reponer antes de entregar: así el generador no guarda referencia al Future
+            # entregado y sus bytes se liberan apenas el consumidor lo suelta
+            nxt = next(items, pending)  # pending como centinela: nunca es un item
+            if nxt is not pending:
+                pending.append((nxt, executor.submit(fetch, nxt)))
+            del nxt
+            yield pending.popleft()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _parse_sensor_file(planta: str, file_content: bytes, source_file: str) -> pd.DataFrame:
+    """Parsea el contenido de un archivo de sensor según la planta (nivel módulo: apto para procesos)."""
+    if planta == "JPV":
+        return read_jpv_txt(file_content, source_file)
+    return read_rb_csv(file_content, source_file)
+
+
 def process_files_from_inventory(
     gdrive: GoogleDriveClient,
     inv: pd.DataFrame,
@@ -323,147 +398,197 @@ def process_files_from_inventory(
         lab_files = {}
     
     long_frames: List[pd.DataFrame] = []
-    log_rows: List[dict] = []
+    # Log acumulado por columnas (un DataFrame al final, sin un dict por registro)
+    log_cols: Dict[str, list] = {col: [] for col in _LOG_COLUMNS}
+    lab_cache: Dict[Tuple[str, str], pd.DataFrame] = {}
+
+    def _log(n: int = 1, **values) -> None:
+        # Agrega n registros: las listas se extienden tal cual, los escalares se repiten
+        for col, dest in log_cols.items():
+            value = values.get(col)
+            dest.extend(value if isinstance(value, list) else [value] * n)
 
-    for _, r in inv.iterrows():
-        file_path = r["source_path"]
-        planta = r["planta"]
+    # Registros como dicts: evita construir una Series por fila (iterrows)
+    records = inv.to_dict("records")
+
+    # Con PARSE_WORKERS > 1 el parseo va a procesos separados (cada uno con su GIL); "spawn" evita
+    # hacer fork con los hilos de descarga activos
+    parse_pool = None
+    if PARSE_WORKERS > 1 and len(records) > 1:
+        parse_pool = ProcessPoolExecutor(
+            max_workers=min(PARSE_WORKERS, len(records)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def _download(r):
+        # Usar file_id si está disponible (más eficiente), sino usar el path
+        file_id = r.get("file_id")
+        if file_id:
+            content = gdrive.download_file(r["source_path"], file_id=file_id)
+        else:
+            content = gdrive.download_file(r["source_path"])
+        if parse_pool is None:
+            return content
+        # Encadenar el parseo apenas termina la descarga
+        return parse_pool.submit(_parse_sensor_file, r["planta"], content, r["source_file"])
+
+    # Columnas meta repetidas en todas las filas de un archivo: como categorías comunes a todo
+    # el inventario (un código por fila) y el concat final sigue siendo categórico
+    meta_dtypes = {
+        col: pd.CategoricalDtype(categories=pd.unique(inv[col].dropna()))
+        for col in ("planta", "source_file", "source_path")
+        if col in inv.columns
+    }
+    meta_dtypes["sensor_id"] = "Int16"
+    # Descargar en paralelo (la latencia de red domina) con una ventana acotada de descargas
+    # en vuelo; los resultados se consumen en el orden del inventario
+    downloads = iter_prefetched(records, _download, workers=min(DOWNLOAD_WORKERS, len(records)))
+    try:
+        for r, download in downloads:
+            planta = r["planta"]
         
-        try:
-            # Descargar archivo desde Google Drive
-            # Usar file_id si está disponible (más eficiente), sino usar el path
-            file_id = r.get("file_id") if "file_id" in r else None
-            if file_id:
-                file_content = gdrive.download_file(file_path, file_id=file_id)
-            else:
-                file_content = gdrive.download_file(file_path)
-            
-            # Procesar según tipo de planta
-            if planta == "JPV":
-                df = read_jpv_txt(file_content, r["source_file"])
-            else:  # RB
-                df = read_rb_csv(file_content, r["source_file"])
-            
-            # Columnas meta comunes
-            df["planta"] = planta
+            try:
+                # Descargar archivo desde Google Drive y procesar según tipo de planta
+                fetched = download.result()
+                del download  # el Future retiene los bytes descargados: soltarlo al consumirlo
+                if parse_pool is None:
+                    df = _parse_sensor_file(planta, fetched, r["source_file"])
+                else:
+                    df = fetched.result()
+                del fetched
             
-            # IMPORTANTE: Si el año no se detectó en el inventario, intentar inferirlo del timestamp
-            # o usar el año de los archivos de laboratorio disponibles
-            año_inv = r.get("año")
-            if pd.isna(año_inv) or año_inv is None:
-                # Intentar inferir el año del timestamp si está disponible
-                if "timestamp" in df.columns and df["timestamp"].notna().any():
-                    first_timestamp = df["timestamp"].dropna().iloc[0] if not df["timestamp"].dropna().empty else None
-                    if first_timestamp is not None:
-                        try:
-                            año_inv = pd.to_datetime(first_timestamp).year
-                            logger.debug(f"Inferido año {año_inv} desde timestamp para {r['source_file']}")
-                        except Exception:
-                            pass
+                # IMPORTANTE: Si el año no se detectó en el inventario, intentar inferirlo del timestamp
+                # o usar el año de los archivos de laboratorio disponibles
+                año_inv = r.get("año")
+                if pd.isna(año_inv) or año_inv is None:
+                    # Intentar inferir el año del timestamp si está disponible
+                    if "timestamp" in df.columns and df["timestamp"].notna().any():
+                        first_timestamp = df["timestamp"].dropna().iloc[0] if not df["timestamp"].dropna().empty else None
+                        if first_timestamp is not None:
+                            try:
+                                año_inv = pd.to_datetime(first_timestamp).year
+                                logger.debug(f"Inferido año {año_inv} desde timestamp para {r['source_file']}")
+                            except Exception:
+                                pass
                 
-                # Si aún no hay año y hay archivos de laboratorio disponibles, usar el primer año disponible
-                if (pd.isna(año_inv) or año_inv is None) and planta in lab_files:
-                    años_disponibles = list(lab_files[planta].keys())
-                    if años_disponibles:
-                        año_inv = int(años_disponibles[0])
-                        logger.debug(f"Usando año {año_inv} desde archivos de laboratorio para {r['source_file']}")
+                    # Si aún no hay año y hay archivos de laboratorio disponibles, usar el primer año disponible
+                    if (pd.isna(año_inv) or año_inv is None) and planta in lab_files:
+                        años_disponibles = list(lab_files[planta].keys())
+                        if años_disponibles:
+                            año_inv = int(años_disponibles[0])
+                            logger.debug(f"Usando año {año_inv} desde archivos de laboratorio para {r['source_file']}")
             
-            df["año"] = año_inv
-            df["tirada_num"] = r["tirada_num"]
-            df["tirada_fecha"] = pd.to_datetime(r["tirada_fecha"]) if pd.notna(r["tirada_fecha"]) else pd.NaT
-            df["sensor_id"] = r["sensor_id"]
-            df["source_file"] = r["source_file"]
-            df["source_path"] = r["source_path"]
+                # Columnas meta comunes (un solo assign en lugar de una asignación por columna)
+                meta = {
+                    "planta": planta,
+                    "año": año_inv,
+                    "tirada_num": r["tirada_num"],
+                    "tirada_fecha": pd.to_datetime(r["tirada_fecha"]) if pd.notna(r["tirada_fecha"]) else pd.NaT,
+                    "sensor_id": r["sensor_id"],
+                    "source_file": r["source_file"],
+                    "source_path": r["source_path"],
+                }
+                df = df.assign(**meta).astype(meta_dtypes)
             
-            # Intentar cruzar con datos de laboratorio si están disponibles
-            # IMPORTANTE: Guardar columnas meta antes del cruce para no perderlas
-            meta_cols_before = ["planta", "año", "tirada_num", "tirada_fecha", "sensor_id", "source_file", "source_path"]
-            meta_values_before = {col: df[col].iloc[0] if col in df.columns and len(df) > 0 else None for col in meta_cols_before}
+                # Intentar cruzar con datos de laboratorio si están disponibles
+                # IMPORTANTE: Guardar columnas meta antes del cruce para no perderlas
+                meta_cols_before = ["planta", "año", "tirada_num", "tirada_fecha", "sensor_id", "source_file", "source_path"]
+                meta_values_before = {col: df[col].iloc[0] if col in df.columns and len(df) > 0 else None for col in meta_cols_before}
             
-            año = año_inv  # Usar el año inferido
-            if año and planta in lab_files:
-                año_str = str(int(año)) if pd.notna(año) else None
-                if año_str and año_str in lab_files[planta]:
-                    try:
-                        from shared_code.lab_crosser import load_lab_control_file, cross_with_lab
-                        lab_file_path = lab_files[planta][año_str]
-                        lab_content = gdrive.download_file(lab_file_path)
-                        lab_df = load_lab_control_file(lab_content, year=int(año_str), planta=planta)
-                        # Hacer el cruce (cross_with_lab ya normaliza timestamps)
-                        df = cross_with_lab(df, lab_df, require_sensor_match=True)
+                año = año_inv  # Usar el año inferido
+                if año and planta in lab_files:
+                    año_str = str(int(año)) if pd.notna(año) else None
+                    if año_str and año_str in lab_files[planta]:
+                        try:
+                            # El archivo de laboratorio es el mismo para todos los sensores del año:
+                            # se descarga y parsea una sola vez por (planta, año)
+                            lab_key = (planta, año_str)
+                            lab_df = lab_cache.get(lab_key)
+                            if lab_df is None:
+                                lab_content = gdrive.download_file(lab_files[planta][año_str])
+                                lab_df = load_lab_control_file(lab_content, year=int(año_str), planta=planta)
+                                lab_cache[lab_key] = lab_df
+                            # Hacer el cruce (cross_with_lab ya normaliza timestamps)
+                            df = cross_with_lab(df, lab_df, require_sensor_match=True)
                         
-                        # Asegurar que las columnas meta se mantengan después del cruce
-                        # cross_with_lab() puede no preservar todas las columnas
-                        for col in meta_cols_before:
-                            if col not in df.columns:
-                                # Si la columna se perdió, restaurarla con los valores originales
-                                if meta_values_before[col] is not None:
-                                    df[col] = meta_values_before[col]
-                                else:
-                                    df[col] = np.nan
-                    except Exception as lab_exc:
-                        # Si falla el cruce, continuar sin él
-                        log_rows.append({
-                            "tipo": "error_cruce_lab",
-                            "planta": planta,
-                            "sensor_id": r.get("sensor_id"),
-                            "timestamp": None,
-                            "variable": None,
-                            "source_file": r["source_file"],
-                            "source_path": r["source_path"],
-                            "detalle": f"Cruce con laboratorio falló: {lab_exc}",
-                        })
-            
-            # Armonizar columnas crudas (por si no existen)
-            for col in ["Date_raw", "LOC_time_raw", "VarName", "TimeString", "VarValue", "Validity", "Time_ms", "VarName_original"]:
-                if col not in df.columns:
-                    df[col] = pd.Series([np.nan] * len(df), dtype=object)
+                            # Asegurar que las columnas meta se mantengan después del cruce
+                            # cross_with_lab() puede no preservar todas las columnas
+                            for col in meta_cols_before:
+                                if col not in df.columns:
+                                    # Si la columna se perdió, restaurarla con los valores originales
+                                    if meta_values_before[col] is not None:
+                                        df[col] = meta_values_before[col]
+                                    else:
+                                        df[col] = np.nan
+                            df = df.astype(meta_dtypes)
+                        except Exception as lab_exc:
+                            # Si falla el cruce, continuar sin él
+                            _log(
+                                tipo="error_cruce_lab",
+                                planta=planta,
+                                sensor_id=r.get("sensor_id"),
+                                source_file=r["source_file"],
+                                source_path=r["source_path"],
+                                detalle=f"Cruce con laboratorio falló: {lab_exc}",
+                            )
             
-            # Clave de duplicado en largo
-            df["dup_key"] = (
-                df["planta"].astype(str) + "|" +
-                df["sensor_id"].astype(str) + "|" +
-                df["timestamp"].astype(str) + "|" +
-                df["variable"].astype(str)
-            )
+                # Armonizar columnas crudas (por si no existen)
+                for col in ["Date_raw", "LOC_time_raw", "VarName", "TimeString", "VarValue", "Validity", "Time_ms", "VarName_original"]:
+                    if col not in df.columns:
+                        df[col] = pd.Series([np.nan] * len(df), dtype=object)
             
-            # Detectar duplicados exactos
-            dups = df[df.duplicated(subset=["dup_key"], keep="first")]
-            if len(dups) > 0:
-                for _, dd in dups.iterrows():
-                    log_rows.append({
-                        "tipo": "duplicado_largo",
-                        "planta": planta,
-                        "sensor_id": r["sensor_id"],
-                        "timestamp": dd["timestamp"],
-                        "variable": dd["variable"],
-                        "source_file": r["source_file"],
-                        "source_path": r["source_path"],
-                    })
-                # Nos quedamos con la primera
-                df = df.drop_duplicates(subset=["dup_key"], keep="first")
+                # Detectar duplicados exactos en largo (hash directo sobre las columnas clave,
+                # sin construir una columna de texto intermedia)
+                dup_subset = ["planta", "sensor_id", "timestamp", "variable"]
+                dups = df[df.duplicated(subset=dup_subset, keep="first")]
+                if len(dups) > 0:
+                    # Un registro de log por duplicado, agregado por columnas (sin iterrows)
+                    _log(
+                        len(dups),
+                        tipo="duplicado_largo",
+                        planta=planta,
+                        sensor_id=r["sensor_id"],
+                        timestamp=dups["timestamp"].tolist(),
+                        variable=dups["variable"].tolist(),
+                        source_file=r["source_file"],
+                        source_path=r["source_path"],
+                    )
+                    # Nos quedamos con la primera
+                    df = df.drop_duplicates(subset=dup_subset, keep="first")
             
-            long_frames.append(df.drop(columns=["dup_key"]))
+                long_frames.append(df)
             
-        except Exception as e:
-            log_rows.append({
-                "tipo": "error_lectura",
-                "planta": planta,
-                "sensor_id": r.get("sensor_id"),
-                "timestamp": None,
-                "variable": None,
-                "source_file": r["source_file"],
-                "source_path": r["source_path"],
-                "detalle": str(e),
-            })
+            except Exception as e:
+                _log(
+                    tipo="error_lectura",
+                    planta=planta,
+                    sensor_id=r.get("sensor_id"),
+                    source_file=r["source_file"],
+                    source_path=r["source_path"],
+                    detalle=str(e),
+                )
+    finally:
+        downloads.close()
+        if parse_pool is not None:
+            parse_pool.shutdown(wait=True, cancel_futures=True)
     
     # Unión y QA
-    long_all = pd.concat(long_frames, ignore_index=True) if long_frames else pd.DataFrame()
+    if not long_frames:
+        long_all = pd.DataFrame()
+    elif len(long_frames) == 1:
+        # Un solo archivo: no hace falta copiar todo el frame en un concat
+        long_all = long_frames[0].reset_index(drop=True)
+    else:
+        long_all = pd.concat(long_frames, ignore_index=True, copy=False)
     
     if not long_all.empty:
+        # Pocas variables/años distintos repetidos en todas las filas: categoría / entero corto
+        # (groupby y pivot comparan códigos en lugar de strings u objetos)
+        long_all["variable"] = long_all["variable"].astype("category")
+        long_all["año"] = pd.to_numeric(long_all["año"], errors="coerce").astype("Int16")
         qa = (
             long_all
-            .groupby(["planta", "año", "sensor_id"])
+            .groupby(["planta", "año", "sensor_id"], observed=True)
             .agg(
                 registros=("valor", "size"),
                 fechas_min=("timestamp", "min"),
@@ -474,10 +599,7 @@ def process_files_from_inventory(
     else:
         qa = pd.DataFrame(columns=["planta", "año", "sensor_id", "registros", "fechas_min", "fechas_max"])
     
-    log_df = pd.DataFrame(
-        log_rows,
-        columns=["tipo", "planta", "sensor_id", "timestamp", "variable", "source_file", "source_path", "detalle"],
-    )
+    log_df = pd.DataFrame(log_cols, columns=_LOG_COLUMNS)
     
     # ACCIÓN 1: PROPAGAR METADATOS DE LABORATORIO
     # El cruce con laboratorio asigna 'Variedad' e 'ID_tachada' solo a las filas que hacen match directo
@@ -499,15 +621,20 @@ def process_files_from_inventory(
             # 3. Agrupar y rellenar (ffill + bfill)
             # Esto toma la 'Variedad' (ej: 'Merin') de la fila 'VARIEDAD' y la copia
             # a las filas 'VOLT_HUME', 'VOLT_TEMP' que tienen el mismo timestamp.
-            # Usar .transform() es más robusto para aplicar ffill/bfill dentro de cada grupo.
-            for col in cols_to_propagate:
-                long_all[col] = long_all.groupby(group_keys, dropna=False)[col].transform(lambda x: x.ffill().bfill())
+            # GroupBy.ffill/bfill (Cython) sobre todas las columnas a la vez, en lugar de una
+            # lambda por grupo y por columna.
+            gb = long_all.groupby(group_keys, dropna=False, observed=True, sort=False)
+            long_all[cols_to_propagate] = gb[cols_to_propagate].ffill()
+            gb = long_all.groupby(group_keys, dropna=False, observed=True, sort=False)
+            long_all[cols_to_propagate] = gb[cols_to_propagate].bfill()
             
             # 4. Asegurar que las columnas sean string ANTES de 'to_wide' para evitar el ValueError
-            if 'Variedad' in long_all.columns:
-                long_all['Variedad'] = long_all['Variedad'].astype(str)
-            if 'ID_tachada' in long_all.columns:
-                long_all['ID_tachada'] = long_all['ID_tachada'].astype(str)
+            # (con pyarrow se guardan como string Arrow; los faltantes siguen siendo el texto 'nan')
+            for c in ('Variedad', 'ID_tachada'):
+                if c in long_all.columns:
+                    long_all[c] = long_all[c].astype(str)
+                    if _LAB_STRING_DTYPE is not None:
+                        long_all[c] = long_all[c].astype(_LAB_STRING_DTYPE)
             
             # DEBUG: Mostrar estadísticas después de la propagación
             var_valid = long_all['Variedad'].notna().sum() if 'Variedad' in long_all.columns else 0
@@ -521,6 +648,42 @@ def process_files_from_inventory(
     return long_all, log_df, qa
 
 
+def _variable_codes(variable: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Códigos enteros de la variable y nombre canónico por código (mayúsculas, sin
+    espacios/guiones/puntos), igual que `.astype(str).str.upper().str.replace(r"[\\s_\\.\\-]", "")`
+    pero aplicando la regex una sola vez por valor distinto (categorías).
+    """
+    var = variable if isinstance(variable.dtype, pd.CategoricalDtype) else variable.astype("category")
+    # Código -1 (faltante) cae en el último elemento: "NAN", como str(nan).upper()
+    norm_cats = np.array(
+        [_RE_VAR_NORM.sub("", str(c).upper()) for c in var.cat.categories] + ["NAN"],
+        dtype=object,
+    )
+    return var.cat.codes.to_numpy(), norm_cats
+
+
+def _alias_mask(codes: np.ndarray, norm_cats: np.ndarray, aliases) -> np.ndarray:
+    """Máscara de filas cuya variable canónica está en aliases (comparando códigos enteros)."""
+    alias_codes = np.flatnonzero(np.isin(norm_cats, list(aliases)))
+    # Código -1 (faltante) equivale al último nombre canónico
+    alias_codes[alias_codes == len(norm_cats) - 1] = -1
+    return np.isin(codes, alias_codes, kind="table")
+
+
+def _dedupe_columns(df: pd.DataFrame, context: str) -> pd.DataFrame:
+    """Elimina columnas con nombre repetido conservando la primera aparición (un solo pase hash)."""
+    dups_mask = df.columns.duplicated(keep="first")
+    if not dups_mask.any():
+        return df
+    logger.warning(
+        "%s: Se detectaron columnas duplicadas: %s. Conservando la primera aparición de cada una.",
+        context,
+        list(dict.fromkeys(df.columns[dups_mask])),
+    )
+    return df.loc[:, ~dups_mask]
+
+
 def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
     """
     Convierte datos de formato largo a formato ancho (pivot).
@@ -545,14 +708,30 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
     ]
     meta_cols_for_merge = lab_meta_cols + extra_meta_cols
 
-    def _first_valid_meta(series: pd.Series):
-        non_null = series.dropna()
-        for value in non_null:
-            if isinstance(value, str):
-                if value.strip().lower() in {"", "nan", "none"}:
-                    continue
-            return value
-        return non_null.iloc[0] if not non_null.empty else None
+    def _invalid_text_mask(series: pd.Series) -> pd.Series:
+        """True donde el valor es un texto vacío, 'nan' o 'none' (sin importar mayúsculas/espacios)."""
+        invalid = ["", "nan", "none"]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            cats = series.cat.categories
+            return series.isin(cats[cats.astype(str).str.strip().str.lower().isin(invalid)])
+        if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            return series.astype(str).str.strip().str.lower().isin(invalid)
+        return pd.Series(False, index=series.index)
+
+    def _first_valid_meta_by_key(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Primer valor válido de cada columna meta por clave: el primero no nulo que no sea
+        texto vacío/'nan'/'none'; si el grupo solo tiene esos textos, el primero de ellos.
+        Usa GroupBy.first (Cython) en lugar de una función Python por grupo.
+        """
+        clean = df.copy()
+        for col in meta_cols_for_merge:
+            clean[col] = clean[col].mask(_invalid_text_mask(clean[col]))
+        gb_kwargs = dict(dropna=False, observed=True, sort=False)
+        first_valid = clean.groupby(base_key_cols, **gb_kwargs).first()
+        if first_valid.isna().any().any():
+            first_valid = first_valid.fillna(df.groupby(base_key_cols, **gb_kwargs).first())
+        return first_valid.reset_index()
     
     # Verificar que las columnas clave estén presentes y tengan datos
     missing_cols = [c for c in base_key_cols if c not in long_all.columns]
@@ -561,6 +740,10 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
         for c in missing_cols:
             long_all[c] = np.nan
     
+    # Ordenar una sola vez por las claves base (estable: dentro de cada clave se mantiene el
+    # orden original); los groupby siguientes usan sort=False y "first" respeta este orden
+    long_all = long_all.sort_values(base_key_cols, kind="stable")
+    
     # Verificar cuántas filas tienen NaN en key_cols BASE (no contar Variedad/ID_tachada como críticas)
     # Variedad e ID_tachada pueden tener NaN si no hay match con laboratorio, y eso está bien
     base_key_cols_nan_count = long_all[base_key_cols].isna().any(axis=1).sum()
@@ -573,54 +756,56 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
         # Debug: mostrar valores de key_cols en las primeras filas
         logger.error(f"to_wide: Primeras 5 filas de key_cols:\n{long_all[key_cols].head()}")
     
+    # Las estadísticas de diagnóstico recorren columnas completas: solo en DEBUG
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
     # DEBUG: Información sobre Variedad e ID_tachada
-    if "Variedad" in long_all.columns or "ID_tachada" in long_all.columns:
+    if debug and ("Variedad" in long_all.columns or "ID_tachada" in long_all.columns):
         var_valid = long_all["Variedad"].notna().sum() if "Variedad" in long_all.columns else 0
         id_valid = long_all["ID_tachada"].notna().sum() if "ID_tachada" in long_all.columns else 0
-        print(f"   📊 Estado de columnas de laboratorio antes del pivot:")
-        print(f"      Variedad: {var_valid}/{total_rows} válidos")
-        print(f"      ID_tachada: {id_valid}/{total_rows} válidos")
+        logger.debug("   📊 Estado de columnas de laboratorio antes del pivot:")
+        logger.debug("      Variedad: %d/%d válidos", var_valid, total_rows)
+        logger.debug("      ID_tachada: %d/%d válidos", id_valid, total_rows)
         if var_valid == 0 and id_valid == 0:
-            print(f"      ⚠️ ADVERTENCIA: Ninguna variedad o ID_tachada válida antes del pivot")
-            print(f"         Esto puede indicar que el cruce con laboratorio no funcionó correctamente")
+            logger.warning(
+                "to_wide: Ninguna variedad o ID_tachada válida antes del pivot; "
+                "esto puede indicar que el cruce con laboratorio no funcionó correctamente"
+            )
     
-    logger.debug(f"to_wide: key_cols final: {key_cols}")
-    logger.debug(f"to_wide: Tipos de datos de key_cols:\n{long_all[key_cols].dtypes}")
+    if debug:
+        logger.debug(f"to_wide: key_cols final: {key_cols}")
+        logger.debug(f"to_wide: Tipos de datos de key_cols:\n{long_all[key_cols].dtypes}")
     
     # 2) Normalizar variable (EXACTO como notebook)
-    svar = (
-        long_all["variable"]
-        .astype(str)
-        .str.upper()
-        .str.replace(r"[\s_\.\-]", "", regex=True)
-    )
+    var_codes, var_norm_cats = _variable_codes(long_all["variable"])
     
     # Aliases EXACTOS del notebook (JPV: VOLT_HUME, VOLT_TEMP; RB: V_HUM, V_TEM)
     hum_aliases = {"VOLTHUM", "VOLTHUME", "VHUM"}  # JPV: VOLT_HUME, RB: V_HUM
     tem_aliases = {"VOLTTEM", "VOLTTEMP", "VTEM", "VTEMP"}  # JPV: VOLT_TEMP, RB: V_TEM
     drop_aliases = {"HUMEDAD", "TEMPERATURA", "OFFSET", "VARIEDAD"}  # No incluir en wide
     
-    mask_hum = svar.isin(hum_aliases)
-    mask_tem = svar.isin(tem_aliases)
-    mask_drop = svar.isin(drop_aliases)
-    
-    # LOGGING CRÍTICO (usar print para visibilidad):
-    print(f"   📊 Análisis de variables en long_all:")
-    print(f"      Total registros: {len(long_all)}")
-    print(f"      Variables únicas originales: {long_all['variable'].nunique()}")
-    print(f"      Muestra variables: {list(long_all['variable'].unique()[:10])}")
-    print(f"      Variables normalizadas únicas: {svar.nunique()}")
-    print(f"      Muestra normalizadas: {list(svar.unique()[:10])}")
-    print(f"      Match HUMEDAD: {mask_hum.sum()} registros")
-    print(f"      Match TEMPERATURA: {mask_tem.sum()} registros")
-    print(f"      Descartadas: {mask_drop.sum()} registros")
+    mask_hum = _alias_mask(var_codes, var_norm_cats, hum_aliases)
+    mask_tem = _alias_mask(var_codes, var_norm_cats, tem_aliases)
+    mask_drop = _alias_mask(var_codes, var_norm_cats, drop_aliases)
+    
+    if debug:
+        svar_unique = pd.unique(var_norm_cats[np.unique(var_codes)])
+        logger.debug("   📊 Análisis de variables en long_all:")
+        logger.debug("      Total registros: %d", len(long_all))
+        logger.debug("      Variables únicas originales: %d", long_all["variable"].nunique())
+        logger.debug("      Muestra variables: %s", list(long_all["variable"].unique()[:10]))
+        logger.debug("      Variables normalizadas únicas: %d", len(svar_unique))
+        logger.debug("      Muestra normalizadas: %s", list(svar_unique[:10]))
+        logger.debug("      Match HUMEDAD: %d registros", mask_hum.sum())
+        logger.debug("      Match TEMPERATURA: %d registros", mask_tem.sum())
+        logger.debug("      Descartadas: %d registros", mask_drop.sum())
     
     # VALIDACIÓN CRÍTICA:
     keep_mask = (mask_hum | mask_tem) & (~mask_drop)
     
     if keep_mask.sum() == 0:
         logger.error(f"❌ NINGUNA variable coincide con aliases esperados!")
-        logger.error(f"   Variables encontradas: {list(svar.unique())}")
+        logger.error(f"   Variables encontradas: {list(pd.unique(var_norm_cats[np.unique(var_codes)]))}")
         logger.error(f"   Aliases esperados HUM: {hum_aliases}")
         logger.error(f"   Aliases esperados TEM: {tem_aliases}")
         # Retornar DataFrame vacío pero con estructura
@@ -628,79 +813,69 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
     
     logger.info(f"   Registros a procesar: {keep_mask.sum()}")
     
-    long_v = long_all[keep_mask].copy()
-    
-    # Verificar si hay filas válidas después del filtro
-    if long_v.empty:
-        logger.warning("to_wide: long_v está vacío después del filtro de variables de voltaje")
-        return pd.DataFrame(columns=key_cols + ["VOLT_HUM", "VOLT_TEM"])
-    
     # -----------------------------------------------------------------
     # FILTRAR filas cuya Variedad sea 'nan' (string) o None (NaN)
     # Estos registros no coincidieron con ningún intervalo del laboratorio y no se pueden calibrar.
-    if 'Variedad' in long_v.columns:
-        # Asegurarse de que la columna sea string para comparar con 'nan'
-        variedad_str = long_v['Variedad'].astype(str)
+    # La máscara de Variedad se combina con la de voltajes y se copia long_all una sola vez.
+    final_mask = keep_mask
+    if 'Variedad' in long_all.columns:
+        # Asegurarse de que la columna sea string para comparar con 'nan' (solo filas de voltaje)
+        variedad_str = long_all.loc[keep_mask, 'Variedad'].astype(str)
         mask_valid_variedad = (variedad_str.notna()) & (variedad_str.str.lower() != 'nan') & (variedad_str.str.lower() != 'none')
         
         # Loggear cuántas filas de voltaje se descartan por falta de variedad
-        descartados = len(long_v) - mask_valid_variedad.sum()
+        descartados = len(variedad_str) - mask_valid_variedad.sum()
         if descartados > 0:
-            logger.warning(f"to_wide: Descartando {descartados}/{len(long_v)} filas de voltaje sin cruce de laboratorio (Variedad es 'nan' o 'None')")
-            
-        long_v = long_v[mask_valid_variedad].copy()
+            logger.warning(f"to_wide: Descartando {descartados}/{len(variedad_str)} filas de voltaje sin cruce de laboratorio (Variedad es 'nan' o 'None')")
         
-        # Verificar si quedan filas después del filtro
-        if long_v.empty:
-            logger.warning("to_wide: long_v está vacío después de filtrar filas sin Variedad válida")
-            return pd.DataFrame(columns=key_cols + ["VOLT_HUM", "VOLT_TEM"])
+        final_mask = keep_mask.copy()
+        final_mask[keep_mask] = mask_valid_variedad.to_numpy()
+    
+    long_v = long_all[final_mask].copy()
+    
+    # Verificar si quedan filas después del filtro
+    if long_v.empty:
+        logger.warning("to_wide: long_v está vacío después de filtrar filas sin Variedad válida")
+        return pd.DataFrame(columns=key_cols + ["VOLT_HUM", "VOLT_TEM"])
     # -----------------------------------------------------------------
     
     long_v = normalize_timestamp(long_v, "timestamp")
     
     # 3) Nombre normalizado + escala RB
-    # IMPORTANTE: Recalcular máscaras usando long_v["variable"] ya que long_v es un DataFrame filtrado
-    # con índices diferentes a long_all. No podemos usar mask_hum[keep_mask] directamente.
-    
-    # Canonicalizar variable en long_v (igual que en long_all)
-    svar_v = (
-        long_v["variable"]
-        .astype(str)
-        .str.upper()
-        .str.replace(r"[\s_\.\-]", "", regex=True)
-    )
-    
-    # Aliases para voltajes
-    hum_aliases = {"VOLTHUM", "VOLTHUME", "VHUM"}
-    tem_aliases = {"VOLTTEM", "VOLTTEMP", "VTEM", "VTEMP"}
-    
-    # Crear máscaras en long_v
-    mask_hum_final = svar_v.isin(hum_aliases)
-    mask_tem_final = svar_v.isin(tem_aliases)
+    # long_v conserva las filas de long_all seleccionadas por final_mask en el mismo orden
+    # (normalize_timestamp no descarta filas), así que la máscara posicional se reutiliza tal cual
+    # en lugar de volver a normalizar long_v["variable"].
+    mask_hum_final = mask_hum[final_mask]
     
-    # Asignar var_norm usando las máscaras recalculadas
+    # Asignar var_norm usando la máscara de long_all restringida a long_v
     long_v["var_norm"] = np.where(mask_hum_final, "VOLT_HUM", "VOLT_TEM")
     
     # Escala RB: dividir por 100 SOLO si es RB (RB_VOLT_SCALE = 0.01)
-    scale = np.where(long_v["planta"].eq("RB"), 0.01, 1.0)  # RB_VOLT_SCALE = 0.01
-    long_v["valor_norm"] = pd.to_numeric(long_v["valor"], errors="coerce") * scale
-    
-    # VALIDACIÓN valores escalados (usar print para visibilidad):
-    valores_validos = long_v["valor_norm"].notna().sum()
-    valores_no_cero = (long_v["valor_norm"] != 0).sum()
-    print(f"      Valores escalados válidos: {valores_validos}/{len(long_v)}")
-    print(f"      Valores no-cero: {valores_no_cero}")
-    if valores_validos > 0:
-        print(
-            f"      Rango: min={long_v['valor_norm'].min():.4f}, "
-            f"max={long_v['valor_norm'].max():.4f}, "
-            f"mean={long_v['valor_norm'].mean():.4f}"
-        )
-    
-    if valores_no_cero == 0:
-        print(f"      ❌ ADVERTENCIA: TODOS los valores escalados son 0!")
-        print(f"         Muestra valores pre-escala: {long_v['valor'].head(10).tolist()}")
-        print(f"         Muestra valores post-escala: {long_v['valor_norm'].head(10).tolist()}")
+    planta_v = long_v["planta"]
+    if isinstance(planta_v.dtype, pd.CategoricalDtype):
+        # Escala por código de categoría (el último elemento cubre el código -1 de faltantes)
+        scale_by_code = np.append(np.where(planta_v.cat.categories == "RB", RB_VOLT_SCALE, 1.0), 1.0)
+        scale = scale_by_code[planta_v.cat.codes.to_numpy()]
+    else:
+        scale = np.where(planta_v.eq("RB"), RB_VOLT_SCALE, 1.0)
+    long_v["valor_norm"] = pd.to_numeric(long_v["valor"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan) * scale
+    
+    # VALIDACIÓN valores escalados (solo en DEBUG)
+    if debug:
+        valores_validos = long_v["valor_norm"].notna().sum()
+        valores_no_cero = (long_v["valor_norm"] != 0).sum()
+        logger.debug("      Valores escalados válidos: %d/%d", valores_validos, len(long_v))
+        logger.debug("      Valores no-cero: %d", valores_no_cero)
+        if valores_validos > 0:
+            logger.debug(
+                "      Rango: min=%.4f, max=%.4f, mean=%.4f",
+                long_v["valor_norm"].min(), long_v["valor_norm"].max(), long_v["valor_norm"].mean(),
+            )
+        
+        if valores_no_cero == 0:
+            logger.warning("to_wide: TODOS los valores escalados son 0!")
+            logger.debug("         Muestra valores pre-escala: %s", long_v["valor"].head(10).tolist())
+            logger.debug("         Muestra valores post-escala: %s", long_v["valor_norm"].head(10).tolist())
     
     # Verificar que las columnas críticas existan
     # IMPORTANTE: Después de filtrar 'nan', todas las filas deberían tener Variedad válida
@@ -710,19 +885,20 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
         logger.error(f"to_wide: Faltan columnas críticas: {missing_cols}")
         return pd.DataFrame(columns=key_cols + ["VOLT_HUM", "VOLT_TEM"])
     
-    # ANTES del pivot, verificar columnas críticas con logging detallado
-    print(f"      🔍 PRE-PIVOT: Verificando columnas críticas en long_v:")
-    print(f"         Total filas después de filtrar Variedad='nan': {len(long_v)}")
-    
-    for col in base_key_cols:
-        null_count = long_v[col].isna().sum()
-        print(f"         {col}: {null_count}/{len(long_v)} NaN")
-        if null_count > 0 and null_count <= 10:
-            # Mostrar muestra de filas con NaN solo si son pocas
-            nan_rows = long_v[long_v[col].isna()].head(3)
-            print(f"            Muestra filas con NaN en {col}:")
-            print(f"               Variables: {nan_rows['variable'].tolist() if 'variable' in nan_rows.columns else 'N/A'}")
-            print(f"               Timestamps: {nan_rows['timestamp'].tolist() if 'timestamp' in nan_rows.columns else 'N/A'}")
+    # ANTES del pivot, verificar columnas críticas con logging detallado (solo en DEBUG)
+    if debug:
+        logger.debug("      🔍 PRE-PIVOT: Verificando columnas críticas en long_v:")
+        logger.debug("         Total filas después de filtrar Variedad='nan': %d", len(long_v))
+        
+        for col in base_key_cols:
+            null_count = long_v[col].isna().sum()
+            logger.debug("         %s: %d/%d NaN", col, null_count, len(long_v))
+            if null_count > 0 and null_count <= 10:
+                # Mostrar muestra de filas con NaN solo si son pocas
+                nan_rows = long_v[long_v[col].isna()].head(3)
+                logger.debug("            Muestra filas con NaN en %s:", col)
+                logger.debug("               Variables: %s", nan_rows["variable"].tolist() if "variable" in nan_rows.columns else "N/A")
+                logger.debug("               Timestamps: %s", nan_rows["timestamp"].tolist() if "timestamp" in nan_rows.columns else "N/A")
     
     # Verificar que no haya NaN en columnas críticas (base_key_cols)
     critical_mask = long_v[base_key_cols].notna().all(axis=1)
@@ -738,17 +914,22 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
                     logger.warning(f"   Columna '{col}' tiene {nan_count} NaN")
         
         # INTENTAR RELLENAR valores faltantes antes de filtrar
-        # Para columnas meta que pueden propagarse por timestamp
+        # Para columnas meta que pueden propagarse por timestamp: dentro de un grupo el valor
+        # no nulo es único, así que basta con el primero del grupo difundido vía map.
+        def _fill_from_group(col: str, by: str) -> None:
+            lookup = long_v.dropna(subset=[col]).groupby(by, observed=True, sort=False)[col].first()
+            long_v[col] = long_v[col].fillna(long_v[by].map(lookup))
+        
         for col in ["planta", "año", "sensor_id"]:
             if col in long_v.columns and long_v[col].isna().any():
-                # Intentar rellenar usando ffill/bfill agrupado por timestamp (si existe)
+                # Intentar rellenar desde el mismo timestamp (si existe)
                 if "timestamp" in long_v.columns:
-                    long_v[col] = long_v.groupby("timestamp", dropna=False)[col].transform(lambda x: x.ffill().bfill())
+                    _fill_from_group(col, "timestamp")
                     # Si aún hay NaN, intentar por variable
                     if long_v[col].isna().any():
-                        long_v[col] = long_v.groupby("variable", dropna=False)[col].transform(lambda x: x.ffill().bfill())
+                        _fill_from_group(col, "variable")
                 else:
-                    long_v[col] = long_v.groupby("variable", dropna=False)[col].transform(lambda x: x.ffill().bfill())
+                    _fill_from_group(col, "variable")
         
         # Para timestamp, si hay NaN, intentar inferirlo desde otras columnas de tiempo
         if "timestamp" in long_v.columns and long_v["timestamp"].isna().any():
@@ -783,26 +964,37 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
         if still_invalid > 0:
             logger.warning(f"to_wide: Después de rellenar, aún quedan {still_invalid}/{len(long_v)} filas con NaN en columnas críticas")
             # SOLO filtrar si realmente no se pueden rellenar
-            long_v = long_v[critical_mask].copy()
+            long_v = long_v[critical_mask]
             if long_v.empty:
                 logger.error("to_wide: No quedan filas válidas después de intentar rellenar y filtrar NaN en columnas críticas")
                 return pd.DataFrame(columns=key_cols + ["VOLT_HUM", "VOLT_TEM"])
         else:
-            print(f"      ✅ Todas las columnas críticas rellenadas correctamente")
+            logger.debug("      ✅ Todas las columnas críticas rellenadas correctamente")
     
     # 4) Pivot usando solo las claves base
     # Usar 'long_v' que ya está filtrado (sin 'nan' en Variedad y sin NaN en columnas críticas)
-    print(f"      🔄 Ejecutando pivot con {len(long_v)} filas válidas...")
+    logger.debug("      🔄 Ejecutando pivot con %d filas válidas...", len(long_v))
     try:
-        wide = (
-            long_v.pivot_table(
-                index=key_cols,
-                columns="var_norm",
-                values="valor_norm",
-                aggfunc="first",
+        # Equivale a pivot_table(aggfunc="first") sin pasar por GroupBy: cada columna de
+        # voltaje es el primer valor no nulo por clave, y las dos se unen por clave
+        is_hum = long_v["var_norm"].to_numpy() == "VOLT_HUM"
+        parts = []
+        for var_name, var_mask in (("VOLT_HUM", is_hum), ("VOLT_TEM", ~is_hum)):
+            part = (
+                long_v.loc[var_mask, key_cols + ["valor_norm"]]
+                .dropna(subset=key_cols + ["valor_norm"])
+                .drop_duplicates(subset=key_cols, keep="first")
+                .rename(columns={"valor_norm": var_name})
             )
-            .reset_index()
-        )
+            if not part.empty:
+                parts.append(part)
+        if not parts:
+            wide = pd.DataFrame(columns=key_cols)
+        elif len(parts) == 1:
+            wide = parts[0]
+        else:
+            wide = parts[0].merge(parts[1], on=key_cols, how="outer")
+        wide = wide.sort_values(key_cols, ignore_index=True)
     except Exception as e:
         logger.error(f"to_wide: Falló el pivot principal: {e}")
         logger.error(f"to_wide: long_v shape: {long_v.shape}")
@@ -810,41 +1002,30 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame(columns=key_cols + ["VOLT_HUM", "VOLT_TEM"])
     
     # AGREGAR validación post-pivot
-    print(f"      🔍 POST-PIVOT: Estado de columnas críticas:")
-    print(f"         Shape: {wide.shape}")
-    if not wide.empty:
+    if wide.empty:
+        logger.warning("to_wide: DataFrame wide está vacío después del pivot!")
+    elif debug:
+        logger.debug("      🔍 POST-PIVOT: Estado de columnas críticas:")
+        logger.debug("         Shape: %s", wide.shape)
         for col in base_key_cols:
             if col in wide.columns:
-                valid = wide[col].notna().sum()
-                print(f"         {col}: {valid}/{len(wide)} válidos")
-    else:
-        print(f"         ⚠️ ADVERTENCIA: DataFrame wide está vacío después del pivot!")
+                logger.debug("         %s: %d/%d válidos", col, wide[col].notna().sum(), len(wide))
     
     logger.info(f"✅ Pivot completado: {len(wide)} filas, {len(wide.columns)} columnas")
     
-    # Verificar valores después del pivot (usar print para visibilidad)
-    if "VOLT_HUM" in wide.columns:
-        vh_valid = wide["VOLT_HUM"].notna().sum()
-        vh_nonzero = (wide["VOLT_HUM"] != 0).sum()
-        print(f"      VOLT_HUM después pivot: {vh_valid} válidos, {vh_nonzero} no-cero")
-        if vh_valid > 0 and vh_nonzero == 0:
-            print(f"         ⚠️ ADVERTENCIA: VOLT_HUM válido pero todos son 0!")
-    if "VOLT_TEM" in wide.columns:
-        vt_valid = wide["VOLT_TEM"].notna().sum()
-        vt_nonzero = (wide["VOLT_TEM"] != 0).sum()
-        print(f"      VOLT_TEM después pivot: {vt_valid} válidos, {vt_nonzero} no-cero")
-        if vt_valid > 0 and vt_nonzero == 0:
-            print(f"         ⚠️ ADVERTENCIA: VOLT_TEM válido pero todos son 0!")
+    # Verificar valores después del pivot (solo en DEBUG)
+    if debug:
+        for volt_col in ("VOLT_HUM", "VOLT_TEM"):
+            if volt_col in wide.columns:
+                v_valid = wide[volt_col].notna().sum()
+                v_nonzero = (wide[volt_col] != 0).sum()
+                logger.debug("      %s después pivot: %d válidos, %d no-cero", volt_col, v_valid, v_nonzero)
+                if v_valid > 0 and v_nonzero == 0:
+                    logger.warning("to_wide: %s válido pero todos son 0!", volt_col)
     
     # 4.1) Adjuntar metadata del laboratorio agrupada por base_key_cols
     if meta_cols_for_merge:
-        meta_cols_by_key = (
-            long_all[base_key_cols + meta_cols_for_merge]
-            .sort_values(base_key_cols)
-            .groupby(base_key_cols, dropna=False)
-            .agg({col: _first_valid_meta for col in meta_cols_for_merge})
-            .reset_index()
-        )
+        meta_cols_by_key = _first_valid_meta_by_key(long_all[base_key_cols + meta_cols_for_merge])
         wide = wide.merge(meta_cols_by_key, on=base_key_cols, how="left")
         logger.debug(f"to_wide: Metadata anexada: {meta_cols_for_merge}")
     else:
@@ -852,13 +1033,12 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
     
     # 4.2) Reinsertar columnas HumedadInicial y HumedadFinal desde long_all si no están ya presentes
     # Esto asegura que estas columnas sobrevivan el pivot incluso si no están en meta_cols_for_merge
-    for col in ["HumedadInicial", "HumedadFinal"]:
-        if col in long_all.columns and col not in wide.columns:
-            # Agrupar por base_key_cols para obtener el valor único por timestamp
-            meta_by_key = long_all.groupby(base_key_cols)[col].first().reset_index()
-            # Merge con wide usando base_key_cols
-            wide = wide.merge(meta_by_key[base_key_cols + [col]], on=base_key_cols, how="left")
-            logger.debug(f"to_wide: Columna {col} reinsertada desde long_all")
+    missing_meta = [c for c in ["HumedadInicial", "HumedadFinal"] if c in long_all.columns and c not in wide.columns]
+    if missing_meta:
+        # Un solo groupby por base_key_cols (valor único por timestamp) y un solo merge para ambas columnas
+        meta_by_key = long_all.groupby(base_key_cols, observed=True, sort=False)[missing_meta].first().reset_index()
+        wide = wide.merge(meta_by_key, on=base_key_cols, how="left")
+        logger.debug(f"to_wide: Columnas {missing_meta} reinsertadas desde long_all")
     
     # 5) Re-anexar columnas 'raw' (las que NO están en key_cols)
     merge_keys = base_key_cols
@@ -878,7 +1058,7 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
     if raw_keep_cols:
         raw_data = (
             long_all[merge_keys + raw_keep_cols]
-            .groupby(merge_keys, as_index=False)
+            .groupby(merge_keys, as_index=False, observed=True, sort=False)
             .first()
         )
         
@@ -906,14 +1086,10 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
     wide = wide[final_cols_existing]
     
     # 7) Drop seguro de columnas 'nan' (por si quedara alguna etiqueta rara)
-    safe_cols = []
-    for c in wide.columns:
-        if isinstance(c, float) and pd.isna(c):
-            continue
-        if isinstance(c, str) and c.strip().lower() == "nan":
-            continue
-        safe_cols.append(c)
-    wide = wide[safe_cols]
+    cols = wide.columns
+    nan_label = cols.isna() | (cols.astype(str).str.strip().str.lower() == "nan")
+    if nan_label.any():
+        wide = wide.loc[:, ~nan_label]
     
     # 8) Quitar columnas no deseadas configuradas
     # IMPORTANTE: Descartar HUMEDAD y TEMPERATURA originales del sensor
@@ -927,14 +1103,7 @@ def to_wide(long_all: pd.DataFrame) -> pd.DataFrame:
         wide = wide.drop(columns=original_temp_hum, errors="ignore")
 
     # Deduplicar nombres de columnas (seguridad final)
-    if wide.columns.duplicated().any():
-        duplicated_cols = list(wide.columns[wide.columns.duplicated()])
-        logger.warning(
-            "to_wide: Se detectaron columnas duplicadas en wide: %s. "
-            "Conservando la primera aparición de cada una.",
-            duplicated_cols,
-        )
-        wide = wide.loc[:, ~wide.columns.duplicated(keep="first")]
+    wide = _dedupe_columns(wide, "to_wide")
     
     logger.info("to_wide: resultado final: %d filas, %d columnas", len(wide), wide.shape[1])
     
@@ -969,6 +1138,9 @@ def save_outputs_to_gdrive(
     output = io.BytesIO()
     
     # Intentar usar xlsxwriter, si no está disponible usar openpyxl
+    # NOTA: no se usa constant_memory de xlsxwriter: DataFrame.to_excel escribe las celdas
+    # columna por columna y ese modo solo admite filas en orden (se perderían datos).
+    # Tampoco el modo write_only de openpyxl: pd.ExcelWriter no lo expone (crea el libro él mismo).
     try:
         import xlsxwriter
         engine = "xlsxwriter"
@@ -984,100 +1156,44 @@ def save_outputs_to_gdrive(
         """Convierte todas las columnas datetime con timezone a naive"""
         if df.empty:
             return df
+        # Un solo recorrido de df.dtypes: columnas datetime con timezone y columnas object que
+        # contienen Timestamps (posiblemente con timezone) en lugar de revisar celda por celda
+        tz_cols = []
+        obj_dt_cols = []
+        for col, dtype in df.dtypes.items():
+            if isinstance(dtype, pd.DatetimeTZDtype):
+                tz_cols.append(col)
+            elif dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) == "datetime":
+                obj_dt_cols.append(col)
+        if not tz_cols and not obj_dt_cols:
+            return df
         df = df.copy()
-        for col in df.columns:
-            try:
-                # Verificar si es una columna datetime
-                if not pd.api.types.is_datetime64_any_dtype(df[col]):
-                    continue
-                
-                # Convertir a datetime si no lo es
-                ts = pd.to_datetime(df[col], errors="coerce")
-                
-                # Convertir TODOS los valores datetime a naive (forzar)
-                # Usar apply para convertir cada valor individualmente si tiene timezone
-                def convert_val(val):
-                    if pd.isna(val):
-                        return val
-                    try:
-                        if hasattr(val, "tz") and val.tz is not None:
-                            return val.tz_convert("UTC").tz_localize(None)
-                        return val
-                    except Exception:
-                        return val
-                
-                df[col] = ts.apply(convert_val)
-            except Exception as e:
-                # Si falla, intentar conversión directa de la serie
-                try:
-                    if pd.api.types.is_datetime64_any_dtype(df[col]):
-                        ts = pd.to_datetime(df[col], errors="coerce")
-                        # Intentar convertir toda la serie de una vez
-                        try:
-                            df[col] = ts.dt.tz_convert("UTC").dt.tz_localize(None)
-                        except (TypeError, AttributeError):
-                            # Si no tiene timezone, dejar como está
-                            df[col] = ts
-                except Exception:
-                    pass
+        # Pasar a UTC y quitar la zona en una sola operación vectorizada por columna
+        for col in tz_cols:
+            df[col] = df[col].dt.tz_convert("UTC").dt.tz_localize(None)
+        for col in obj_dt_cols:
+            df[col] = pd.to_datetime(df[col], utc=True, errors="coerce").dt.tz_localize(None)
         return df
     
     wide = _convert_timezone_aware_to_naive(wide)
     if not log_df.empty:
         log_df = _convert_timezone_aware_to_naive(log_df)
     if not qa.empty:
+        # fechas_min/fechas_max incluidas (datetime con timezone u object con Timestamps)
         qa = _convert_timezone_aware_to_naive(qa)
-        # Asegurar que fechas_min y fechas_max estén en formato naive
-        for col in ["fechas_min", "fechas_max"]:
-            if col in qa.columns:
-                try:
-                    ts = pd.to_datetime(qa[col], errors="coerce")
-                    # Convertir a naive si tiene timezone
-                    if ts.dtype.name.startswith("datetime64[ns, UTC]") or (
-                        hasattr(ts.dtype, "tz") and ts.dtype.tz is not None
-                    ):
-                        qa[col] = ts.dt.tz_convert("UTC").dt.tz_localize(None)
-                    else:
-                        # Verificar valores individuales
-                        qa[col] = ts.apply(lambda x: x.tz_convert("UTC").tz_localize(None) if hasattr(x, "tz") and x.tz is not None and not pd.isna(x) else x)
-                except Exception:
-                    pass
     
     # NUEVO: ELIMINAR COLUMNAS DUPLICADAS ANTES DE GUARDAR
     print(f"   🔍 Limpiando columnas duplicadas en wide...")
     
-    # 1. Identificar columnas duplicadas
-    cols_before = list(wide.columns)
-    
-    # 2. Eliminar duplicados usando pandas (más robusto)
-    duplicated_mask = wide.columns.duplicated(keep='first')
-    if duplicated_mask.any():
-        duplicated_cols = wide.columns[duplicated_mask].tolist()
-        print(f"      ⚠️  Eliminando {len(duplicated_cols)} columnas duplicadas: {list(set(duplicated_cols))}")
-        wide = wide.loc[:, ~duplicated_mask]
-    
-    # 3. Verificar que no queden duplicados
-    duplicated_cols = [col for col in wide.columns if wide.columns.tolist().count(col) > 1]
-    if duplicated_cols:
-        print(f"      ❌ ADVERTENCIA: Aún quedan columnas duplicadas: {list(set(duplicated_cols))}")
-        # Forzar eliminación usando drop_duplicates en columnas
-        wide = wide.loc[:, ~wide.columns.duplicated(keep='first')]
-    
-    print(f"      ✅ Columnas después de limpieza: {len(wide.columns)} (antes: {len(cols_before)})")
+    cols_before = len(wide.columns)
+    wide = _dedupe_columns(wide, "save_outputs_to_gdrive")
+    print(f"      ✅ Columnas después de limpieza: {len(wide.columns)} (antes: {cols_before})")
     
     # VALIDACIÓN FINAL: Verificar estructura del DataFrame
     print(f"   📊 Estructura final del archivo Excel:")
     print(f"      Total filas: {len(wide)}")
     print(f"      Total columnas: {len(wide.columns)}")
     
-    # Verificar duplicados una última vez
-    duplicated_cols = [col for col in wide.columns if wide.columns.tolist().count(col) > 1]
-    if duplicated_cols:
-        print(f"      ❌ ERROR: Columnas duplicadas encontradas: {list(set(duplicated_cols))}")
-        # Forzar eliminación
-        wide = wide.loc[:, ~wide.columns.duplicated(keep='first')]
-        print(f"      ✅ Duplicados eliminados. Columnas finales: {len(wide.columns)}")
-    
     # Mostrar columnas en orden
     expected_order = [
         "planta", "año", "sensor_id", "timestamp", "Variedad", "ID_tachada",
@@ -1097,85 +1213,28 @@ def save_outputs_to_gdrive(
         wide_cols_final = [c for c in wide_cols_order if c in wide.columns]
         # Agregar cualquier columna adicional que no esté en el orden
         wide_cols_final.extend([c for c in wide.columns if c not in wide_cols_final])
-        wide_ordered = wide[wide_cols_final]
+        # reindex sin copia (columnas ya deduplicadas): comparte los bloques de wide
+        wide_ordered = wide.reindex(columns=wide_cols_final, copy=False)
         wide_ordered.to_excel(writer, sheet_name="datos_wide", index=False)
         
         # Diccionario (formato exacto del archivo de ejemplo)
         # Solo incluir las columnas que realmente están en datos_wide
-        dicc_cols = []
-        dicc_desc = []
-        
-        for col, desc in [
-            ("planta", "Planta origen (JPV)" if planta == "JPV" else "Planta origen (RB)"),
-            ("año", "Año"),
-            ("tirada_num", "N° tirada (si estaba)"),
-            ("tirada_fecha", "Fecha tirada"),
-            ("sensor_id", "ID sensor"),
-            ("timestamp", "Timestamp unificado"),
-        ]:
-            if col in wide.columns:
-                dicc_cols.append(col)
-                dicc_desc.append(desc)
-        
-        # Agregar columnas específicas según tipo de planta
-        if planta == "JPV":
-            if "TimeString" in wide.columns:
-                dicc_cols.append("TimeString")
-                dicc_desc.append("Tiempo crudo JPV")
-        else:  # RB
-            if "Date_raw" in wide.columns:
-                dicc_cols.append("Date_raw")
-                dicc_desc.append("Fecha cruda RB")
-            if "LOC_time_raw" in wide.columns:
-                dicc_cols.append("LOC_time_raw")
-                dicc_desc.append("Hora local cruda RB")
-        
-        # Voltajes (como en el notebook: menciona V_HUM/V_TEM pero las columnas son VOLT_HUM/VOLT_TEM)
-        if "VOLT_HUM" in wide.columns:
-            dicc_cols.append("VOLT_HUM")
-            dicc_desc.append("Voltaje humedad" if planta == "JPV" else "Voltaje humedad (÷100)")
-        if "VOLT_TEM" in wide.columns:
-            dicc_cols.append("VOLT_TEM")
-            dicc_desc.append("Voltaje temperatura" if planta == "JPV" else "Voltaje temperatura (÷100)")
-        
-        # Valores calibrados
-        if "TEMPERATURA" in wide.columns:
-            dicc_cols.append("TEMPERATURA")
-            dicc_desc.append("Temperatura (°C) - calculada desde curvas de calibración")
-        if "HUMEDAD" in wide.columns:
-            dicc_cols.append("HUMEDAD")
-            dicc_desc.append("Humedad (%) - calculada desde curvas de calibración")
-        
-        # Columnas de laboratorio
-        if "Variedad" in wide.columns:
-            dicc_cols.append("Variedad")
-            dicc_desc.append("Variedad de arroz (cruzada con laboratorio)")
-        if "ID_tachada" in wide.columns:
-            dicc_cols.append("ID_tachada")
-            dicc_desc.append("ID de tachada (cruzada con laboratorio)")
-        if "DESCARTAR" in wide.columns:
-            dicc_cols.append("DESCARTAR")
-            dicc_desc.append("Flag de descarte (cruzada con laboratorio)")
-        
-        # Metadata de archivos
-        if "source_file" in wide.columns:
-            dicc_cols.append("source_file")
-            dicc_desc.append("Archivo fuente")
-        if "source_path" in wide.columns:
-            dicc_cols.append("source_path")
-            dicc_desc.append("Ruta fuente")
-        
-        dicc = pd.DataFrame({
-            "columna": dicc_cols,
-            "descripcion": dicc_desc,
-        })
+        wide_cols_set = set(wide.columns)
+        desc_idx = 1 if planta == "JPV" else 2
+        dicc = pd.DataFrame(
+            [
+                (spec[0], spec[desc_idx])
+                for spec in _DICC_SPEC
+                if spec[desc_idx] is not None and spec[0] in wide_cols_set
+            ],
+            columns=["columna", "descripcion"],
+        )
         dicc.to_excel(writer, sheet_name="diccionario", index=False)
         
         # QA resumen (formato exacto del archivo de ejemplo)
         qa.to_excel(writer, sheet_name="qa_resumen", index=False)
     
-    output.seek(0)
-    excel_bytes = output.read()
+    excel_bytes = output.getvalue()
     
     # Subir a Google Drive
     upload_result = gdrive.upload_file(
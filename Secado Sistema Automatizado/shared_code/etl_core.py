@@ -8,9 +8,36 @@ import pandas as pd
 
 from shared_code.time_utils import normalize_timestamp
 
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    _CSV_ENGINE = "pyarrow"
+    _STRING_DTYPE = "string[pyarrow]"  # texto en búferes Arrow contiguos
+except ImportError:  # sin pyarrow, se usa el parser python de pandas
+    _CSV_ENGINE = None
+    _STRING_DTYPE = None
+
 
 logger = logging.getLogger(__name__)
 
+# Regex precompiladas (se evalúan por archivo, por columna o sobre columnas enteras)
+_RE_CANON = re.compile(r"[\s\-\.\(\)]")
+_RE_VAR_PREFIX = re.compile(r"^\d+_")
+_RE_SENSOR_NUM = re.compile(r"SENSOR\s*([0-9]+)", re.IGNORECASE)
+_RE_JPV = re.compile(r"\bJPV\b", re.IGNORECASE)
+_RE_RB = re.compile(r"\bRB\b", re.IGNORECASE)
+_RE_YEAR = re.compile(r"\b(20[0-9]{2})\b")
+# Número con coma decimal ("45,2", "-3,75"): se reescribe con punto antes de to_numeric
+_RE_DECIMAL_COMMA = re.compile(r"^(-?\d+),(\d+)$")
+# Nombres de columna RB (en minúsculas) de fecha, hora y voltajes (sin '_' ni '-')
+_RB_DATE_NAMES = frozenset(("date", "fecha"))
+_RB_TIME_NAMES = frozenset(("time", "hora", "loc_time", "loctime", "localtime", "localtiempo"))
+_RB_VALUE_NAMES = {"vhum": "VOLT_HUM", "vtem": "VOLT_TEM", "vtemp": "VOLT_TEM"}
+# Variables que produce read_rb_csv (categoría: un código entero por fila)
+_RB_VARIABLE_DTYPE = pd.CategoricalDtype(["VOLT_HUM", "VOLT_TEM"])
+# Formato habitual de los timestamps de sensores; si no aplica se infiere con dateutil
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 
 def _decode_bytes(content: bytes) -> str:
     """
@@ -27,9 +54,150 @@ def _decode_bytes(content: bytes) -> str:
     return content.decode("utf-8", errors="ignore")
 
 
+def _sniff_encoding(content: bytes) -> str:
+    """
+    Pick the encoding of a sensor file from its BOM (one decode instead of trial and error).
+
+    UTF-16 without BOM is recognised by the NUL high byte of the first ASCII character.
+    """
+    if content[:2] in (b"\xff\xfe", b"\xfe\xff"):
+        return "utf-16"
+    if content[:3] == b"\xef\xbb\xbf":
+        return "utf-8-sig"
+    if content[1:2] == b"\x00":
+        return "utf-16-le"
+    return "utf-8"
+
+
+def _read_delimited_arrow(raw: bytes, sep: str, encoding: str) -> pd.DataFrame:
+    """
+    Parse with pyarrow.csv keeping every column as text (``string[pyarrow]``).
+
+    Arrow would otherwise infer date32/time32/timestamp/int columns for the raw
+    trace columns (Date_raw, LOC_time_raw, TimeString, ...), which must keep the
+    file's text; the conversions happen later in _to_datetime / to_numeric.
+    """
+    read_options = pa_csv.ReadOptions(encoding=encoding)
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    # Los nombres de columna salen del primer bloque; luego se fijan todas como string
+    names = pa_csv.open_csv(
+        io.BytesIO(raw), read_options=read_options, parse_options=parse_options
+    ).schema.names
+    if len(set(names)) != len(names):
+        # Nombres repetidos: el engine C los desambigua ("X", "X.1")
+        raise ValueError("columnas con nombre repetido")
+    convert_options = pa_csv.ConvertOptions(
+        column_types=dict.fromkeys(names, pa.string()), strings_can_be_null=True
+    )
+    table = pa_csv.read_csv(
+        io.BytesIO(raw),
+        read_options=read_options,
+        parse_options=parse_options,
+        convert_options=convert_options,
+    )
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+def _read_delimited(data, sep: str, encoding: Optional[str] = None, **kwargs) -> pd.DataFrame:
+    """
+    Read delimited text, using the (multithreaded) Arrow CSV parser when available.
+
+    ``data`` may be decoded text or raw bytes plus their ``encoding``; bytes are
+    handed to the parser as-is so the decode happens inside pandas/Arrow.
+
+    Arrow is strict with malformed rows, so any parse error falls back to the
+    C engine with the caller's options (e.g. ``on_bad_lines="skip"``); the python
+    engine is only used if the C tokenizer raises a ``ParserError``.
+    """
+    is_bytes = isinstance(data, bytes)
+    if is_bytes:
+        encoding = encoding or "utf-8"
+
+    def _buffer():
+        return io.BytesIO(data) if is_bytes else io.StringIO(data)
+
+    if _CSV_ENGINE == "pyarrow":
+        try:
+            return _read_delimited_arrow(
+                data if is_bytes else data.encode("utf-8"), sep, encoding or "utf-8"
+            )
+        except Exception as e:
+            logger.debug("Arrow CSV parser falló (%s); usando engine C", e)
+    try:
+        return pd.read_csv(
+            _buffer(), sep=sep, encoding=encoding, engine="c", low_memory=False, **kwargs
+        )
+    except pd.errors.ParserError as e:
+        logger.debug("C CSV parser falló (%s); usando engine python", e)
+    return pd.read_csv(_buffer(), sep=sep, encoding=encoding, engine="python", **kwargs)
+
+
+def _normalize_decimal_comma(values: pd.Series) -> pd.Series:
+    """Strip values and swap the decimal comma for a dot where the value looks numeric."""
+    return values.astype(str).str.strip().str.replace(_RE_DECIMAL_COMMA, r"\1.\2", regex=True)
+
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """
+    Parse timestamps with the C-level fixed-format parser, falling back to inference.
+
+    ``cache=True`` parses each distinct string once (sensor logs repeat timestamps
+    across variables).
+    """
+    try:
+        return pd.to_datetime(values, format=_TIMESTAMP_FORMAT, errors="raise", cache=True)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values, errors="coerce", dayfirst=False, cache=True)
+
+
+def _log_value_stats(
+    label: str,
+    filename: str,
+    valor: pd.Series,
+    raw: pd.Series,
+    normalized: pd.Series,
+    scale_note: str = "",
+) -> None:
+    """Log (DEBUG) how many values survived the numeric conversion, with samples if none did."""
+    valid = valor.notna()
+    n_valid = int(valid.sum())
+    n_nonzero = int((valid & (valor != 0)).sum())
+    logger.debug(
+        "%s '%s': %d/%d valores válidos, %d no-cero", label, filename, n_valid, len(valor), n_nonzero
+    )
+    if n_valid == 0:
+        logger.debug(
+            "%s '%s': ningún valor válido. Muestra original: %s; después de str.strip: %s",
+            label, filename, raw.head(10).tolist(), normalized.head(10).tolist(),
+        )
+    elif n_nonzero == 0:
+        logger.debug(
+            "%s '%s': todos los valores convertidos son 0. Muestra original: %s; convertidos%s: %s",
+            label, filename, raw.head(10).tolist(), scale_note, valor.head(10).tolist(),
+        )
+    else:
+        logger.debug(
+            "%s '%s': Rango valores%s: min=%.4f, max=%.4f, mean=%.4f",
+            label, filename, scale_note, valor.min(), valor.max(), valor.mean(),
+        )
+
+
+def _rows_with_timestamp(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    """
+    Select ``cols`` for the rows with a valid timestamp, with a fresh RangeIndex.
+
+    The column reindex shares blocks and ``take`` is the only data copy; the new
+    index is assigned directly instead of a ``reset_index`` that copies again.
+    """
+    rows = np.flatnonzero(df["timestamp"].notna().to_numpy())
+    out = df.reindex(columns=cols, copy=False).take(rows)
+    out.index = pd.RangeIndex(len(out))
+    return out
+
+
 def _canon(s: str) -> str:
     """Normaliza string: mayúsculas, sin espacios/guiones/puntos/paréntesis"""
-    return re.sub(r"[\s\-\.\(\)]", "", str(s).upper())
+    return _RE_CANON.sub("", str(s).upper())
 
 
 def _parse_datetime_columns(df: pd.DataFrame, filename: str) -> pd.Series:
@@ -41,7 +209,7 @@ def _parse_datetime_columns(df: pd.DataFrame, filename: str) -> pd.Series:
     """
     # Para JPV: buscar TimeString explícitamente
     if "TimeString" in df.columns:
-        ts = pd.to_datetime(df["TimeString"], errors="coerce", dayfirst=False)
+        ts = _to_datetime(df["TimeString"])
         if ts.notna().any():
             return ts
     
@@ -54,30 +222,33 @@ def _parse_datetime_columns(df: pd.DataFrame, filename: str) -> pd.Series:
         "fecha_hora",
         "timestring",  # lowercase version
     ]
-    lower_cols = {c.lower(): c for c in df.columns}
-    for lc in candidates_single:
-        if lc in lower_cols:
-            ts = pd.to_datetime(df[lower_cols[lc]], errors="coerce", dayfirst=False)
-            if ts.notna().any():
-                return ts
-
-    # Try separate date and time columns (RB) - usando _canon() como en el notebook
+    # Un solo recorrido de las columnas: nombre en minúsculas (candidatos únicos) y
+    # columnas de fecha/hora separadas (RB) - usando _canon() como en el notebook
+    lower_cols = {}
     date_col = None
     lt_col = None
     for c in df.columns:
+        lower_cols[str(c).lower()] = c
         cc = _canon(c)
         if cc in ("DATE", "FECHA"):
             date_col = c
         if cc in ("LOCTIME", "LOCTIEMPO", "LOCALTIME"):
             lt_col = c
-    
+
+    for lc in candidates_single:
+        if lc in lower_cols:
+            ts = pd.to_datetime(df[lower_cols[lc]], errors="coerce", dayfirst=False)
+            if ts.notna().any():
+                return ts
+
+    # Try separate date and time columns (RB)
     if date_col and lt_col:
         dt = (
             df[date_col].astype(str).str.strip()
             + " "
             + df[lt_col].astype(str).str.strip()
         )
-        ts = pd.to_datetime(dt, errors="coerce", dayfirst=False)
+        ts = _to_datetime(dt)
         return ts
     elif date_col:
         ts = pd.to_datetime(df[date_col], errors="coerce", dayfirst=False)
@@ -104,31 +275,35 @@ def read_jpv_txt(file_content: bytes, filename: str) -> pd.DataFrame:
     >>> set(df.columns) == {"timestamp", "variable", "valor"}
     True
     """
-    # Intentos de lectura con diferentes codificaciones y delimitadores
-    # JPV usa típicamente tabulaciones y UTF-16
-    tried = [
-        ("utf-16", "\t"),
-        ("utf-16le", "\t"),
-        ("utf-8", "\t"),
-    ]
-    
+    # JPV usa típicamente tabulaciones y UTF-16: la codificación se detecta por el BOM y
+    # los bytes se parsean directamente (sin decodificar el archivo en Python)
     df = None
     last_err = None
     
-    for enc, sep in tried:
-        try:
-            text = file_content.decode(enc)
-            buf = io.StringIO(text)
-            df = pd.read_csv(
-                buf,
-                sep=sep,
-                engine="python",
-                on_bad_lines="skip",  # Saltar líneas malformadas
-            )
-            break
-        except (UnicodeDecodeError, Exception) as e:
-            last_err = e
-            continue
+    try:
+        df = _read_delimited(
+            file_content,
+            "\t",
+            encoding=_sniff_encoding(file_content),
+            on_bad_lines="skip",  # Saltar líneas malformadas
+        )
+    except UnicodeDecodeError as e:
+        last_err = e
+        # Codificación mal detectada: intentos de lectura con diferentes codificaciones
+        for enc in ("utf-16", "utf-16le", "utf-8"):
+            try:
+                text = file_content.decode(enc)
+                df = _read_delimited(
+                    text,
+                    "\t",
+                    on_bad_lines="skip",  # Saltar líneas malformadas
+                )
+                break
+            except (UnicodeDecodeError, Exception) as e:
+                last_err = e
+                continue
+    except Exception as e:
+        last_err = e
     
     # Si falló todo, intentar con auto-detección
     if df is None:
@@ -148,9 +323,20 @@ def read_jpv_txt(file_content: bytes, filename: str) -> pd.DataFrame:
         logger.error("Failed to read JPV TXT '%s': %s", filename, last_err)
         raise last_err or RuntimeError(f"No se pudo leer {filename}")
 
-    # Filtrar metadatos ($RT_*)
+    # Columnas de texto que quedaron como object (parsers C/python) -> strings Arrow:
+    # VarName/VarValue/TimeString repiten millones de cadenas cortas
+    if _STRING_DTYPE is not None:
+        obj_cols = df.select_dtypes(include="object").columns
+        if len(obj_cols):
+            df = df.astype(dict.fromkeys(obj_cols, _STRING_DTYPE))
+
+    # Filtrar metadatos ($RT_*): sobre strings Arrow el prefijo se compara en el kernel de
+    # Arrow, sin castear la columna a str de Python
     if "VarName" in df.columns:
-        df = df[~df["VarName"].astype(str).str.startswith("$RT_")]
+        var_name = df["VarName"]
+        if not pd.api.types.is_string_dtype(var_name):
+            var_name = var_name.astype(str)
+        df = df[~var_name.str.startswith("$RT_", na=False)]
     
     # Selección mínima, preservando trazabilidad (como en el notebook)
     keep_cols = [c for c in ["VarName", "TimeString", "VarValue", "Validity", "Time_ms"] if c in df.columns]
@@ -158,7 +344,7 @@ def read_jpv_txt(file_content: bytes, filename: str) -> pd.DataFrame:
     
     # Timestamp desde TimeString (como en el notebook)
     if "TimeString" in df.columns:
-        df["timestamp"] = pd.to_datetime(df["TimeString"], errors="coerce")
+        df["timestamp"] = _to_datetime(df["TimeString"])
     else:
         # Fallback a _parse_datetime_columns si no hay TimeString
         df["timestamp"] = _parse_datetime_columns(df, filename)
@@ -166,49 +352,26 @@ def read_jpv_txt(file_content: bytes, filename: str) -> pd.DataFrame:
     # Variable normalizada y original (como en el notebook)
     if "VarName" in df.columns:
         df["VarName_original"] = df["VarName"].astype(str)
-        df["variable"] = df["VarName"].astype(str).str.replace(r"^\d+_", "", regex=True)
+        df["variable"] = df["VarName"].astype(str).str.replace(_RE_VAR_PREFIX, "", regex=True)
     else:
         df["VarName_original"] = None
         df["variable"] = "Var"
     
     # VarValue -> número (coma decimal → punto, como en el notebook)
     if "VarValue" in df.columns:
-        s = df["VarValue"].astype(str).str.strip()
-        # Cambiamos coma por punto solo si parece número con coma
-        s = pd.Series([
-            val.replace(",", ".") if re.search(r"^\s*-?\d+,\d+\s*$", val) else val
-            for val in s
-        ])
+        # Cambiamos coma por punto solo si parece número con coma (vectorizado, mismo índice que df)
+        s = _normalize_decimal_comma(df["VarValue"])
         df["valor"] = pd.to_numeric(s, errors="coerce")
         
-        # VALIDACIÓN CRÍTICA: Verificar que los valores se convirtieron correctamente
-        valores_validos = df["valor"].notna().sum()
-        valores_no_cero = (df["valor"] != 0).sum()
-        
-        # USAR print() para que sea visible siempre
-        print(f"   📊 JPV '{filename}': {valores_validos}/{len(df)} valores válidos, {valores_no_cero} no-cero")
-        
-        if valores_validos == 0:
-            print(f"   ⚠️ ADVERTENCIA: NINGÚN valor válido después de conversión en '{filename}'")
-            # Mostrar muestra de valores originales
-            print(f"      Muestra VarValue original: {df['VarValue'].head(10).tolist()}")
-            print(f"      Muestra después de str.strip: {s.head(10).tolist()}")
-        elif valores_no_cero == 0:
-            print(f"   ⚠️ ADVERTENCIA: Todos los valores convertidos son 0 en '{filename}'")
-            print(f"      Muestra VarValue original: {df['VarValue'].head(10).tolist()}")
-            print(f"      Muestra valores convertidos: {df['valor'].head(10).tolist()}")
+        # VALIDACIÓN: solo con DEBUG (evita recorrer 'valor' en cada archivo)
+        if logger.isEnabledFor(logging.DEBUG):
+            _log_value_stats("JPV", filename, df["valor"], df["VarValue"], s)
     else:
         logger.warning(f"JPV archivo '{filename}': No se encontró columna VarValue")
         df["valor"] = pd.NA
     
-    # Debug: Variables y valores de muestra
-    logger.debug(f"JPV archivo '{filename}': Variables únicas: {df['variable'].unique()[:10]}")
-    if df["valor"].notna().any():
-        logger.debug(
-            f"JPV archivo '{filename}': Rango valores: "
-            f"min={df['valor'].min():.4f}, max={df['valor'].max():.4f}, "
-            f"mean={df['valor'].mean():.4f}"
-        )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("JPV archivo '%s': Variables únicas: %s", filename, df["variable"].unique()[:10])
     
     # Retornar solo columnas necesarias
     result_cols = ["timestamp", "variable", "valor"]
@@ -219,11 +382,8 @@ def read_jpv_txt(file_content: bytes, filename: str) -> pd.DataFrame:
     if "VarValue" in df.columns:
         result_cols.append("VarValue")
     
-    out = df[[c for c in result_cols if c in df.columns]].copy()
-    # Filtrar filas sin timestamp válido
-    out = out[out["timestamp"].notna()].reset_index(drop=True)
-    
-    return out
+    # Filtrar filas sin timestamp válido y seleccionar columnas en un solo paso
+    return _rows_with_timestamp(df, [c for c in result_cols if c in df.columns])
 
 
 def read_rb_csv(file_content: bytes, filename: str) -> pd.DataFrame:
@@ -255,52 +415,49 @@ def read_rb_csv(file_content: bytes, filename: str) -> pd.DataFrame:
     """
     text = _decode_bytes(file_content)
     
-    # 1. Probar primero con separador ';' (formato común en RB)
-    buf = io.StringIO(text)
+    # 1. Detectar el separador en la cabecera (';' es el formato común en RB, si no ',')
+    #    y parsear el archivo una sola vez
+    header = text[:1024].split("\n", 1)[0]
+    sep = ";" if ";" in header else ","
     try:
-        df = pd.read_csv(buf, sep=';', engine="python")
-        # Si solo tiene 1 columna, probablemente el separador es incorrecto
-        if len(df.columns) == 1:
-            buf = io.StringIO(text)
-            df = pd.read_csv(buf, sep=',', engine="python")
-    except Exception:
-        # Si falla con ';', intentar con ','
-        try:
-            buf = io.StringIO(text)
-            df = pd.read_csv(buf, sep=',', engine="python")
-        except Exception as exc:
-            logger.error("Failed to read RB CSV '%s': %s", filename, exc)
-            raise
+        df = _read_delimited(text, sep)
+    except Exception as exc:
+        logger.error("Failed to read RB CSV '%s': %s", filename, exc)
+        raise
     
-    # 2. Detectar columnas de fecha/hora de manera robusta
+    # 2. Detectar columnas de fecha/hora y de voltaje (V_Hum, V_HUM, V_Tem, V_TEM, etc.)
+    #    de manera robusta, normalizando cada nombre una sola vez
     date_col = None
     time_col = None
+    value_cols_map = {}
     for c in df.columns:
         c_lower = str(c).lower().strip()
         # Detectar columna de fecha
-        if c_lower in ("date", "fecha"):
+        if c_lower in _RB_DATE_NAMES:
             date_col = c
         # Detectar columna de hora (más flexible)
-        if c_lower in ("time", "hora", "loc_time", "loctime", "localtime", "localtiempo"):
+        if c_lower in _RB_TIME_NAMES:
             time_col = c
+        # Voltajes: sin guiones bajos/medios, mapeados directamente a VOLT_HUM/VOLT_TEM (como JPV)
+        var = _RB_VALUE_NAMES.get(c_lower.replace("_", "").replace("-", ""))
+        if var is not None:
+            value_cols_map[c] = var
     
     # Guardar Date_raw y LOC_time_raw para consistencia (igual que JPV tiene TimeString)
     if date_col:
-        df["Date_raw"] = df[date_col].copy()
+        df["Date_raw"] = df[date_col]
     else:
         df["Date_raw"] = None
     
     if time_col:
-        df["LOC_time_raw"] = df[time_col].copy()
+        df["LOC_time_raw"] = df[time_col]
     else:
         df["LOC_time_raw"] = None
     
     # 3. Construir timestamp (igual que JPV)
     if date_col and time_col:
-        df["timestamp"] = pd.to_datetime(
-            df[date_col].astype(str).str.strip() + " " + df[time_col].astype(str).str.strip(),
-            dayfirst=False,
-            errors="coerce"
+        df["timestamp"] = _to_datetime(
+            df[date_col].astype(str).str.strip() + " " + df[time_col].astype(str).str.strip()
         )
     elif date_col:
         df["timestamp"] = pd.to_datetime(df[date_col], errors="coerce", dayfirst=False)
@@ -308,19 +465,6 @@ def read_rb_csv(file_content: bytes, filename: str) -> pd.DataFrame:
         logger.warning("No se encontraron columnas de fecha/hora en archivo RB '%s'. Columnas disponibles: %s", filename, list(df.columns))
         df["timestamp"] = pd.NaT
 
-    # 4. Detectar variables RB de manera robusta (V_Hum, V_HUM, V_Tem, V_TEM, etc.)
-    # Normalizar nombres: quitar guiones bajos y convertir a minúsculas para comparar
-    # Mapear directamente a VOLT_HUM y VOLT_TEM (como JPV)
-    value_cols_map = {}
-    for c in df.columns:
-        c_normalized = str(c).lower().replace("_", "").replace("-", "").strip()
-        # Detectar humedad: buscar "vhum" en el nombre (V_HUM)
-        if c_normalized == "vhum":
-            value_cols_map[c] = "VOLT_HUM"
-        # Detectar temperatura: buscar "vtem" en el nombre (V_TEM)
-        elif c_normalized in ("vtem", "vtemp"):
-            value_cols_map[c] = "VOLT_TEM"
-
     value_cols = list(value_cols_map.keys())
     
     # Si no encontramos columnas de voltaje, devolver estructura vacía con columnas correctas
@@ -335,66 +479,34 @@ def read_rb_csv(file_content: bytes, filename: str) -> pd.DataFrame:
         })
         return out
 
-    # 5. Melt a formato largo (igual que JPV)
+    # 5. Formato largo (igual que JPV): un bloque por columna de voltaje, ya mapeada
+    #    directamente a VOLT_HUM/VOLT_TEM (como JPV), concatenados sin pasar por melt
     id_cols = ["timestamp", "Date_raw", "LOC_time_raw"]
-    long_df = df[id_cols + value_cols].melt(
-        id_vars=id_cols,
-        var_name="variable_raw",
-        value_name="valor_raw"
+    base = df[id_cols]
+    long_df = pd.concat(
+        [base.assign(variable=var, valor_raw=df[col]) for col, var in value_cols_map.items()],
+        ignore_index=True,
     )
-    
-    # Mapear directamente a VOLT_HUM/VOLT_TEM (como JPV)
-    long_df["variable"] = long_df["variable_raw"].map(value_cols_map)
+    long_df["variable"] = long_df["variable"].astype(_RB_VARIABLE_DTYPE)
 
     # 6. Valor a numérico (coma→punto si corresponde, igual que JPV)
-    s = long_df["valor_raw"].astype(str).str.strip()
-    s = pd.Series([
-        val.replace(",", ".") if re.search(r"^\s*-?\d+,\d+\s*$", val) else val
-        for val in s
-    ])
+    s = _normalize_decimal_comma(long_df["valor_raw"])
     long_df["valor"] = pd.to_numeric(s, errors="coerce")
     
     # 7. Aplicar escala RB: dividir por 100 (RB_VOLT_SCALE = 0.01)
     # Esto equipara los valores de RB con los de JPV
     long_df["valor"] = long_df["valor"] * 0.01
     
-    # VALIDACIÓN CRÍTICA: Verificar que los valores se convirtieron correctamente
-    valores_validos = long_df["valor"].notna().sum()
-    valores_no_cero = (long_df["valor"] != 0).sum()
-    
-    # USAR print() para que sea visible siempre
-    print(f"   📊 RB '{filename}': {valores_validos}/{len(long_df)} valores válidos, {valores_no_cero} no-cero")
-    
-    if valores_validos == 0:
-        print(f"   ⚠️ ADVERTENCIA: NINGÚN valor válido en archivo RB '{filename}'")
-        print(f"      Muestra valor_raw: {long_df['valor_raw'].head(10).tolist()}")
-        print(f"      Muestra después de str.strip: {s.head(10).tolist()}")
-    elif valores_no_cero == 0:
-        print(f"   ⚠️ ADVERTENCIA: Todos los valores convertidos son 0 en archivo RB '{filename}'")
-        print(f"      Muestra valor_raw: {long_df['valor_raw'].head(10).tolist()}")
-        print(f"      Muestra valores convertidos (después de escala x0.01): {long_df['valor'].head(10).tolist()}")
-    else:
-        # Mostrar rango de valores después de aplicar escala
-        print(f"      Rango valores (después de escala x0.01): min={long_df['valor'].min():.4f}, max={long_df['valor'].max():.4f}")
-
-    # Debug: Variables y valores de muestra (igual que JPV)
-    logger.debug(f"RB archivo '{filename}': Variables únicas: {long_df['variable'].unique()[:10]}")
-    if long_df["valor"].notna().any():
-        logger.debug(
-            f"RB archivo '{filename}': Rango valores (después de escala x0.01): "
-            f"min={long_df['valor'].min():.4f}, max={long_df['valor'].max():.4f}, "
-            f"mean={long_df['valor'].mean():.4f}"
-        )
+    # VALIDACIÓN: solo con DEBUG (evita recorrer 'valor' en cada archivo)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("RB archivo '%s': Variables únicas: %s", filename, long_df["variable"].unique()[:10])
+        _log_value_stats("RB", filename, long_df["valor"], long_df["valor_raw"], s, " (después de escala x0.01)")
 
     # 9. Retornar columnas en el orden esperado (igual que JPV pero con Date_raw y LOC_time_raw)
     # Eliminar cualquier columna cruda que no se use
     result_cols = ["timestamp", "variable", "valor", "Date_raw", "LOC_time_raw"]
-    out = long_df[result_cols].copy()
-    
     # Filtrar filas sin timestamp válido (igual que JPV)
-    out = out[out["timestamp"].notna()].reset_index(drop=True)
-    
-    return out
+    return _rows_with_timestamp(long_df, result_cols)
 
 
 def extract_sensor_id_from_name(name: str) -> Optional[int]:
@@ -411,7 +523,7 @@ def extract_sensor_id_from_name(name: str) -> Optional[int]:
     >>> extract_sensor_id_from_name("RB_SENSOR4_2024.csv")
     4
     """
-    m = re.search(r"SENSOR\s*([0-9]+)", name, flags=re.IGNORECASE)
+    m = _RE_SENSOR_NUM.search(name)
     if not m:
         return None
     num = int(m.group(1))
@@ -432,14 +544,14 @@ def parse_metadata_from_path(filename: str) -> Dict[str, Any]:
     {'sensor_id': 2, 'planta': 'JPV', 'anio': 2023}
     """
     planta = None
-    if re.search(r"\bJPV\b", filename, re.IGNORECASE):
+    if _RE_JPV.search(filename):
         planta = "JPV"
-    elif re.search(r"\bRB\b", filename, re.IGNORECASE):
+    elif _RE_RB.search(filename):
         planta = "RB"
 
     sensor_id = extract_sensor_id_from_name(filename)
 
-    year_match = re.search(r"\b(20[0-9]{2})\b", filename)
+    year_match = _RE_YEAR.search(filename)
     anio = int(year_match.group(1)) if year_match else None
 
     return {"sensor_id": sensor_id, "planta": planta, "anio": anio}
@@ -480,9 +592,9 @@ def consolidate_sensor_data(
     """
     detected_planta = planta.upper().strip() if planta else None
     if detected_planta not in {"JPV", "RB"}:
-        if re.search(r"\bJPV\b", filename, re.IGNORECASE):
+        if _RE_JPV.search(filename):
             detected_planta = "JPV"
-        elif re.search(r"\bRB\b", filename, re.IGNORECASE):
+        elif _RE_RB.search(filename):
             detected_planta = "RB"
 
     if detected_planta == "JPV":
@@ -502,11 +614,16 @@ def consolidate_sensor_data(
         raise ValueError("Planta must be 'JPV' or 'RB'")
 
     meta = parse_metadata_from_path(filename)
+    # sensor_id entero corto (nullable: puede no detectarse) y source_file como categoría
+    # (mismo valor en todas las filas), igual que en consolidar_sensores
     df["planta"] = detected_planta
-    df["sensor_id"] = meta.get("sensor_id")
-    df["source_file"] = filename
+    df["sensor_id"] = pd.Series(meta.get("sensor_id"), index=df.index, dtype="Int16")
+    df["source_file"] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), categories=[filename])
 
-    df = df.drop_duplicates(subset=["timestamp", "variable"]).reset_index(drop=True)
+    # Un solo pase de hash: si no hay duplicados (lo habitual) no se reconstruye el frame
+    dup = df.duplicated(subset=["timestamp", "variable"])
+    if dup.any():
+        df = df[~dup].reset_index(drop=True)
     df = normalize_timestamp(df, "timestamp", assume_local=True)
     
     # Columnas base siempre presentes
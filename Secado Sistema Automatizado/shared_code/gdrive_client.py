@@ -6,8 +6,9 @@ import io
 import json
 import logging
 import os
+import threading
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from google.auth.transport.requests import Request
 from google.oauth2 import credentials as user_credentials
@@ -17,11 +18,25 @@ from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 
 logger = logging.getLogger(__name__)
 
+# Escapes de literales en queries `q` de Drive, en una sola pasada: la barra invertida se
+# duplica y la comilla simple lleva barra delante (un nombre con "\" ya no rompe la query)
+_QUERY_ESCAPES = str.maketrans({"\\": "\\\\", "'": "\\'"})
+
 
 class GoogleDriveClient:
     """Cliente de Google Drive enfocado en operaciones simples por path."""
 
     SCOPES = ["https://www.googleapis.com/auth/drive"]
+    # Carpetas consultadas por request en list_files_recursive (acota el largo de la query)
+    PARENTS_PER_QUERY = 40
+    # Bytes por request de rango en iter_download_file: acota la memoria por bloque
+    # (googleapiclient usa 100 MiB por defecto, que es lo que sigue usando download_file)
+    DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+    # Por debajo de este tamaño las subidas van en un único request multipart; el protocolo
+    # resumable (POST de sesión + PUT) solo compensa para archivos grandes
+    RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+    # Proyección completa de un item para files.list (metadata devuelta por _resolve_file)
+    ITEM_FIELDS = "files(id, name, mimeType, parents, modifiedTime, size, webViewLink)"
 
     def __init__(self, config: Optional[Any] = None) -> None:
         if config is None:
@@ -34,7 +49,15 @@ class GoogleDriveClient:
         self.root_folder_id = config.get("gdrive.root_folder_id") or "root"
 
         self._credentials = None
-        self._drive_service = None
+        # Un servicio por hilo: httplib2 (transporte de googleapiclient) no es thread-safe.
+        # Cada servicio conserva su httplib2.Http, que ya mantiene la conexión keep-alive a
+        # www.googleapis.com entre requests: el conjunto de servicios por hilo es el pool
+        # (no hace falta AuthorizedSession, que googleapiclient no acepta como transporte)
+        self._local = threading.local()
+        # Cache path normalizado -> folder_id (compartido entre hilos): evita un files.list
+        # por segmento en cada resolución de un path ya visto
+        self._folder_id_cache: Dict[str, str] = {}
+        self._folder_cache_lock = threading.Lock()
 
         self._initialize_credentials()
 
@@ -139,15 +162,17 @@ class GoogleDriveClient:
             ) from e
 
     def _get_service(self):
-        if self._drive_service is None:
+        service = getattr(self._local, "service", None)
+        if service is None:
             if self._credentials is None:
                 raise RuntimeError(
                     "Credenciales no inicializadas. Llama a _initialize_credentials() primero."
                 )
-            self._drive_service = build(
+            service = build(
                 "drive", "v3", credentials=self._credentials, cache_discovery=False
             )
-        return self._drive_service
+            self._local.service = service
+        return service
 
     @staticmethod
     def _split_path(path: str) -> List[str]:
@@ -159,14 +184,39 @@ class GoogleDriveClient:
 
     @staticmethod
     def _escape(value: str) -> str:
-        return value.replace("'", "\\'")
+        return value.translate(_QUERY_ESCAPES)
+
+    @classmethod
+    def _filter_clause(
+        cls,
+        name_filter: Optional[Iterable[str]] = None,
+        mime_filter: Optional[Iterable[str]] = None,
+        mime_exclude: Optional[Iterable[str]] = None,
+    ) -> str:
+        """
+        Condición extra para `q` (vacía si no hay filtros).
+
+        El item pasa si cumple alguno de name_filter/mime_filter y no tiene ninguno de los
+        tipos de mime_exclude.
+        """
+        terms = [f"name contains '{cls._escape(name)}'" for name in (name_filter or ())]
+        terms += [f"mimeType = '{mime}'" for mime in (mime_filter or ())]
+        clause = f" and ({' or '.join(terms)})" if terms else ""
+        return clause + "".join(f" and mimeType != '{mime}'" for mime in (mime_exclude or ()))
 
     def _find_item(
         self,
         name: str,
         parent_id: str,
         mime_type: Optional[str] = None,
+        fields: str = "files(id)",
     ) -> Optional[Dict[str, Any]]:
+        """
+        Primer item con ese nombre dentro de parent_id, o None.
+
+        Por defecto solo pide el id (lo único que usan la resolución de carpetas y las
+        subidas); quien necesite metadata pasa fields=ITEM_FIELDS.
+        """
         service = self._get_service()
         conditions = [
             "trashed = false",
@@ -181,7 +231,7 @@ class GoogleDriveClient:
             .list(
                 q=query,
                 spaces="drive",
-                fields="files(id, name, mimeType, parents, modifiedTime, size, webViewLink)",
+                fields=fields,
                 pageSize=1,
             )
             .execute()
@@ -190,6 +240,8 @@ class GoogleDriveClient:
         return files[0] if files else None
 
     def _create_folder(self, name: str, parent_id: str) -> Dict[str, Any]:
+        # Sin BatchHttpRequest: el id creado se necesita enseguida para el siguiente segmento,
+        # y el resto de las mutaciones del cliente son subidas con media (que batch no admite)
         service = self._get_service()
         body = {
             "name": name,
@@ -200,20 +252,45 @@ class GoogleDriveClient:
 
     def _resolve_folder_id(self, path: str, create: bool = False) -> str:
         segments = self._split_path(path)
-        parent_id = self.root_folder_id
+        key = "/".join(segments)
+        with self._folder_cache_lock:
+            cached = self._folder_id_cache.get(key)
+            if cached is not None:
+                return cached
+            # Arrancar desde el prefijo más largo ya resuelto
+            start = len(segments)
+            while start > 0 and "/".join(segments[:start]) not in self._folder_id_cache:
+                start -= 1
+            parent_id = (
+                self._folder_id_cache["/".join(segments[:start])] if start else self.root_folder_id
+            )
 
-        for segment in segments:
+        for i in range(start, len(segments)):
+            segment = segments[i]
             existing = self._find_item(segment, parent_id, mime_type=self._folder_mime())
             if existing:
                 parent_id = existing["id"]
-                continue
+            else:
+                if not create:
+                    raise FileNotFoundError(f"No existe la carpeta '{segment}' dentro de '{path}'")
+                parent_id = self._create_folder(segment, parent_id)["id"]
+            with self._folder_cache_lock:
+                self._folder_id_cache["/".join(segments[:i + 1])] = parent_id
+        return parent_id
 
-            if not create:
-                raise FileNotFoundError(f"No existe la carpeta '{segment}' dentro de '{path}'")
+    def invalidate_folder_cache(self, prefix: Optional[str] = None) -> None:
+        """
+        Olvida folder_ids cacheados (por ejemplo tras mover, renombrar o borrar carpetas).
 
-            created = self._create_folder(segment, parent_id)
-            parent_id = created["id"]
-        return parent_id
+        Sin prefix se vacía toda la cache; con prefix solo ese path y sus subcarpetas.
+        """
+        key = "/".join(self._split_path(prefix or ""))
+        with self._folder_cache_lock:
+            if not key:
+                self._folder_id_cache.clear()
+                return
+            for cached in [k for k in self._folder_id_cache if k == key or k.startswith(key + "/")]:
+                del self._folder_id_cache[cached]
 
     def _resolve_file(self, path: str) -> Tuple[str, str, Dict[str, Any]]:
         segments = self._split_path(path)
@@ -224,7 +301,7 @@ class GoogleDriveClient:
         folder_path = "/".join(folder_segments)
         parent_id = self._resolve_folder_id(folder_path, create=False) if folder_segments else self.root_folder_id
 
-        existing = self._find_item(filename, parent_id)
+        existing = self._find_item(filename, parent_id, fields=self.ITEM_FIELDS)
         if not existing:
             raise FileNotFoundError(f"No se encontró el archivo '{path}' en Google Drive")
 
@@ -243,10 +320,32 @@ class GoogleDriveClient:
         )
         return filename, parent_id
 
-    def list_files(self, folder_path: str) -> List[Dict[str, Any]]:
-        """Lista los archivos dentro de una carpeta."""
+    def _resolve_file_for_upload(self, file_path: str) -> Tuple[str, str, Optional[str]]:
+        """
+        Resuelve (filename, parent_id, id del archivo existente o None) para una subida.
+
+        La carpeta padre sale de la cache de folder_ids; la existencia del archivo es un
+        único files.list que solo pide el id.
+        """
+        filename, parent_id = self._ensure_parent(file_path)
+        existing = self._find_item(filename, parent_id)
+        return filename, parent_id, existing["id"] if existing else None
+
+    def list_files(
+        self,
+        folder_path: str,
+        name_filter: Optional[Iterable[str]] = None,
+        mime_filter: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista los archivos dentro de una carpeta.
+
+        Si se indican name_filter ("name contains ...") o mime_filter, el filtrado se
+        hace en el servidor y solo vuelven los items que cumplen alguno de ellos.
+        """
         folder_path = folder_path.strip("/") or self.base_path
         folder_id = self._resolve_folder_id(folder_path, create=False)
+        query = f"'{folder_id}' in parents and trashed=false" + self._filter_clause(name_filter, mime_filter)
 
         service = self._get_service()
         items: List[Dict[str, Any]] = []
@@ -256,11 +355,12 @@ class GoogleDriveClient:
             result = (
                 service.files()
                 .list(
-                    q=f"'{folder_id}' in parents and trashed=false",
+                    q=query,
                     spaces="drive",
                     fields="nextPageToken, files(id, name, mimeType, size, modifiedTime, webViewLink)",
                     pageToken=page_token,
                     pageSize=1000,
+                    orderBy="name",
                 )
                 .execute()
             )
@@ -270,6 +370,104 @@ class GoogleDriveClient:
                 break
         return items
 
+    def list_files_recursive(
+        self,
+        folder_path: str,
+        skip_folders: Optional[Iterable[str]] = None,
+        name_filter: Optional[Iterable[str]] = None,
+        mime_filter: Optional[Iterable[str]] = None,
+        mime_exclude: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lista recursivamente todo el contenido de una carpeta.
+
+        Recorre el árbol por niveles consultando varios padres en cada request
+        ("'a' in parents or 'b' in parents ..."), en lugar de un files.list por carpeta.
+        Si falla un request, se registra y se omite solo el contenido de ese grupo de
+        carpetas; un error al resolver folder_path se propaga.
+
+        Args:
+            folder_path: Path completo desde la raíz de la carpeta a recorrer
+            skip_folders: Nombres de carpetas (sin distinguir mayúsculas) cuyo contenido no se lista
+            name_filter: Fragmentos de nombre ("name contains") para filtrar archivos en el servidor
+            mime_filter: Tipos MIME aceptados; las carpetas se listan siempre para poder recorrerlas
+            mime_exclude: Tipos MIME descartados en el servidor (no debe incluir el de carpeta)
+
+        Returns:
+            Items (id, name, mimeType, parents) con la clave adicional "path" (path completo
+            desde la raíz), en orden de recorrido en profundidad
+        """
+        folder_path = folder_path.strip("/") or self.base_path
+        root_id = self._resolve_folder_id(folder_path, create=False)
+        skip = {name.lower() for name in (skip_folders or ())}
+        if name_filter or mime_filter:
+            mime_filter = [*(mime_filter or ()), self._folder_mime()]
+        filter_clause = self._filter_clause(name_filter, mime_filter, mime_exclude)
+
+        service = self._get_service()
+        children: Dict[str, List[Dict[str, Any]]] = {}
+        seen = {root_id}
+        level = [root_id]
+
+        while level:
+            next_level: List[str] = []
+            for start in range(0, len(level), self.PARENTS_PER_QUERY):
+                chunk = level[start:start + self.PARENTS_PER_QUERY]
+                parents_query = " or ".join(f"'{pid}' in parents" for pid in chunk)
+                page_token: Optional[str] = None
+
+                while True:
+                    try:
+                        result = (
+                            service.files()
+                            .list(
+                                q=f"({parents_query}) and trashed=false{filter_clause}",
+                                spaces="drive",
+                                fields="nextPageToken, files(id, name, mimeType, parents)",
+                                pageToken=page_token,
+                                pageSize=1000,
+                                orderBy="name",
+                            )
+                            .execute()
+                        )
+                    except Exception:
+                        # Solo se pierde el contenido (restante) de estas carpetas; el resto
+                        # del árbol se sigue listando
+                        logger.exception(
+                            "[Drive] Error listando %d carpetas bajo '%s'; se omite su contenido",
+                            len(chunk),
+                            folder_path,
+                        )
+                        break
+                    for item in result.get("files", []):
+                        for pid in item.get("parents", []):
+                            if pid in seen:
+                                children.setdefault(pid, []).append(item)
+                        if (
+                            item.get("mimeType") == self._folder_mime()
+                            and item.get("name", "").lower() not in skip
+                            and item["id"] not in seen
+                        ):
+                            seen.add(item["id"])
+                            next_level.append(item["id"])
+                    page_token = result.get("nextPageToken")
+                    if not page_token:
+                        break
+            level = next_level
+
+        # Reconstruir paths localmente (sin más llamadas a la API)
+        items: List[Dict[str, Any]] = []
+
+        def _collect(parent_id: str, parent_path: str) -> None:
+            for item in children.pop(parent_id, []):
+                path = f"{parent_path}/{item['name']}"
+                items.append({**item, "path": path})
+                if item.get("mimeType") == self._folder_mime():
+                    _collect(item["id"], path)
+
+        _collect(root_id, folder_path)
+        return items
+
     def list_files_by_folder_id(self, folder_id: str, mime_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Lista archivos directamente por folder ID (más eficiente).
@@ -310,31 +508,61 @@ class GoogleDriveClient:
         logger.info(f"[Drive] Encontrados {len(items)} archivos en folder {folder_id}")
         return items
 
-    def download_file(self, file_path: str, file_id: Optional[str] = None) -> bytes:
+    def iter_download_file(
+        self,
+        file_path: str,
+        file_id: Optional[str] = None,
+        chunksize: Optional[int] = DOWNLOAD_CHUNK_SIZE,
+    ) -> Iterator[bytes]:
         """
-        Descarga un archivo y devuelve su contenido en bytes.
-        
+        Descarga un archivo en bloques, devolviendo cada bloque apenas llega.
+
+        El buffer intermedio se vacía tras cada bloque, así que en memoria queda a lo sumo
+        un bloque en lugar del archivo completo.
+
         Args:
             file_path: Path completo desde la raíz (ej: "Secado_Arroz/JPV/raw/sensor_1/archivo.txt")
             file_id: ID del archivo en Google Drive (opcional, más eficiente si está disponible)
+            chunksize: Bytes por request de rango (None = default de googleapiclient)
         """
         if file_id:
             fid = file_id
         else:
             fid, _, _ = self._resolve_file(file_path)
-        
+
         service = self._get_service()
         request = service.files().get_media(fileId=fid)
         buffer = io.BytesIO()
-        downloader = MediaIoBaseDownload(buffer, request)
+        if chunksize:
+            downloader = MediaIoBaseDownload(buffer, request, chunksize=chunksize)
+        else:
+            downloader = MediaIoBaseDownload(buffer, request)
 
         done = False
         while not done:
             status, done = downloader.next_chunk()
             if status:
                 logger.debug("Descarga %.2f%%", status.progress() * 100)
+            chunk = buffer.getvalue()
+            if chunk:
+                yield chunk
+                buffer.seek(0)
+                buffer.truncate()
+
+    def download_file(self, file_path: str, file_id: Optional[str] = None) -> bytes:
+        """
+        Descarga un archivo y devuelve su contenido en bytes.
+        
+        Args:
+            file_path: Path completo desde la raíz (ej: "Secado_Arroz/JPV/raw/sensor_1/archivo.txt")
+            file_id: ID del archivo en Google Drive (opcional, más eficiente si está disponible)
+        """
+        # Todo en memoria de todos modos: bloques grandes (default de la librería), menos requests
+        return b"".join(self.iter_download_file(file_path, file_id=file_id, chunksize=None))
 
-        return buffer.getvalue()
+    def _media(self, content: bytes, mime_type: str) -> MediaIoBaseUpload:
+        resumable = len(content) > self.RESUMABLE_UPLOAD_THRESHOLD
+        return MediaIoBaseUpload(io.BytesIO(content), mimetype=mime_type, resumable=resumable)
 
     def upload_file(
         self,
@@ -343,18 +571,17 @@ class GoogleDriveClient:
         mime_type: str = "text/csv",
     ) -> Dict[str, Any]:
         """Sube (o actualiza) un archivo a Google Drive."""
-        filename, parent_id = self._ensure_parent(file_path)
+        filename, parent_id, existing_id = self._resolve_file_for_upload(file_path)
         service = self._get_service()
 
-        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mime_type, resumable=False)
+        media = self._media(content, mime_type)
         file_metadata = {"name": filename, "parents": [parent_id]}
 
-        existing = self._find_item(filename, parent_id)
-        if existing:
+        if existing_id:
             result = (
                 service.files()
                 .update(
-                    fileId=existing["id"],
+                    fileId=existing_id,
                     media_body=media,
                     fields="id, name, mimeType, size, modifiedTime, webViewLink",
                 )
@@ -381,8 +608,15 @@ class GoogleDriveClient:
         file_name: str,
         content: bytes,
         mime_type: str = "text/csv",
+        replace_existing: bool = False,
     ) -> Dict[str, Any]:
-        """Sube archivo directamente a carpeta compartida usando folder_id."""
+        """
+        Sube archivo directamente a carpeta compartida usando folder_id.
+
+        Con replace_existing=True, si ya hay un archivo con ese nombre en la carpeta se
+        actualiza su contenido (un files.list extra que solo pide el id) en lugar de crear
+        un duplicado.
+        """
         service = self._get_service()
 
         file_metadata = {
@@ -390,18 +624,27 @@ class GoogleDriveClient:
             "parents": [folder_id],
         }
 
-        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mime_type, resumable=True)
+        media = self._media(content, mime_type)
 
         try:
-            file = (
-                service.files()
-                .create(
+            existing = (
+                self._find_item(file_name, folder_id)
+                if replace_existing
+                else None
+            )
+            if existing:
+                request = service.files().update(
+                    fileId=existing["id"],
+                    media_body=media,
+                    fields="id, name, mimeType, size, modifiedTime, webViewLink",
+                )
+            else:
+                request = service.files().create(
                     body=file_metadata,
                     media_body=media,
                     fields="id, name, mimeType, size, modifiedTime, webViewLink",
                 )
-                .execute()
-            )
+            file = request.execute()
 
             logger.info(
                 "[Drive] ✓ Archivo subido: %s (ID: %s) a folder %s",
@@ -1,15 +1,40 @@
+import hashlib
 import io
 import logging
+import threading
 import unicodedata
 import re
+from collections import OrderedDict
 from typing import Optional, Dict, Any
 
 import numpy as np
 import pandas as pd
 from shared_code.time_utils import normalize_timestamp
 
+try:
+    import python_calamine  # noqa: F401
+    # engine="calamine" existe desde pandas 2.2; en versiones anteriores sigue openpyxl
+    _EXCEL_ENGINE = "calamine" if tuple(map(int, pd.__version__.split(".")[:2])) >= (2, 2) else None
+except ImportError:  # sin calamine, pandas usa openpyxl
+    _EXCEL_ENGINE = None
+
 logger = logging.getLogger(__name__)
 
+_LAB_VALUE_COLS = ("Variedad", "ID_tachada", "HumedadInicial", "HumedadFinal")
+
+_RE_WS = re.compile(r"\s+")
+_RE_DIGITS = re.compile(r"(\d+)")
+_DROP_PERCENT = str.maketrans("", "", "%")
+
+# Marca en DataFrame.attrs: sus columnas de fecha ya pasaron por normalize_timestamp(assume_local=True)
+_NORMALIZED_TZ_ATTR = "_normalized_tz"
+
+# Archivos de laboratorio ya parseados, por (hash del contenido, año, planta): el mismo Excel se
+# carga varias veces por corrida (cruces por sensor, backfills) y su parseo es lo más caro
+_LAB_CACHE_MAXSIZE = 32
+_lab_cache: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+_lab_cache_lock = threading.Lock()
+
 
 def normalize_id(x: Any) -> Optional[str]:
     """
@@ -42,7 +67,77 @@ def normalize_id(x: Any) -> Optional[str]:
     return s
 
 
+def _normalize_column_name(col_name: Any) -> str:
+    """Normaliza nombre de columna para búsqueda robusta: minúsculas, sin tildes, sin %, espacios simples."""
+    if pd.isna(col_name):
+        return ""
+    s = str(col_name).strip()
+    # Quitar tildes
+    s = unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('ascii')
+    # A minúsculas y sin %
+    s = s.lower().translate(_DROP_PERCENT)
+    # Normalizar espacios (múltiples espacios a uno solo)
+    return _RE_WS.sub(' ', s).strip()
+
+
+def _to_number(s: pd.Series) -> pd.Series:
+    """Columna numérica float; acepta coma decimal en celdas de texto."""
+    # Celdas ya numéricas en el Excel: sin pasar por strings
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype(float)
+    # Normalizar valores: convertir a string, reemplazar coma por punto, strip
+    return pd.to_numeric(s.astype(str).str.replace(",", ".", regex=False).str.strip(), errors="coerce")
+
+
+def normalize_id_series(s: pd.Series) -> pd.Series:
+    """
+    Vectorized normalize_id for a whole column, dispatching on its dtype.
+
+    Numeric columns and object columns holding only numbers or only strings are
+    converted with numpy/str ops; any other mix falls back to normalize_id per cell.
+    """
+    kind = "numeric" if pd.api.types.is_numeric_dtype(s) else pd.api.types.infer_dtype(s, skipna=True)
+    out = np.full(len(s), None, dtype=object)
+
+    if kind in ("numeric", "integer", "floating", "mixed-integer-float", "empty"):
+        vals = s.to_numpy(dtype="float64", na_value=np.nan)
+        present = ~np.isnan(vals)
+        # 12.0 -> '12', 12.5 -> '12.5'
+        integral = present & np.isfinite(vals) & (vals == np.trunc(vals))
+        out[integral] = vals[integral].astype(np.int64).astype(str)
+        other = present & ~integral
+        out[other] = vals[other].astype(str)
+    elif kind == "string":
+        stripped = s.str.strip()
+        keep = s.notna().to_numpy() & ~stripped.str.lower().isin(["", "nan", "none"]).to_numpy()
+        out[keep] = stripped.to_numpy(dtype=object)[keep]
+    else:
+        return s.map(normalize_id)
+    return pd.Series(out, index=s.index, name=s.name)
+
+
 def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.DataFrame:
+    """
+    Load and normalize a "Control Tachadas" Excel file (see _parse_lab_control_file).
+
+    Results are cached by content hash, year and planta; each call returns its own copy.
+    """
+    key = (hashlib.blake2b(file_content, digest_size=16).digest(), year, planta)
+    with _lab_cache_lock:
+        cached = _lab_cache.get(key)
+        if cached is not None:
+            _lab_cache.move_to_end(key)
+            return cached.copy()
+
+    result = _parse_lab_control_file(file_content, year, planta)
+    with _lab_cache_lock:
+        _lab_cache[key] = result.copy()
+        while len(_lab_cache) > _LAB_CACHE_MAXSIZE:
+            _lab_cache.popitem(last=False)
+    return result
+
+
+def _parse_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.DataFrame:
     """
     Load and normalize a "Control Tachadas" Excel file.
 
@@ -54,9 +149,9 @@ def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.Dat
     Returns a clean DataFrame suitable for interval joins.
     """
     expected = {"variedad", "identificador", "inicio", "fin", "sensor", "humedad"}
+    # Una sola lectura del libro: la fila de encabezados se detecta sobre la hoja cruda
     with io.BytesIO(file_content) as bio:
-        xls = pd.ExcelFile(bio)
-        df_raw = pd.read_excel(xls, sheet_name=0, header=None)
+        df_raw = pd.read_excel(bio, sheet_name=0, header=None, engine=_EXCEL_ENGINE)
 
     header_row = None
     for i in range(min(20, len(df_raw))):
@@ -67,8 +162,20 @@ def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.Dat
     if header_row is None:
         header_row = 0
 
-    with io.BytesIO(file_content) as bio2:
-        df = pd.read_excel(bio2, sheet_name=0, header=header_row)
+    # Nombres como los asignaría read_excel(header=...): "Unnamed: i" para vacíos y sufijo .N en duplicados
+    names, seen = [], {}
+    for i, name in enumerate(df_raw.iloc[header_row].tolist()):
+        name = f"Unnamed: {i}" if pd.isna(name) else name
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    df = df_raw.iloc[header_row + 1:].reset_index(drop=True)
+    df.columns = names
+    # Sin encabezado en la lectura, las columnas quedan object: recuperar los dtypes de datos
+    df = df.infer_objects()
 
     # Normalize column names
     cols = {c: str(c).strip() for c in df.columns}
@@ -87,42 +194,20 @@ def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.Dat
     col_fin = pick("Fin")
     col_sensor = pick("Sensor", "sensor_id")
     
-    # Detección robusta de columnas de humedad inicial y final
-    # Normalizar nombre de columna: minúsculas, sin tildes, sin %, sin espacios extras
-    def normalize_column_name(col_name: str) -> str:
-        """Normaliza nombre de columna para búsqueda robusta."""
-        if pd.isna(col_name):
-            return ""
-        s = str(col_name).strip()
-        # Quitar tildes
-        s = unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('ascii')
-        # A minúsculas
-        s = s.lower()
-        # Quitar %
-        s = s.replace("%", "")
-        # Normalizar espacios (múltiples espacios a uno solo)
-        s = re.sub(r'\s+', ' ', s).strip()
-        return s
-    
-    col_humedad_inicial = None
-    col_humedad_final = None
-    
-    # Recorrer todas las columnas y detectar por contenido
+    # Detección robusta de columnas de humedad inicial y final: nombres normalizados una sola vez
+    # (la primera columna gana si dos normalizan igual)
+    norm_map: Dict[str, Any] = {}
     for col in df.columns:
-        normalized = normalize_column_name(col)
-        
-        # Detectar humedad inicial: debe contener "humedad" Y ("inicio" o "inicial")
-        if "humedad" in normalized:
-            if "inicio" in normalized or "inicial" in normalized:
-                if col_humedad_inicial is None:  # Usar la primera que coincida
-                    col_humedad_inicial = col
-                    logger.debug(f"Columna de humedad inicial detectada: '{col}' (normalizada: '{normalized}')")
-        
-        # Detectar humedad final: debe contener "humedad" Y "final"
-        if "humedad" in normalized and "final" in normalized:
-            if col_humedad_final is None:  # Usar la primera que coincida
-                col_humedad_final = col
-                logger.debug(f"Columna de humedad final detectada: '{col}' (normalizada: '{normalized}')")
+        norm_map.setdefault(_normalize_column_name(col), col)
+
+    # Humedad inicial: "humedad" Y ("inicio" o "inicial"); humedad final: "humedad" Y "final"
+    humedad_cols = [(k, c) for k, c in norm_map.items() if "humedad" in k]
+    col_humedad_inicial = next((c for k, c in humedad_cols if "inicio" in k or "inicial" in k), None)
+    col_humedad_final = next((c for k, c in humedad_cols if "final" in k), None)
+    if col_humedad_inicial is not None:
+        logger.debug(f"Columna de humedad inicial detectada: '{col_humedad_inicial}'")
+    if col_humedad_final is not None:
+        logger.debug(f"Columna de humedad final detectada: '{col_humedad_final}'")
 
     result = pd.DataFrame()
     if col_var is not None:
@@ -130,8 +215,7 @@ def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.Dat
     else:
         result["Variedad"] = None
 
-    result["ID_tachada"] = df[col_id] if col_id is not None else None
-    result["ID_tachada"] = result["ID_tachada"].map(normalize_id)
+    result["ID_tachada"] = normalize_id_series(df[col_id]) if col_id is not None else None
 
     ini = pd.to_datetime(df[col_ini], errors="coerce", dayfirst=True) if col_ini is not None else pd.NaT
     fin = pd.to_datetime(df[col_fin], errors="coerce", dayfirst=True) if col_fin is not None else pd.NaT
@@ -144,24 +228,24 @@ def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.Dat
     # Sensor id normalization (keep ints)
     if col_sensor is not None:
         sid = df[col_sensor]
-        # Accept both SENSOR10 style and bare numbers
-        sid_norm = sid.astype(str).str.extract(r"(\d+)", expand=False)
-        result["sensor_id"] = pd.to_numeric(sid_norm, errors="coerce").astype("Int64")
+        if pd.api.types.is_integer_dtype(sid):
+            # Columna de números puros: no hace falta extraer dígitos
+            result["sensor_id"] = sid.astype("Int64")
+        else:
+            # Accept both SENSOR10 style and bare numbers
+            sid_norm = sid.astype(str).str.extract(_RE_DIGITS, expand=False)
+            result["sensor_id"] = pd.to_numeric(sid_norm, errors="coerce").astype("Int64")
     else:
         result["sensor_id"] = pd.Series([pd.NA] * len(df), dtype="Int64")
 
     # Asignar columnas de humedad inicial y final con normalización
     if col_humedad_inicial is not None:
-        # Normalizar valores: convertir a string, reemplazar coma por punto, strip
-        s = df[col_humedad_inicial].astype(str).str.replace(",", ".", regex=False).str.strip()
-        result["HumedadInicial"] = pd.to_numeric(s, errors="coerce")
+        result["HumedadInicial"] = _to_number(df[col_humedad_inicial])
     else:
         result["HumedadInicial"] = None
     
     if col_humedad_final is not None:
-        # Normalizar valores: convertir a string, reemplazar coma por punto, strip
-        s = df[col_humedad_final].astype(str).str.replace(",", ".", regex=False).str.strip()
-        result["HumedadFinal"] = pd.to_numeric(s, errors="coerce")
+        result["HumedadFinal"] = _to_number(df[col_humedad_final])
     else:
         result["HumedadFinal"] = None
     
@@ -178,9 +262,77 @@ def load_lab_control_file(file_content: bytes, year: int, planta: str) -> pd.Dat
     # Clean invalid rows: require Inicio and Fin present and Inicio <= Fin
     valid = result["Inicio"].notna() & result["Fin"].notna() & (result["Inicio"] <= result["Fin"])
     result = result[valid].reset_index(drop=True)
+    # Inicio/Fin ya quedaron en hora local naive: cross_with_lab no los vuelve a normalizar
+    result.attrs[_NORMALIZED_TZ_ATTR] = True
     return result
 
 
+def _as_ns(values: np.ndarray) -> np.ndarray:
+    """Vista int64 (nanosegundos) de un array de fechas naive."""
+    return np.asarray(values, dtype="datetime64[ns]").view("i8")
+
+
+def _assign_lab_values(sdf: pd.DataFrame, L: pd.DataFrame, pos: np.ndarray) -> int:
+    """
+    Agrega a sdf las columnas de laboratorio de la fila pos de L (pos -1 = sin match); devuelve matches.
+
+    Cada columna se arma como array nuevo y se asigna entera: sdf es una copia superficial del
+    DataFrame del llamador y escribir in place (iloc) modificaría sus datos.
+    """
+    mask = pos >= 0
+    rows = np.flatnonzero(mask)
+    picked = pos[mask]
+    for col in _LAB_VALUE_COLS:
+        humedad = col in ("HumedadInicial", "HumedadFinal")
+        if humedad and col in sdf.columns:
+            out = sdf[col].to_numpy(copy=True)
+        else:
+            out = np.full(len(sdf), None, dtype=object)
+        # Las humedades sólo se asignan si el lab trae algún valor (si no, se conserva lo del sensor)
+        if len(rows) and col in L.columns and not (humedad and L[col].isna().all()):
+            out[rows] = L[col].values[picked]
+        sdf[col] = out
+    return len(rows)
+
+
+def _interval_positions(
+    t: np.ndarray,
+    row_codes: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    lab_codes: np.ndarray,
+) -> np.ndarray:
+    """
+    Interval join vectorizado: posición del intervalo de laboratorio que contiene cada fila, o -1.
+
+    El laboratorio debe venir ordenado por (código de sensor, Inicio). Cada timestamp se asigna
+    al último intervalo de su mismo sensor con Inicio <= t, siempre que t <= Fin. Filas con
+    código -1 (sensor ausente en el laboratorio) nunca hacen match.
+    """
+    if len(starts) == 0:
+        return np.full(len(t), -1)
+    # Comparar nanosegundos int64 en lugar de datetime64 (NaT queda como el mínimo int64 y nunca
+    # cumple t >= Inicio de un intervalo válido ni Fin >= t)
+    t, starts, ends = _as_ns(t), _as_ns(starts), _as_ns(ends)
+    # Clave compuesta (código, rango de Inicio) con un único searchsorted global. Se usa el rango
+    # denso de Inicio en lugar de los nanosegundos para que código * ancho nunca desborde int64.
+    uniq_starts = np.unique(starts)
+    width = len(uniq_starts) + 1
+    lab_key = lab_codes * width + np.searchsorted(uniq_starts, starts, side="right")
+    row_key = row_codes * width + np.searchsorted(uniq_starts, t, side="right")
+    pos = np.searchsorted(lab_key, row_key, side="right") - 1
+    # Indexación segura con np.clip; luego verificar mismo sensor y t dentro de [Inicio, Fin].
+    # La máscara se acumula in place sobre dos buffers bool (sin un temporal por condición)
+    pos_c = np.clip(pos, 0, len(lab_key) - 1)
+    valid = pos >= 0
+    cond = np.empty_like(valid)
+    np.logical_and(valid, np.equal(lab_codes[pos_c], row_codes, out=cond), out=valid)
+    np.logical_and(valid, np.greater_equal(t, starts[pos_c], out=cond), out=valid)
+    np.logical_and(valid, np.less_equal(t, ends[pos_c], out=cond), out=valid)
+    np.copyto(pos, -1, where=np.logical_not(valid, out=cond))
+    return pos
+
+
 def cross_with_lab(
     sensor_df: pd.DataFrame,
     lab_df: pd.DataFrame,
@@ -193,6 +345,9 @@ def cross_with_lab(
     - If False, matches only by time interval (uses all lab intervals).
     - Adds columns: Variedad, ID_tachada, HumedadInicial, HumedadFinal.
     - Assumes timestamps are timezone-aware UTC; converts if needed.
+    - Frames flagged with attrs["_normalized_tz"] skip that conversion: lab frames from
+      load_lab_control_file (Inicio/Fin) and sensor frames returned by this function
+      (timestamp) already hold naive local time.
     """
     if sensor_df.empty or lab_df.empty:
         return sensor_df.assign(
@@ -202,20 +357,23 @@ def cross_with_lab(
             HumedadFinal=None
         )
 
-    sdf = sensor_df.copy()
+    # Copia superficial: sólo se agregan o reemplazan columnas enteras, nunca se escribe in place
+    sdf = sensor_df.copy(deep=False)
     # IMPORTANTE: Preservar todas las columnas originales del sensor_df
     # cross_with_lab() solo debe agregar columnas de laboratorio, no filtrar ni perder columnas
     
-    # Normalizar timestamps del sensor a UTC-3 (naive)
-    timestamp_before = sdf["timestamp"].notna().sum()
-    sdf = normalize_timestamp(sdf, "timestamp", assume_local=True)
-    timestamp_after = sdf["timestamp"].notna().sum()
-    if timestamp_after < timestamp_before:
-        logger.warning(
-            "cross_with_lab: %d timestamps se convirtieron a NaN durante normalización. Total filas: %d",
-            timestamp_before - timestamp_after,
-            len(sdf),
-        )
+    # Normalizar timestamps del sensor a UTC-3 (naive), salvo que ya vengan normalizados
+    if not sdf.attrs.get(_NORMALIZED_TZ_ATTR):
+        timestamp_before = sdf["timestamp"].notna().sum()
+        sdf = normalize_timestamp(sdf, "timestamp", assume_local=True)
+        timestamp_after = sdf["timestamp"].notna().sum()
+        if timestamp_after < timestamp_before:
+            logger.warning(
+                "cross_with_lab: %d timestamps se convirtieron a NaN durante normalización. Total filas: %d",
+                timestamp_before - timestamp_after,
+                len(sdf),
+            )
+        sdf.attrs[_NORMALIZED_TZ_ATTR] = True
     
     # ACCIÓN 2: Redondear timestamp del sensor a segundos (eliminar milisegundos)
     # El laboratorio suele registrar al segundo, mientras que el sensor puede tener milisegundos
@@ -233,10 +391,11 @@ def cross_with_lab(
             HumedadFinal=None
         )
 
-    ldf = lab_df.copy()
-    # Normalizar timestamps del laboratorio asumiendo hora local (UTC-3) para consistencia con sensores
-    ldf = normalize_timestamp(ldf, "Inicio", assume_local=True)
-    ldf = normalize_timestamp(ldf, "Fin", assume_local=True)
+    ldf = lab_df
+    if not ldf.attrs.get(_NORMALIZED_TZ_ATTR):
+        # Normalizar timestamps del laboratorio asumiendo hora local (UTC-3) para consistencia con sensores
+        ldf = normalize_timestamp(lab_df.copy(), "Inicio", assume_local=True)
+        ldf = normalize_timestamp(ldf, "Fin", assume_local=True)
     
     # Log para verificar columnas en lab después de normalización
     logger.info(f"[LAB] Columnas lab después de normalización: {list(ldf.columns)}")
@@ -246,45 +405,19 @@ def cross_with_lab(
         logger.debug(f"   Rango timestamps sensores: {sdf['timestamp_seg'].min()} a {sdf['timestamp_seg'].max()}")
         logger.debug(f"   Rango fechas laboratorio: {ldf['Inicio'].min()} a {ldf['Fin'].max()}")
 
-    # Prepare output columns - asegurar que siempre estén presentes
-    sdf["Variedad"] = None
-    sdf["ID_tachada"] = None
-    for col in ["HumedadInicial", "HumedadFinal"]:
-        if col not in sdf.columns:
-            sdf[col] = None
-
+    # _assign_lab_values agrega siempre Variedad, ID_tachada, HumedadInicial y HumedadFinal
     if not require_sensor_match:
-        # Modo time-only: usar timestamp redondeado a segundos
-        L = ldf.sort_values("Inicio")
-        starts = L["Inicio"].values
-        ends = L["Fin"].values
-        t = sdf["timestamp_seg"].values  # USAR timestamp_seg (redondeado a segundos)
-        pos = np.searchsorted(starts, t, side="right") - 1
-        # Asegurar que pos sea válido antes de indexar
-        valid_pos = (pos >= 0) & (pos < len(ends))
-        # Verificar que timestamp esté dentro del intervalo [Inicio, Fin]
-        if len(starts) > 0 and len(ends) > 0:
-            # Usar indexación condicional para evitar errores
-            starts_at_pos = starts[np.clip(pos, 0, len(starts)-1)]
-            ends_at_pos = ends[np.clip(pos, 0, len(ends)-1)]
-            valid = valid_pos & (t >= starts_at_pos) & (t <= ends_at_pos)
-        else:
-            valid = np.zeros(len(t), dtype=bool)
-        matched = pd.Series(pos, index=sdf.index)
-        matched = matched.where(valid, other=-1)
-        mask = matched >= 0
-        if mask.any():
-            matched_indices = matched[mask].astype(int)
-            sdf.loc[mask, "Variedad"] = L["Variedad"].values[matched_indices]
-            sdf.loc[mask, "ID_tachada"] = L["ID_tachada"].values[matched_indices]
-            if "HumedadInicial" in L.columns and L["HumedadInicial"].notna().any():
-                sdf.loc[mask, "HumedadInicial"] = (
-                    L["HumedadInicial"].reset_index(drop=True).iloc[matched_indices].values
-                )
-            if "HumedadFinal" in L.columns and L["HumedadFinal"].notna().any():
-                sdf.loc[mask, "HumedadFinal"] = (
-                    L["HumedadFinal"].reset_index(drop=True).iloc[matched_indices].values
-                )
+        # Modo time-only: todos los intervalos comparten un mismo código
+        L = ldf[ldf["Inicio"].notna()].sort_values("Inicio")
+        pos = _interval_positions(
+            sdf["timestamp_seg"].values,  # USAR timestamp_seg (redondeado a segundos)
+            np.zeros(len(sdf), dtype=np.int64),
+            L["Inicio"].values,
+            L["Fin"].values,
+            np.zeros(len(L), dtype=np.int64),
+        )
+        mask = pos >= 0
+        _assign_lab_values(sdf, L, pos)
 
         unmatched = (~mask).sum()
         if unmatched:
@@ -292,73 +425,33 @@ def cross_with_lab(
         return sdf
 
     # Sensor-aware join
-    total_unmatched = 0
-    total_matched = 0
-    
     logger.info(f"📋 Cruce laboratorio: {len(sdf)} registros de sensores, {len(ldf)} tachadas en lab")
     logger.info(f"   Sensores en datos: {sorted(sdf['sensor_id'].dropna().unique())}")
     logger.info(f"   Sensores en lab: {sorted(ldf['sensor_id'].dropna().unique())}")
     if not ldf.empty:
         logger.info(f"   Rango fechas lab: {ldf['Inicio'].min()} a {ldf['Fin'].max()}")
     
-    for sid, sub in sdf.groupby("sensor_id", dropna=False):
-        if pd.isna(sid):
-            # Skip rows with missing sensor_id
-            total_unmatched += len(sub)
-            continue
-        lid = ldf[ldf["sensor_id"] == sid]
-        if lid.empty:
-            total_unmatched += len(sub)
-            logger.debug(f"   Sensor {sid}: Sin tachadas en lab ({len(sub)} registros sin match)")
-            continue
-        L = lid.sort_values("Inicio")
-        
-        # Logs cuando existan columnas HumedadInicial / Final
-        if "HumedadInicial" in L.columns:
-            logger.debug(f"   HumedadInicial disponibles en lab: {L['HumedadInicial'].dropna().unique()[:5].tolist()}")
-        if "HumedadFinal" in L.columns:
-            logger.debug(f"   HumedadFinal disponibles en lab: {L['HumedadFinal'].dropna().unique()[:5].tolist()}")
-        
-        starts = L["Inicio"].values
-        ends = L["Fin"].values
-        # ACCIÓN 3: Usar timestamp_seg (redondeado a segundos) en lugar de timestamp original
-        t = sub["timestamp_seg"].values  # USAR timestamp_seg para el cruce
-        
-        # Lógica de interval join mejorada:
-        # 1. Encontrar la posición del último intervalo donde starts <= t
-        pos = np.searchsorted(starts, t, side="right") - 1
-        # 2. Verificar que pos sea válido (>= 0 y < len(ends))
-        valid_pos = (pos >= 0) & (pos < len(ends))
-        # 3. Verificar que el timestamp esté dentro del intervalo [Inicio, Fin]
-        #    t debe ser >= Inicio[pos] Y <= Fin[pos]
-        if len(starts) > 0 and len(ends) > 0:
-            # Usar indexación segura con np.clip para evitar errores de índice
-            starts_at_pos = starts[np.clip(pos, 0, len(starts)-1)]
-            ends_at_pos = ends[np.clip(pos, 0, len(ends)-1)]
-            # Comparar timestamps (asegurar que sean comparables)
-            valid = valid_pos & (t >= starts_at_pos) & (t <= ends_at_pos)
-        else:
-            valid = np.zeros(len(t), dtype=bool)
-
-        idx = sub.index
-        matched = pd.Series(pos, index=idx)
-        matched = matched.where(valid, other=-1)
-        mask = matched >= 0
-        if mask.any():
-            matched_indices = matched[mask].astype(int)
-            sdf.loc[idx[mask], "Variedad"] = L["Variedad"].values[matched_indices]
-            sdf.loc[idx[mask], "ID_tachada"] = L["ID_tachada"].values[matched_indices]
-            if "HumedadInicial" in L.columns and L["HumedadInicial"].notna().any():
-                sdf.loc[idx[mask], "HumedadInicial"] = (
-                    L["HumedadInicial"].reset_index(drop=True).iloc[matched_indices].values
-                )
-            if "HumedadFinal" in L.columns and L["HumedadFinal"].notna().any():
-                sdf.loc[idx[mask], "HumedadFinal"] = (
-                    L["HumedadFinal"].reset_index(drop=True).iloc[matched_indices].values
-                )
-            total_matched += mask.sum()
-            logger.debug(f"   Sensor {sid}: {mask.sum()}/{len(sub)} registros matched")
-        total_unmatched += (~mask).sum()
+    # Un único cruce global: laboratorio ordenado por (sensor_id, Inicio) y cada fila de sensor
+    # buscada dentro del tramo de su sensor, sin bucle Python por grupo
+    L = ldf[ldf["sensor_id"].notna() & ldf["Inicio"].notna()].sort_values(["sensor_id", "Inicio"])
+    lab_sid = L["sensor_id"].to_numpy(dtype="float64", na_value=np.nan)
+    uniq_sid, lab_codes = np.unique(lab_sid, return_inverse=True)
+    row_sid = sdf["sensor_id"].to_numpy(dtype="float64", na_value=np.nan)
+    row_codes = np.clip(np.searchsorted(uniq_sid, row_sid), 0, max(len(uniq_sid) - 1, 0))
+    if len(uniq_sid):
+        # NaN != NaN: filas sin sensor_id quedan fuera igual que sensores sin tachadas
+        row_codes = np.where(uniq_sid[row_codes] == row_sid, row_codes, -1)
+    else:
+        row_codes = np.full(len(sdf), -1)
+
+    pos = _interval_positions(
+        sdf["timestamp_seg"].values, row_codes, L["Inicio"].values, L["Fin"].values, lab_codes
+    )
+    total_unmatched = len(sdf) - _assign_lab_values(sdf, L, pos)
+    if logger.isEnabledFor(logging.DEBUG):
+        per_sensor = pd.Series(pos >= 0).groupby(row_sid, dropna=False).agg(["sum", "size"])
+        for sid, (n_matched, n_rows) in per_sensor.iterrows():
+            logger.debug(f"   Sensor {sid}: {n_matched}/{n_rows} registros matched")
 
     matched_count = sdf["Variedad"].notna().sum()
     logger.info(f"✅ Cruce laboratorio completado: {matched_count}/{len(sdf)} registros matched ({matched_count/len(sdf)*100:.1f}%)")
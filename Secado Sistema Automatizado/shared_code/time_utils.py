@@ -5,6 +5,7 @@ Utilidades para normalizar timestamps a la zona horaria de Uruguay.
 import logging
 from typing import Optional
 
+import numpy as np
 import pandas as pd
 import pytz
 
@@ -28,20 +29,28 @@ def normalize_timestamp(
     if col not in df.columns:
         return df
 
-    try:
-        ts = pd.to_datetime(df[col], errors="coerce")
-    except Exception as exc:
-        logger.warning("normalize_timestamp: No se pudo parsear %s: %s", col, exc)
-        return df
+    ts = df[col]
+    if isinstance(ts.dtype, np.dtype) and ts.dtype.kind == "M":
+        # Camino rápido: ya es datetime64 naive (lo que producen los lectores de sensores),
+        # no hace falta re-parsear ni inspeccionar la zona horaria
+        if not assume_local:
+            return df
+        tzinfo = None
+    else:
+        try:
+            ts = pd.to_datetime(ts, errors="coerce")
+        except Exception as exc:
+            logger.warning("normalize_timestamp: No se pudo parsear %s: %s", col, exc)
+            return df
 
-    df[col] = ts
-    if ts.isna().all():
-        return df
+        df[col] = ts
+        if ts.isna().all():
+            return df
 
-    try:
-        tzinfo: Optional[pytz.BaseTzInfo] = ts.dt.tz  # type: ignore[attr-defined]
-    except AttributeError:
-        tzinfo = None
+        try:
+            tzinfo: Optional[pytz.BaseTzInfo] = ts.dt.tz  # type: ignore[attr-defined]
+        except AttributeError:
+            tzinfo = None
 
     try:
         if tzinfo is not None: